@@ -6,6 +6,7 @@ import random
 import serial
 import requests
 import json
+from ticket_allocator import get_allocator
 
 # Setup logging
 logging.basicConfig(
@@ -28,7 +29,7 @@ class ParkingButton:
         self.terminal = terminal
         self.api = terminal.api if terminal else None
         self.printer_name = win32print.GetDefaultPrinter()
-        self.offline_counter = self._load_counter()
+        self.ticket_numbers = get_allocator()
         self.running = False
         self.arduino = None
         self._try_connect_arduino()
@@ -53,19 +54,6 @@ class ParkingButton:
         """Randomly determine vehicle type (70% motorcycle, 30% car)"""
         return "Motor" if random.random() < 0.7 else "Mobil"
         
-    def _load_counter(self):
-        """Load offline counter from file"""
-        try:
-            with open('counter.txt', 'r') as f:
-                return int(f.read().strip())
-        except:
-            return 1
-            
-    def _save_counter(self):
-        """Save offline counter to file"""
-        with open('counter.txt', 'w') as f:
-            f.write(str(self.offline_counter))
-            
     def _try_server_connection(self):
         """Test connection to parking server"""
         try:
@@ -197,15 +185,13 @@ class ParkingButton:
             offline_data = {
                 'plat': plate_number,
                 'jenis': vehicle_type,
-                'tiket': f"OFF{self.offline_counter:06d}",
+                'tiket': self.ticket_numbers.next_ticket_number(),
                 'waktu_masuk': current_time
             }
             
             if self._print_ticket(offline_data, is_offline=True):
                 print(f"✅ [OFFLINE] Kendaraan {plate_number} berhasil masuk")
                 print(f"✅ Tiket dicetak: {offline_data['tiket']}")
-                self.offline_counter += 1
-                self._save_counter()
             else:
                 print(f"❌ Gagal mencetak tiket offline")
                 
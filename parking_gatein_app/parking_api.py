@@ -4,6 +4,7 @@ from datetime import datetime
 import logging
 from dotenv import load_dotenv
 import os
+from ticket_allocator import get_allocator
 
 # Setup logging
 logging.basicConfig(
@@ -20,6 +21,7 @@ class ParkingAPI:
     def __init__(self):
         """Initialize API client"""
         self.base_url = "http://192.168.2.6:5051"
+        self.ticket_numbers = get_allocator()
         
     def test_connection(self):
         """Test connection to API server"""
@@ -106,21 +108,8 @@ class ParkingAPI:
     def _handle_offline_entry(self, plate_number, vehicle_type):
         """Handle vehicle entry in offline mode"""
         try:
-            # Generate offline ticket number
-            counter_file = "counter.txt"
-            counter = 1
-            
-            if os.path.exists(counter_file):
-                with open(counter_file, "r") as f:
-                    counter = int(f.read().strip())
-            
-            # Format: OFF0001, OFF0002, etc.
-            ticket_number = f"OFF{counter:04d}"
-            
-            # Increment counter and save
-            counter = (counter % 9999) + 1  # Reset at 9999
-            with open(counter_file, "w") as f:
-                f.write(str(counter))
+            # Ticket number from the block leased to this terminal
+            ticket_number = self.ticket_numbers.next_ticket_number()
             
             # Return offline ticket data
             return True, {
@@ -4,6 +4,7 @@ import time
 import os
 from datetime import datetime
 import logging
+from ticket_allocator import get_allocator
 
 # Setup logging
 logging.basicConfig(
@@ -18,7 +19,6 @@ class ParkingCamera:
         # Inisialisasi folder dan file
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.capture_dir = os.path.join(self.base_dir, "capture_images")
-        self.counter_file = os.path.join(self.base_dir, "counter.txt")
         
         # Buat folder jika belum ada
         if not os.path.exists(self.capture_dir):
@@ -33,8 +33,8 @@ class ParkingCamera:
         # Inisialisasi kamera
         self.setup_camera()
         
-        # Load counter
-        self.load_counter()
+        # Nomor tiket dari blok yang disewa dari server
+        self.ticket_numbers = get_allocator()
         
         logger.info("Sistem parkir berhasil diinisialisasi")
 
@@ -54,36 +54,13 @@ class ParkingCamera:
         
         raise Exception("Tidak ada kamera yang terdeteksi!")
 
-    def load_counter(self):
-        """Load atau inisialisasi counter untuk nomor urut file"""
-        try:
-            if os.path.exists(self.counter_file):
-                with open(self.counter_file, 'r') as f:
-                    self.counter = int(f.read().strip())
-            else:
-                self.counter = 0
-                self.save_counter()
-        except Exception as e:
-            logger.error(f"Error loading counter: {str(e)}")
-            self.counter = 0
-
-    def save_counter(self):
-        """Simpan nilai counter ke file"""
-        try:
-            with open(self.counter_file, 'w') as f:
-                f.write(str(self.counter))
-        except Exception as e:
-            logger.error(f"Error saving counter: {str(e)}")
-
     def capture_image(self):
         """Ambil gambar dari kamera dan simpan"""
         try:
-            # Increment counter
-            self.counter += 1
-            
             # Generate nama file
+            ticket_number = self.ticket_numbers.next_ticket_number()
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            filename = f"TKT{timestamp}_{str(self.counter).zfill(4)}.jpg"
+            filename = f"{ticket_number}_{timestamp}.jpg"
             filepath = os.path.join(self.capture_dir, filename)
             
             # Ambil beberapa frame untuk stabilisasi kamera
@@ -97,9 +74,6 @@ class ParkingCamera:
                 cv2.imwrite(filepath, frame)
                 logger.info(f"Gambar berhasil disimpan: {filename}")
                 print(f"\n✅ Gambar disimpan: {filename}")
-                
-                # Simpan counter baru
-                self.save_counter()
                 return True, filename
             else:
                 logger.error("Gagal mengambil gambar dari kamera")
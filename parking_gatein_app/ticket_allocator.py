@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+
+import requests
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # Raspberry Pi / Linux
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_SERVER_URL = "http://192.168.2.6:5000"
+
+# Emergency numbers: OFF + 4 character terminal tag + 9 character timestamp,
+# 16 characters in all (ParkingTickets.TicketNumber holds 20)
+_BASE32_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+OFFLINE_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+
+
+def _base32(value, width):
+    chars = []
+    for _ in range(width):
+        value, index = divmod(value, 32)
+        chars.append(_BASE32_ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+class _FileLock:
+    """Exclusive lock on a file shared by every process on this terminal"""
+
+    def __init__(self, path):
+        self.path = path
+        self._handle = None
+
+    def __enter__(self):
+        self._handle = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            self._handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ten seconds
+                    continue
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._handle, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self._handle.seek(0)
+                msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._handle.close()
+            self._handle = None
+
+
+class TicketNumberAllocator:
+    """Hands out ticket numbers from blocks leased by the gate-out server
+
+    Numbers come from local memory, so an entry never waits on the network
+    and keeps working offline. A new block is fetched in the background when
+    the remaining numbers run low.
+
+    The state file is the only record of which numbers are taken, and every
+    read-modify-write of it happens under a file lock. Each allocator takes
+    `reserve_step` numbers at a time by moving the reservation mark, so
+    several allocators or processes on one terminal never hand out the same
+    number. After a crash the unused part of a reservation is skipped, but a
+    number is never handed out twice.
+
+    Use get_allocator() to share one allocator per state file in a process.
+    """
+
+    def __init__(self, state_file=None, server_url=None, terminal_id=None,
+                 block_size=1000, low_water=200, reserve_step=20, retry_seconds=30):
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.state_file = state_file or os.path.join(base_dir, "ticket_numbers.json")
+        self.server_url = server_url or os.getenv("GATEOUT_API_URL", DEFAULT_SERVER_URL)
+        self.terminal_id = terminal_id or os.getenv("TERMINAL_ID", socket.gethostname())
+        self.api_key = os.getenv("TERMINAL_API_KEY", "")
+        self.block_size = block_size
+        self.low_water = low_water
+        self.reserve_step = reserve_step
+        self.retry_seconds = retry_seconds
+
+        self._lock = threading.Lock()
+        self._file_lock = _FileLock(self.state_file + ".lock")
+        self._refilling = False
+        self._retry_at = 0.0  # no lease attempts before this time.monotonic()
+        self._chunk = []  # [next, end) pairs reserved by this allocator
+        self._remaining = 0  # unreserved numbers in the state file when last read
+        self._terminal_tag = _base32(zlib.crc32(self.terminal_id.encode()), 4)
+
+        with self._lock, self._file_lock:
+            self._remaining = self._unreserved(self._read_state())
+        if self._remaining < self.low_water:
+            self._refill_in_background()
+
+    def _read_state(self):
+        """Leased blocks and the reservation mark, read under the file lock"""
+        state = {"blocks": [], "reserved_until": None, "offline_ms": 0}
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, "r") as f:
+                    state.update(json.load(f))
+            except Exception as e:
+                logger.error(f"Error loading ticket number state: {e}")
+        state["blocks"] = [list(block) for block in state["blocks"]]
+        return state
+
+    def _save_state(self, state):
+        """Write the state file atomically (write, fsync, rename), under the file lock"""
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({**state, "terminal_id": self.terminal_id}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.state_file)
+
+    @staticmethod
+    def _unreserved(state):
+        mark = state["reserved_until"]
+        return sum(max(0, end - max(start, mark or start)) for start, end in state["blocks"])
+
+    def _reserve(self):
+        """Move up to reserve_step numbers from the state file into this allocator"""
+        with self._file_lock:
+            state = self._read_state()
+            mark = state["reserved_until"]
+            blocks = []
+            wanted = self.reserve_step
+            for start, end in state["blocks"]:
+                start = max(start, mark or start)
+                if start >= end:
+                    continue  # used up
+                blocks.append([start, end])
+                if wanted:
+                    take = min(wanted, end - start)
+                    self._chunk.append([start, start + take])
+                    wanted -= take
+                    mark = start + take
+            state["blocks"] = blocks
+            state["reserved_until"] = mark
+            self._remaining = self._unreserved(state)
+            if wanted < self.reserve_step:
+                self._save_state(state)
+
+    def remaining(self):
+        """Number of ticket numbers left: this allocator's reservation plus the unreserved leases"""
+        with self._lock:
+            return sum(end - start for start, end in self._chunk) + self._remaining
+
+    def refill(self):
+        """Lease a new block from the gate-out server
+
+        Returns:
+            bool: True if a block was added
+        """
+        try:
+            response = requests.post(
+                f"{self.server_url}/api/ticket-leases",
+                json={"terminal_id": self.terminal_id, "size": self.block_size},
+                headers={"X-Terminal-Key": self.api_key},
+                timeout=5
+            )
+            if response.status_code != 200:
+                logger.error(f"Ticket lease failed with status {response.status_code}")
+                return False
+            data = response.json().get("data", {})
+            with self._lock, self._file_lock:
+                state = self._read_state()
+                state["blocks"].append([int(data["start"]), int(data["end"])])
+                self._save_state(state)
+                self._remaining = self._unreserved(state)
+            logger.info(f"Leased ticket numbers {data['start']}-{data['end'] - 1}")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not lease ticket numbers: {e}")
+            return False
+
+    def _refill_in_background(self):
+        if self._refilling or time.monotonic() < self._retry_at:
+            return
+        self._refilling = True
+
+        def run():
+            try:
+                if not self.refill():
+                    # Server unreachable: keep using what is left, try again later
+                    self._retry_at = time.monotonic() + self.retry_seconds
+            finally:
+                self._refilling = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _offline_ticket_number(self):
+        """A terminal and time based number, unique across processes on this terminal"""
+        with self._file_lock:
+            state = self._read_state()
+            now_ms = int(time.time() * 1000) - OFFLINE_EPOCH_MS
+            # One number per millisecond; a burst borrows the following milliseconds
+            state["offline_ms"] = max(now_ms, state["offline_ms"] + 1)
+            self._save_state(state)
+        return f"OFF{self._terminal_tag}{_base32(state['offline_ms'], 9)}"
+
+    def next_ticket_number(self):
+        """Get the next ticket number
+
+        Never waits on the network: when the leased numbers run low a new
+        block is requested in the background.
+
+        Returns:
+            str: A globally unique ticket number, e.g. TKT000012345. When every
+            leased number is used up, falls back to a terminal and time based
+            number (OFF..., 16 characters).
+        """
+        with self._lock:
+            if not self._chunk:
+                self._reserve()
+            number = None
+            if self._chunk:
+                number, end = self._chunk[0]
+                if number + 1 < end:
+                    self._chunk[0][0] = number + 1
+                else:
+                    self._chunk.pop(0)
+            running_low = self._remaining < self.low_water
+
+        if running_low:
+            self._refill_in_background()
+        if number is None:
+            logger.error("No leased ticket numbers left, using emergency number")
+            return self._offline_ticket_number()
+        return f"TKT{number:09d}"
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_allocator(state_file=None):
+    """The allocator for a state file, shared by everything in this process
+
+    Args:
+        state_file: Path of the state file; defaults to ticket_numbers.json
+            next to this module
+
+    Returns:
+        TicketNumberAllocator: The shared allocator
+    """
+    path = os.path.abspath(state_file or os.path.join(os.path.dirname(os.path.abspath(__file__)), "ticket_numbers.json"))
+    with _allocators_lock:
+        if path not in _allocators:
+            _allocators[path] = TicketNumberAllocator(state_file=path)
+        return _allocators[path]
@@ -0,0 +1,250 @@
+from datetime import datetime
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from flask import current_app
+
+from .models import ParkingTickets, Vehicles, db, normalized_plate
+from .utils import normalize_plate
+
+
+class ActiveTicket(NamedTuple):
+    Id: int
+    TicketNumber: str
+    EntryTime: datetime
+    VehicleId: Optional[int]
+    plate_number: Optional[str]
+    vehicle_type: Optional[str]
+
+
+class ActiveTicketIndex:
+    """
+    In-memory index of active tickets by ticket number and normalized plate
+
+    The index only ever serves as a shortcut: a miss falls back to the
+    database, and writes that close a ticket still go through a conditional
+    UPDATE on Status, so a stale entry can cost a query but never a wrong
+    exit. Each worker process keeps its own index; check_active_index()
+    brings it back in line with tickets opened or closed elsewhere.
+    """
+
+    def __init__(self, tickets: Iterable[ActiveTicket] = ()):
+        self._lock = threading.Lock()
+        self._by_number: Dict[str, ActiveTicket] = {}
+        self._by_plate: Dict[str, str] = {}
+        self.built_at = time.monotonic()
+        self.refreshing = False
+        for ticket in tickets:
+            self._add(ticket)
+
+    def _add(self, ticket: ActiveTicket) -> None:
+        self._by_number[ticket.TicketNumber] = ticket
+        plate = normalize_plate(ticket.plate_number)
+        if plate:
+            # Keep the most recent entry if a plate has several open tickets
+            current = self._by_number.get(self._by_plate.get(plate))
+            if current is None or current.EntryTime <= ticket.EntryTime:
+                self._by_plate[plate] = ticket.TicketNumber
+
+    def add(self, ticket: ActiveTicket) -> None:
+        with self._lock:
+            self._add(ticket)
+
+    def remove(self, ticket_number: str) -> Optional[ActiveTicket]:
+        with self._lock:
+            ticket = self._by_number.pop(ticket_number, None)
+            if ticket is not None:
+                plate = normalize_plate(ticket.plate_number)
+                if self._by_plate.get(plate) == ticket_number:
+                    del self._by_plate[plate]
+            return ticket
+
+    def by_ticket_number(self, ticket_number: str) -> Optional[ActiveTicket]:
+        return self._by_number.get(ticket_number)
+
+    def by_plate(self, plate_number: str) -> Optional[ActiveTicket]:
+        ticket_number = self._by_plate.get(normalize_plate(plate_number))
+        return self._by_number.get(ticket_number) if ticket_number else None
+
+    def ticket_numbers(self) -> set:
+        with self._lock:
+            return set(self._by_number)
+
+    def __len__(self) -> int:
+        return len(self._by_number)
+
+
+def _active_ticket_query():
+    return db.select(
+        ParkingTickets.Id, ParkingTickets.TicketNumber, ParkingTickets.EntryTime,
+        ParkingTickets.VehicleId, Vehicles.plate_number, Vehicles.vehicle_type
+    ).outerjoin(
+        Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+    ).where(ParkingTickets.Status == 'active')
+
+
+def _load_active_tickets() -> Iterator[ActiveTicket]:
+    result = db.session.execute(_active_ticket_query().execution_options(yield_per=5000))
+    for row in result:
+        yield ActiveTicket(*row)
+
+
+_index: Optional[ActiveTicketIndex] = None
+_build_lock = threading.Lock()
+_refresh_lock = threading.Lock()  # only guards the refreshing flag, never held during a reload
+
+
+def reload_active_index() -> ActiveTicketIndex:
+    """
+    Rebuild the active ticket index from the database and swap it in
+
+    Called at startup to warm the index.
+
+    Returns:
+        ActiveTicketIndex: The newly built index
+    """
+    global _index
+    with _build_lock:
+        index = ActiveTicketIndex(_load_active_tickets())
+        _index = index
+    return index
+
+
+def check_active_index(repair: bool = True) -> Dict[str, Any]:
+    """
+    Compare the active ticket index with the database
+
+    Args:
+        repair: Replace the index with the one just built from the database
+
+    Returns:
+        Dict: Counts of indexed and active tickets, and the ticket numbers
+        missing from the index or indexed but no longer active
+    """
+    global _index
+    with _build_lock:
+        fresh = ActiveTicketIndex(_load_active_tickets())
+        indexed = _index.ticket_numbers() if _index is not None else set()
+        active = fresh.ticket_numbers()
+        report = {
+            'indexed': len(indexed),
+            'active': len(active),
+            'missing': sorted(active - indexed),
+            'stale': sorted(indexed - active)
+        }
+        if report['missing'] or report['stale']:
+            current_app.logger.warning(
+                f"Active ticket index drift: {len(report['missing'])} missing, {len(report['stale'])} stale"
+            )
+        if repair or _index is None:
+            _index = fresh
+    return report
+
+
+def _check_in_background(index: ActiveTicketIndex) -> None:
+    """Check and repair the index on a background thread; the current index keeps serving meanwhile"""
+    with _refresh_lock:
+        if index.refreshing or index is not _index:
+            return
+        index.refreshing = True
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                check_active_index()
+            except Exception as e:
+                app.logger.error(f"Active ticket index check failed: {str(e)}")
+                # Try again after the next interval
+                index.built_at = time.monotonic()
+            finally:
+                index.refreshing = False
+                db.session.remove()
+
+    threading.Thread(target=run, name='active-index-check', daemon=True).start()
+
+
+def get_active_index() -> ActiveTicketIndex:
+    """
+    Get the active ticket index, building it on first use
+
+    Indexes older than ACTIVE_INDEX_CHECK_SECONDS are checked against the
+    database and repaired on a background thread, which picks up tickets
+    opened or closed by other worker processes without making a request
+    wait for the reload.
+
+    Returns:
+        ActiveTicketIndex: The current index
+    """
+    index = _index
+    max_age = current_app.config.get('ACTIVE_INDEX_CHECK_SECONDS', 60)
+    if index is None:
+        index = reload_active_index()
+    elif time.monotonic() - index.built_at > max_age:
+        _check_in_background(index)
+    return index
+
+
+def index_ticket_entry(ticket: ParkingTickets, vehicle: Optional[Vehicles] = None) -> None:
+    """
+    Add a newly created ticket to the index
+
+    Args:
+        ticket: The committed ticket
+        vehicle: The ticket's vehicle, if already loaded
+    """
+    get_active_index().add(ActiveTicket(
+        Id=ticket.Id,
+        TicketNumber=ticket.TicketNumber,
+        EntryTime=ticket.EntryTime,
+        VehicleId=ticket.VehicleId,
+        plate_number=vehicle.plate_number if vehicle else None,
+        vehicle_type=vehicle.vehicle_type if vehicle else None
+    ))
+
+
+def index_ticket_exit(ticket_number: str) -> None:
+    """
+    Remove a closed ticket from the index
+
+    Args:
+        ticket_number: The ticket number
+    """
+    if _index is not None:
+        _index.remove(ticket_number)
+
+
+def find_active_ticket(ticket_number: Optional[str] = None,
+                       plate_number: Optional[str] = None) -> Optional[ActiveTicket]:
+    """
+    Look up an active ticket in the index, falling back to the database
+
+    Args:
+        ticket_number: The ticket number
+        plate_number: The vehicle plate number, in any spacing or case
+
+    Returns:
+        ActiveTicket or None: The active ticket if found
+    """
+    index = get_active_index()
+    if ticket_number:
+        ticket = index.by_ticket_number(ticket_number)
+        query = _active_ticket_query().where(ParkingTickets.TicketNumber == ticket_number)
+    elif plate_number:
+        ticket = index.by_plate(plate_number)
+        # Match the plate the same way the index does, in any spacing or case
+        query = _active_ticket_query().where(
+            normalized_plate(Vehicles.plate_number) == normalize_plate(plate_number)
+        ).order_by(ParkingTickets.EntryTime.desc())
+    else:
+        return None
+    if ticket is not None:
+        return ticket
+
+    row = db.session.execute(query).first()
+    if row is None:
+        return None
+    ticket = ActiveTicket(*row)
+    index.add(ticket)
+    return ticket
@@ -1,14 +1,16 @@
 from flask import Flask, jsonify
-from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
 import logging
 from datetime import timedelta
+from sqlalchemy.schema import CreateIndex
+
+from parking_gateout_app.models import db
+from parking_gateout_app.utils import get_gate_id
 
 # Initialize extensions
-db = SQLAlchemy()
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"]
@@ -19,6 +21,9 @@ def create_app():
     
     # Load configuration
     app.config.from_object('parking_gateout_app.config.Config')
+    # IDs are generated lazily, so check the gate's part of the node ID up front
+    if os.getenv('NODE_ID') is None:
+        get_gate_id()
     
     # Initialize extensions with app
     db.init_app(app)
@@ -29,7 +34,7 @@ def create_app():
         # Import blueprints here to avoid circular imports
         from parking_gateout_app.routes import (
             auth_bp, parking_bp, payment_bp, management_bp,
-            report_bp, main_bp, health_bp
+            report_bp, main_bp, health_bp, lease_bp
         )
         from parking_gateout_app.dashboard_routes import (
             dashboard_bp, api_dashboard_bp, api_stats_bp,
@@ -52,9 +57,51 @@ def create_app():
         app.register_blueprint(report_bp, name='report_api')
         app.register_blueprint(main_bp, name='main_api')
         app.register_blueprint(health_bp, name='health_api')
+        app.register_blueprint(lease_bp, name='lease_api')
         
         # Create database tables
         db.create_all()
+        
+        # create_all skips indexes on tables that already exist, so add
+        # any that were introduced after the table was first created
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    if db.engine.dialect.name in ('sqlite', 'postgresql'):
+                        # Reflection cannot see expression indexes, so let the database skip existing ones
+                        with db.engine.begin() as connection:
+                            connection.execute(CreateIndex(index, if_not_exists=True))
+                    else:
+                        index.create(db.engine, checkfirst=True)
+                except Exception as e:
+                    app.logger.warning(f"Could not create index {index.name}: {str(e)}")
+        
+        # Rollup maintenance commands (flask rollup backfill / verify)
+        from parking_gateout_app.rollup import rollup_cli
+        app.cli.add_command(rollup_cli)
+        
+        # Columnar archive of closed months (flask archive export)
+        from parking_gateout_app.archive import archive_cli
+        app.cli.add_command(archive_cli)
+        
+        # Space occupancy counters (flask occupancy reconcile); seeded here
+        # the first time, since the table starts empty on an existing database
+        from parking_gateout_app.space_counters import occupancy_cli, seed_occupancy
+        app.cli.add_command(occupancy_cli)
+        try:
+            if seed_occupancy():
+                app.logger.info("Seeded the occupancy counters from the spaces table")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Could not seed occupancy counters: {str(e)}")
+        
+        # Warm the active ticket index used by exit lookups; it is built
+        # on first use instead if the database is not ready yet
+        from parking_gateout_app.active_index import reload_active_index
+        try:
+            reload_active_index()
+        except Exception as e:
+            app.logger.warning(f"Could not warm active ticket index: {str(e)}")
     
     return app
 
@@ -0,0 +1,348 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from .models import ParkingTickets, ParkingTransactions, Vehicles, db
+from .rollup import UNKNOWN_VEHICLE_TYPE, month_start, next_month
+
+EPOCH = datetime(1970, 1, 1)
+EXPORT_BATCH_SIZE = 5000
+MANIFEST = 'manifest.json'
+
+# Column dtypes per dataset; timestamps are minutes since EPOCH and money
+# is stored in cents. String columns hold codes into the manifest's
+# dictionaries.
+DATASETS = {
+    'tickets': {
+        'entry_minute': np.int32,
+        'exit_minute': np.int32,
+        'duration': np.int32,
+        'amount_cents': np.int64,
+        'vehicle_type': np.uint8
+    },
+    'transactions': {
+        'created_minute': np.int32,
+        'amount_cents': np.int64,
+        'vehicle_type': np.uint8,
+        'payment_method': np.uint8,
+        'status': np.uint8
+    }
+}
+# The timestamp each dataset is partitioned and filtered by
+TIME_COLUMNS = {'tickets': 'exit_minute', 'transactions': 'created_minute'}
+GROUP_KEYS = ('month', 'day', 'hour', 'weekday', 'vehicle_type', 'payment_method', 'status')
+
+
+def archive_dir() -> str:
+    return current_app.config.get('ARCHIVE_DIR') or os.path.join(current_app.root_path, 'archive')
+
+
+def _minutes(moment: datetime) -> int:
+    return int((moment - EPOCH).total_seconds() // 60)
+
+
+def _cents(amount: Any) -> int:
+    return int(round(float(amount or 0) * 100))
+
+
+class _Dictionary:
+    """Assigns small integer codes to the distinct values of a string column"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        value = value or UNKNOWN_VEHICLE_TYPE
+        if value not in self._codes:
+            if len(self.values) > np.iinfo(np.uint8).max:
+                raise ValueError(f"Too many distinct values to archive: {value}")
+            self._codes[value] = len(self.values)
+            self.values.append(value)
+        return self._codes[value]
+
+
+def _closed_tickets(start: datetime, end: datetime) -> Iterator[Tuple[Any, ...]]:
+    query = db.select(
+        ParkingTickets.EntryTime, ParkingTickets.ExitTime, ParkingTickets.Duration,
+        ParkingTickets.Amount, Vehicles.vehicle_type
+    ).outerjoin(
+        Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+    ).where(
+        ParkingTickets.Status == 'completed',
+        ParkingTickets.ExitTime >= start,
+        ParkingTickets.ExitTime < end
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for partition in db.session.execute(query).partitions():
+        yield from partition
+
+
+def _transactions(start: datetime, end: datetime) -> Iterator[Tuple[Any, ...]]:
+    query = db.select(
+        ParkingTransactions.created_at, ParkingTransactions.amount, Vehicles.vehicle_type,
+        ParkingTransactions.payment_method, ParkingTransactions.status
+    ).outerjoin(
+        # Cast the transaction side so the ticket is found by primary key
+        ParkingTickets, ParkingTickets.Id == func.cast(ParkingTransactions.ticket_id, db.Integer)
+    ).outerjoin(
+        Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+    ).where(
+        ParkingTransactions.created_at >= start,
+        ParkingTransactions.created_at < end
+    ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for partition in db.session.execute(query).partitions():
+        yield from partition
+
+
+def export_month(month: datetime, directory: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Write one month of closed tickets and its transactions as columnar files
+
+    Each column is a .npy file that can be memory-mapped, with timestamps
+    reduced to minutes, money to cents and strings to one-byte codes. The
+    month is written to a temporary directory and moved into place, so
+    readers never see a partial month and re-running replaces it.
+
+    Args:
+        month: Any moment in the month to export
+        directory: Archive root, defaults to ARCHIVE_DIR
+
+    Returns:
+        Dict: The month's manifest
+    """
+    directory = directory or archive_dir()
+    start = month_start(month)
+    end = next_month(start)
+    dictionaries = {'vehicle_type': _Dictionary(), 'payment_method': _Dictionary(), 'status': _Dictionary()}
+    columns: Dict[str, Dict[str, List[int]]] = {
+        dataset: {name: [] for name in dtypes} for dataset, dtypes in DATASETS.items()
+    }
+
+    tickets = columns['tickets']
+    for entry_time, exit_time, duration, amount, vehicle_type in _closed_tickets(start, end):
+        tickets['entry_minute'].append(_minutes(entry_time or exit_time))
+        tickets['exit_minute'].append(_minutes(exit_time))
+        tickets['duration'].append(duration or 0)
+        tickets['amount_cents'].append(_cents(amount))
+        tickets['vehicle_type'].append(dictionaries['vehicle_type'].code(vehicle_type))
+
+    transactions = columns['transactions']
+    for created_at, amount, vehicle_type, payment_method, status in _transactions(start, end):
+        transactions['created_minute'].append(_minutes(created_at))
+        transactions['amount_cents'].append(_cents(amount))
+        transactions['vehicle_type'].append(dictionaries['vehicle_type'].code(vehicle_type))
+        transactions['payment_method'].append(dictionaries['payment_method'].code(payment_method))
+        transactions['status'].append(dictionaries['status'].code(status))
+
+    manifest = {
+        'month': start.strftime('%Y-%m'),
+        'exported_at': datetime.now().isoformat(),
+        'rows': {dataset: len(next(iter(values.values()))) for dataset, values in columns.items()},
+        'dictionaries': {name: dictionary.values for name, dictionary in dictionaries.items()}
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, manifest['month'])
+    staging = tempfile.mkdtemp(prefix=f".{manifest['month']}-", dir=directory)
+    try:
+        for dataset, values in columns.items():
+            os.makedirs(os.path.join(staging, dataset))
+            for name, dtype in DATASETS[dataset].items():
+                np.save(os.path.join(staging, dataset, f'{name}.npy'), np.asarray(values[name], dtype=dtype))
+        with open(os.path.join(staging, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def export_closed_months(directory: Optional[str] = None, force: bool = False) -> List[str]:
+    """
+    Archive every month that has ended and is not archived yet
+
+    Args:
+        directory: Archive root, defaults to ARCHIVE_DIR
+        force: Re-export months that are already archived
+
+    Returns:
+        List[str]: The months written, as YYYY-MM
+    """
+    directory = directory or archive_dir()
+    first = db.session.execute(db.select(func.min(ParkingTickets.ExitTime))).scalar()
+    first_transaction = db.session.execute(db.select(func.min(ParkingTransactions.created_at))).scalar()
+    firsts = [value for value in (first, first_transaction) if value is not None]
+    if not firsts:
+        return []
+
+    written = []
+    month = month_start(min(firsts))
+    current = month_start(datetime.now())
+    while month < current:
+        name = month.strftime('%Y-%m')
+        if force or not os.path.exists(os.path.join(directory, name, MANIFEST)):
+            export_month(month, directory)
+            written.append(name)
+        month = next_month(month)
+    return written
+
+
+class ArchiveMonth:
+    """One archived month, with its columns memory-mapped on first access"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self._columns: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def column(self, dataset: str, name: str) -> np.ndarray:
+        key = (dataset, name)
+        if key not in self._columns:
+            self._columns[key] = np.load(os.path.join(self.path, dataset, f'{name}.npy'), mmap_mode='r')
+        return self._columns[key]
+
+    def dictionary(self, name: str) -> List[str]:
+        return self.manifest['dictionaries'][name]
+
+
+class ArchiveReader:
+    """
+    Aggregates over the monthly columnar archive with NumPy
+
+    Only the columns a query needs are read, and only for the months that
+    overlap the requested range, so long-range questions never touch the
+    tables the gates write to.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or archive_dir()
+        self._months: Dict[str, ArchiveMonth] = {}
+
+    def months(self) -> List[str]:
+        """Archived months, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if not name.startswith('.') and os.path.exists(os.path.join(self.directory, name, MANIFEST))
+        )
+
+    def _month(self, name: str) -> ArchiveMonth:
+        if name not in self._months:
+            self._months[name] = ArchiveMonth(os.path.join(self.directory, name))
+        return self._months[name]
+
+    def _group_labels(self, month: ArchiveMonth, dataset: str, key: str,
+                      minutes: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, List[Any]]:
+        """Integer group codes for the selected rows, and the label of each code"""
+        if key == 'month':
+            return np.zeros(int(mask.sum()), dtype=np.int64), [month.manifest['month']]
+        if key in ('day', 'hour', 'weekday'):
+            selected = minutes[mask].astype(np.int64)
+            if key == 'hour':
+                codes = (selected // 60) % 24
+                return codes, list(range(24))
+            days = selected // 1440
+            if key == 'weekday':
+                # 1970-01-01 was a Thursday; Monday is 0 as in datetime.weekday()
+                return (days + 3) % 7, list(range(7))
+            first = int(days.min()) if len(days) else 0
+            labels = [(EPOCH + timedelta(days=first + i)).strftime('%Y-%m-%d')
+                      for i in range(int(days.max()) - first + 1 if len(days) else 0)]
+            return days - first, labels
+        if key not in DATASETS[dataset]:
+            raise ValueError(f"Cannot group {dataset} by {key}")
+        return month.column(dataset, key)[mask].astype(np.int64), month.dictionary(key)
+
+    def aggregate(self, dataset: str, start: datetime, end: datetime,
+                  by: Optional[str] = None) -> Dict[Any, Dict[str, Any]]:
+        """
+        Count, sum and average a dataset over [start, end)
+
+        Args:
+            dataset: 'tickets' (by exit time) or 'transactions' (by creation time)
+            start: Start of the range (inclusive)
+            end: End of the range (exclusive)
+            by: Optional grouping, one of GROUP_KEYS
+
+        Returns:
+            Dict: Metrics per group, or under 'all' when not grouped. Tickets
+            report count, revenue and dwell minutes; transactions report
+            count and revenue.
+
+        Raises:
+            ValueError: If the dataset or grouping is not supported
+        """
+        if dataset not in DATASETS:
+            raise ValueError(f"Unknown dataset: {dataset}")
+        if by is not None and by not in GROUP_KEYS:
+            raise ValueError(f"Unsupported grouping: {by}")
+
+        first, last = start.strftime('%Y-%m'), (end - timedelta(microseconds=1)).strftime('%Y-%m')
+        low, high = _minutes(start), _minutes(end)
+        totals: Dict[Any, Dict[str, int]] = {}
+
+        for name in self.months():
+            if not first <= name <= last:
+                continue
+            month = self._month(name)
+            minutes = month.column(dataset, TIME_COLUMNS[dataset])
+            mask = (minutes >= low) & (minutes < high)
+            if not mask.any():
+                continue
+
+            amounts = month.column(dataset, 'amount_cents')[mask]
+            durations = month.column(dataset, 'duration')[mask] if dataset == 'tickets' else None
+            if by is None:
+                codes, labels = np.zeros(len(amounts), dtype=np.int64), ['all']
+            else:
+                codes, labels = self._group_labels(month, dataset, by, minutes, mask)
+
+            size = len(labels)
+            counts = np.bincount(codes, minlength=size)
+            cents = np.bincount(codes, weights=amounts, minlength=size)
+            dwell = np.bincount(codes, weights=durations, minlength=size) if durations is not None else None
+            for code in np.flatnonzero(counts):
+                group = totals.setdefault(labels[code], {'count': 0, 'cents': 0, 'dwell': 0})
+                group['count'] += int(counts[code])
+                group['cents'] += int(cents[code])
+                if dwell is not None:
+                    group['dwell'] += int(dwell[code])
+
+        results = {}
+        for label, group in sorted(totals.items()):
+            result = {'count': group['count'], 'revenue': group['cents'] / 100}
+            if dataset == 'tickets':
+                result['dwell_minutes'] = group['dwell']
+                result['average_dwell_minutes'] = group['dwell'] / group['count']
+            results[label] = result
+        return results
+
+
+archive_cli = AppGroup('archive', help='Maintain the columnar archive of closed months.')
+
+
+@archive_cli.command('export')
+@click.option('--month', help='Month to export (YYYY-MM), defaults to every closed month not yet archived')
+@click.option('--force', is_flag=True, help='Re-export months that are already archived')
+def export_command(month: Optional[str], force: bool) -> None:
+    """Export closed tickets and transactions to the archive."""
+    if month:
+        manifest = export_month(datetime.strptime(month, '%Y-%m'))
+        months = [manifest['month']]
+    else:
+        months = export_closed_months(force=force)
+    click.echo(f"Archived {len(months)} month(s): {', '.join(months) or '-'}")
@@ -0,0 +1,74 @@
+"""
+Exit throughput benchmark
+
+Seeds a file-backed SQLite database with active tickets and measures how
+many exits per second ParkingService.process_vehicle_exit handles with the
+legacy (three commit) path and the single-transaction fast path.
+
+Usage:
+    python -m parking_gateout_app.bench_exit [tickets]
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from parking_gateout_app.models import db, ParkingRate, ParkingTickets, Vehicles
+from parking_gateout_app.services import ParkingService
+
+
+def create_bench_app(db_path: str) -> Flask:
+    app = Flask(__name__)
+    app.config.from_object('parking_gateout_app.config.Config')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(ParkingRate(
+            VehicleType='MOBIL', DurationType='hourly', BaseDuration=1,
+            BaseRate=5000, AdditionalRate=3000, MaxDailyRate=25000
+        ))
+        db.session.add(Vehicles(Id='1', plate_number='B1234XYZ', vehicle_type='MOBIL'))
+        db.session.commit()
+    return app
+
+
+def seed_tickets(prefix: str, count: int) -> list:
+    entry_time = datetime.now() - timedelta(hours=3)
+    db.session.execute(db.insert(ParkingTickets), [{
+        'TicketNumber': f'{prefix}{i:06d}',
+        'VehicleId': 1,
+        'EntryTime': entry_time,
+        'Status': 'active'
+    } for i in range(count)])
+    db.session.commit()
+    return [f'{prefix}{i:06d}' for i in range(count)]
+
+
+def run(count: int = 500) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_bench_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            for label, fast in (('legacy', False), ('fast', True)):
+                tickets = seed_tickets(label[0].upper(), count)
+                start = time.perf_counter()
+                for ticket_number in tickets:
+                    result = ParkingService.process_vehicle_exit(ticket_number, fast=fast)
+                    assert result['success'], result['message']
+                elapsed = time.perf_counter() - start
+                results[label] = count / elapsed
+            db.session.remove()
+            db.engine.dispose()
+    return results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    results = run(count)
+    for label, rate in results.items():
+        print(f"{label:>7}: {rate:8.1f} exits/sec")
+    print(f"speedup: {results['fast'] / results['legacy']:.2f}x")
@@ -0,0 +1,179 @@
+"""
+Report query benchmark
+
+Seeds a file-backed SQLite database with one day of entries and times
+ParkingService.get_daily_report against the previous per-hour query loop,
+checking that both produce the same hourly breakdown. Then seeds a month
+of completed tickets with their transactions and times
+ParkingService.get_parking_statistics over the whole month. Finally times
+fetching a deep page of the activity log by OFFSET against a keyset cursor.
+
+Usage:
+    python -m parking_gateout_app.bench_reports [entries]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from parking_gateout_app.bench_exit import create_bench_app
+from parking_gateout_app.models import db, ParkingTickets, ParkingTransactions, Vehicles, ActivityLog
+from parking_gateout_app.pagination import encode_cursor, keyset_page
+from parking_gateout_app.services import ParkingService
+
+REPORT_DATE = datetime(2025, 4, 1)
+
+
+def seed_day(count: int, seed: int = 1) -> None:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        # Morning and evening peaks on top of a uniform background
+        hour = rng.choice([rng.randint(0, 23), rng.randint(7, 9), rng.randint(16, 18)])
+        entry_time = REPORT_DATE + timedelta(hours=hour, seconds=rng.randint(0, 3599))
+        rows.append({
+            'TicketNumber': f'D{i:07d}',
+            'VehicleId': 1,
+            'EntryTime': entry_time,
+            'Status': 'active'
+        })
+    db.session.execute(db.insert(ParkingTickets), rows)
+    db.session.execute(db.insert(ActivityLog), [{
+        'Action': 'VEHICLE_ENTRY',
+        'Details': f'Entry {i}',
+        'Status': 'failed' if i % 50 == 0 else 'success',
+        'CreatedAt': REPORT_DATE + timedelta(seconds=i % 86400)
+    } for i in range(count // 10)])
+    db.session.commit()
+
+
+def seed_month(count: int, seed: int = 2) -> dict:
+    """Seed completed tickets with one transaction each; returns the expected stats"""
+    rng = random.Random(seed)
+    db.session.add(Vehicles(Id='2', plate_number='B5678ABC', vehicle_type='MOTOR'))
+    tickets, transactions = [], []
+    expected = {}
+    for i in range(count):
+        vehicle_id = rng.choice([1, 2])
+        entry_time = REPORT_DATE + timedelta(minutes=rng.randint(0, 29 * 24 * 60))
+        exit_time = entry_time + timedelta(minutes=rng.randint(5, 600))
+        amount = rng.choice([2000, 3000, 5000, 8000])
+        tickets.append({
+            'Id': 1000000 + i,
+            'TicketNumber': f'M{i:07d}',
+            'VehicleId': vehicle_id,
+            'EntryTime': entry_time,
+            'ExitTime': exit_time,
+            'Amount': amount,
+            'Status': 'completed'
+        })
+        transactions.append({
+            'Id': f'bench-{i}',
+            'ticket_id': str(1000000 + i),
+            'transaction_number': f'TRX-BENCH-{i}',
+            'amount': amount,
+            'payment_method': 'cash',
+            'status': 'completed',
+            'created_at': exit_time
+        })
+        stats = expected.setdefault('MOBIL' if vehicle_id == 1 else 'MOTOR', {'count': 0, 'revenue': 0.0})
+        stats['count'] += 1
+        stats['revenue'] += amount
+    db.session.execute(db.insert(ParkingTickets), tickets)
+    db.session.execute(db.insert(ParkingTransactions), transactions)
+    db.session.commit()
+    return expected
+
+
+def legacy_hourly_breakdown(report_date: datetime) -> dict:
+    """The per-hour query loop get_daily_report used before"""
+    start_date = report_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    hourly_data = {}
+    for hour in range(24):
+        hour_start = start_date + timedelta(hours=hour)
+        hour_end = hour_start + timedelta(hours=1) - timedelta(microseconds=1)
+        tickets = ParkingTickets.query.filter(
+            ParkingTickets.EntryTime.between(hour_start, hour_end)
+        ).all()
+        hourly_data[hour] = len(tickets)
+    return hourly_data
+
+
+def time_deep_page(per_page: int = 20) -> dict:
+    """Time the first and last activity log pages by OFFSET and by cursor"""
+    query = ActivityLog.query
+    total = query.count()
+    offset = (total // per_page - 1) * per_page
+    ordered = query.order_by(ActivityLog.CreatedAt.desc(), ActivityLog.Id.desc())
+    before = ordered.offset(offset - 1).first()
+    cursor = encode_cursor(before.CreatedAt, before.Id)
+
+    timings = {}
+    start = time.perf_counter()
+    first = keyset_page(query, ActivityLog.CreatedAt, ActivityLog.Id, limit=per_page)
+    timings['first_page'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    by_offset = ordered.offset(offset).limit(per_page).all()
+    timings['offset_page'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    by_cursor = keyset_page(query, ActivityLog.CreatedAt, ActivityLog.Id, cursor=cursor, limit=per_page)
+    timings['cursor_page'] = time.perf_counter() - start
+
+    assert len(first['items']) == per_page
+    assert [a.Id for a in by_cursor['items']] == [a.Id for a in by_offset]
+    return timings
+
+
+def run(count: int = 50000) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_bench_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            seed_day(count)
+
+            start = time.perf_counter()
+            legacy = legacy_hourly_breakdown(REPORT_DATE)
+            results['legacy'] = time.perf_counter() - start
+            db.session.expunge_all()
+
+            start = time.perf_counter()
+            report = ParkingService.get_daily_report(REPORT_DATE)
+            results['grouped'] = time.perf_counter() - start
+
+            assert report['hourly_breakdown'] == legacy
+            assert report['peak_hour'] == max(legacy.items(), key=lambda x: x[1])[0]
+            assert report['issue_count'] == len(range(0, count // 10, 50))
+
+            expected = seed_month(count)
+            start = time.perf_counter()
+            stats = ParkingService.get_parking_statistics(REPORT_DATE, REPORT_DATE + timedelta(days=31))
+            results['statistics'] = time.perf_counter() - start
+            assert stats['vehicle_stats'] == expected
+            assert stats['total_vehicles'] == count
+
+            db.session.execute(db.insert(ActivityLog), [{
+                'Action': 'VEHICLE_EXIT',
+                'Details': f'Exit {i}',
+                'CreatedAt': REPORT_DATE + timedelta(seconds=i // 2)
+            } for i in range(count * 4)])
+            db.session.commit()
+            results.update(time_deep_page())
+            db.session.remove()
+            db.engine.dispose()
+    return results
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    results = run(count)
+    print(f" legacy hourly loop: {results['legacy'] * 1000:8.1f} ms")
+    print(f"grouped daily report: {results['grouped'] * 1000:8.1f} ms")
+    print(f"speedup: {results['legacy'] / results['grouped']:.1f}x")
+    print(f"  monthly statistics: {results['statistics'] * 1000:8.1f} ms")
+    print(f" activity first page: {results['first_page'] * 1000:8.1f} ms")
+    print(f"   deep page, OFFSET: {results['offset_page'] * 1000:8.1f} ms")
+    print(f"   deep page, cursor: {results['cursor_page'] * 1000:8.1f} ms")
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import func
+
+from .models import db
+
+BUCKET_SIZES = ('hour', 'day', 'week', 'month')
+
+# strftime formats for the start of each bucket; weeks start on Monday
+_SQLITE_FORMATS = {'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d 00:00:00', 'month': '%Y-%m-01 00:00:00'}
+_MYSQL_FORMATS = {'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d 00:00:00', 'month': '%Y-%m-01 00:00:00'}
+
+
+def _check_size(size: str) -> None:
+    if size not in BUCKET_SIZES:
+        raise ValueError(f"Unsupported bucket size: {size}")
+
+
+def truncate(column: Any, size: str) -> Any:
+    """
+    SQL expression for the start of the bucket a datetime column falls in
+
+    Args:
+        column: A datetime column
+        size: One of BUCKET_SIZES
+
+    Returns:
+        The bucket start; a string on SQLite and MySQL, read it back with
+        as_datetime()
+    """
+    _check_size(size)
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        if size == 'week':
+            # Truncate to the day first: 'weekday' rounds the time to milliseconds,
+            # which moves the last instant of a Sunday into the next week
+            return func.strftime('%Y-%m-%d 00:00:00', column, 'start of day', 'weekday 0', '-6 days')
+        return func.strftime(_SQLITE_FORMATS[size], column)
+    if dialect in ('mysql', 'mariadb'):
+        if size == 'week':
+            return func.date_format(func.subdate(column, func.weekday(column)), _MYSQL_FORMATS['day'])
+        return func.date_format(column, _MYSQL_FORMATS[size])
+    return func.date_trunc(size, column)
+
+
+def hour_of_day(column: Any) -> Any:
+    """SQL expression for the hour (0-23) of a datetime column"""
+    if db.engine.dialect.name == 'sqlite':
+        return func.cast(func.strftime('%H', column), db.Integer)
+    return func.extract('hour', column)
+
+
+def as_datetime(value: Any) -> datetime:
+    """A bucket start as returned by the database"""
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def bucket_start(moment: datetime, size: str) -> datetime:
+    """Start of the bucket a timestamp falls in, matching truncate()"""
+    _check_size(size)
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if size == 'hour':
+        return moment
+    moment = moment.replace(hour=0)
+    if size == 'week':
+        return moment - timedelta(days=moment.weekday())
+    if size == 'month':
+        return moment.replace(day=1)
+    return moment
+
+
+def next_bucket(moment: datetime, size: str) -> datetime:
+    """Start of the bucket after the one a timestamp falls in"""
+    start = bucket_start(moment, size)
+    if size == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[size]
+
+
+def bucket_range(start: datetime, end: datetime, size: str) -> List[datetime]:
+    """Start of every bucket overlapping [start, end)"""
+    buckets = []
+    current = bucket_start(start, size)
+    while current < end:
+        buckets.append(current)
+        current = next_bucket(current, size)
+    return buckets
+
+
+def bucketed_series(column: Any, start: datetime, end: datetime, size: str,
+                    aggregates: Dict[str, Any], filters: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+    """
+    Aggregate rows into time buckets in SQL and fill the gaps
+
+    Only one row per non-empty bucket comes back from the database; buckets
+    without rows are filled in with zeros, so the series is dense.
+
+    Args:
+        column: The datetime column to bucket by
+        start: Start of the range (inclusive)
+        end: End of the range (exclusive)
+        size: One of BUCKET_SIZES
+        aggregates: Name to SQL aggregate, e.g. {'revenue': func.sum(...)}
+        filters: Extra WHERE clauses
+
+    Returns:
+        List: One dict per bucket with 'bucket' (its start) and each aggregate
+
+    Raises:
+        ValueError: If the bucket size is not supported
+    """
+    bucket = truncate(column, size).label('bucket')
+    names = list(aggregates)
+    rows = db.session.execute(
+        db.select(bucket, *(func.coalesce(aggregates[name], 0) for name in names)).where(
+            column >= start,
+            column < end,
+            *filters
+        ).group_by(bucket)
+    ).all()
+    values = {as_datetime(row[0]): row[1:] for row in rows}
+
+    series = []
+    for moment in bucket_range(start, end, size):
+        found: Optional[Sequence[Any]] = values.get(moment)
+        point = {'bucket': moment}
+        for i, name in enumerate(names):
+            point[name] = found[i] if found is not None else 0
+        series.append(point)
+    return series
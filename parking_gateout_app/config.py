@@ -35,6 +35,26 @@ class Config:
         'BUS': float(os.getenv('PARKING_RATE_BUS', '15000'))
     }
     MAX_PARKING_HOURS = int(os.getenv('MAX_PARKING_HOURS', '24'))
+    TARIFF_REFRESH_SECONDS = int(os.getenv('TARIFF_REFRESH_SECONDS', '300'))  # rebuild in-memory rates
+    FAST_EXIT = os.getenv('FAST_EXIT', 'True').lower() == 'true'  # single-transaction exits
+    ACTIVE_INDEX_CHECK_SECONDS = int(os.getenv('ACTIVE_INDEX_CHECK_SECONDS', '60'))  # reconcile active ticket index
+    REPORT_CACHE_TODAY_SECONDS = int(os.getenv('REPORT_CACHE_TODAY_SECONDS', '30'))  # reports that include today
+    REPORT_CACHE_CLOSED_SECONDS = int(os.getenv('REPORT_CACHE_CLOSED_SECONDS', '3600'))  # reports on closed days
+    REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', '512'))
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(basedir, 'archive'))  # monthly columnar files
+    DASHBOARD_SNAPSHOT_SECONDS = float(os.getenv('DASHBOARD_SNAPSHOT_SECONDS', '5'))  # shared dashboard snapshot
+    EVENTS_COALESCE_SECONDS = float(os.getenv('EVENTS_COALESCE_SECONDS', '0.5'))  # batch dashboard events
+    EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+    # Each event stream holds a worker this long: run a threaded or async server (gunicorn gthread/gevent).
+    # Set 0 on sync workers to answer at once and have clients poll every EVENTS_RETRY_SECONDS instead
+    EVENTS_STREAM_SECONDS = float(os.getenv('EVENTS_STREAM_SECONDS', '300'))
+    EVENTS_RETRY_SECONDS = float(os.getenv('EVENTS_RETRY_SECONDS', '3'))  # clients reconnect after this
+    EVENTS_POLL_SECONDS = float(os.getenv('EVENTS_POLL_SECONDS', '1'))  # one thread per process reads the event log
+    EVENTS_KEEP_SECONDS = int(os.getenv('EVENTS_KEEP_SECONDS', '3600'))  # clients further behind reload
+    
+    # Gate-in terminals
+    TERMINAL_API_KEY = os.getenv('TERMINAL_API_KEY')
+    TICKET_LEASE_MAX_SIZE = int(os.getenv('TICKET_LEASE_MAX_SIZE', '10000'))
     
     # API Configuration
     RATE_LIMIT = os.getenv('RATE_LIMIT', '100 per minute')
@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request, current_app, render_template
+from flask import Blueprint, Response, jsonify, request, current_app, render_template
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_, text, select
 import uuid
@@ -8,7 +8,18 @@ from parking_gateout_app.models import (
     ParkingTransactions, ParkingSpaces, Members, MemberCards,
     MemberRates, Staff, StaffAttendance, Shifts
 )
-from parking_gateout_app.routes import token_required, limiter
+from parking_gateout_app.routes import token_required, limiter, active_sessions_response
+from parking_gateout_app.tariff import reload_tariff_table, quote_fee
+from parking_gateout_app.utils import generate_ticket_number
+from parking_gateout_app.active_index import index_ticket_entry, index_ticket_exit
+from parking_gateout_app.services import ParkingService
+from parking_gateout_app.rollup import hour_start, record_entry, record_exit, rollup_totals
+from parking_gateout_app.pagination import keyset_page, page_args, pagination_info
+from parking_gateout_app.occupancy import occupancy_series
+from parking_gateout_app.space_counters import occupancy_counts, occupancy_groups
+from parking_gateout_app.events import event_stream, get_event_log
+from parking_gateout_app.snapshot import build_snapshot, get_snapshot_cache
+from parking_gateout_app.report_cache import conditional_response
 from flask_caching import Cache
 import logging
 from flask_login import login_required, current_user
@@ -134,17 +145,12 @@ def profile():
 @token_required
 def get_overview_stats(current_user):
     try:
-        # Get total parking spaces
-        total_spaces = ParkingSpaces.query.count()
-        
-        # Get occupied spaces
-        occupied_spaces = ParkingTickets.query.filter_by(IsActive=True).count()
-        
-        # Get available spaces
-        available_spaces = total_spaces - occupied_spaces
-        
-        # Get active sessions
-        active_sessions = ParkingTickets.query.filter_by(IsActive=True).count()
+        # Space figures come from the occupancy counters, sessions from the tickets
+        spaces = occupancy_counts()
+        total_spaces = spaces['Total']
+        occupied_spaces = spaces['Occupied']
+        available_spaces = spaces['Available']
+        active_sessions = ParkingTickets.query.filter_by(Status='active').count()
         
         return jsonify({
             'success': True,
@@ -169,35 +175,35 @@ def get_overview_stats(current_user):
 @token_required
 def get_activities_list(current_user):
     try:
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 10))
+        cursor, per_page, total = page_args(request.args)
         
-        # Get activities with pagination
-        activities = ActivityLog.query.order_by(ActivityLog.CreatedAt.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Get one keyset page of activities, newest first
+        try:
+            page = keyset_page(ActivityLog.query, ActivityLog.CreatedAt, ActivityLog.Id,
+                               cursor=cursor, limit=per_page, total=total)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'error': 'INVALID_CURSOR'
+            }), 400
         
         # Format activities
         formatted_activities = [{
-            'id': activity.id,
+            'id': activity.Id,
             'action': activity.Action,
             'details': activity.Details,
             'status': activity.Status,
-            'created_at': activity.CreatedAt.isoformat(),
+            'created_at': activity.CreatedAt.isoformat() if activity.CreatedAt else None,
             'user_id': activity.UserId
-        } for activity in activities.items]
+        } for activity in page['items']]
         
         return jsonify({
             'success': True,
             'message': 'Activities retrieved successfully',
             'data': {
                 'activities': formatted_activities,
-                'pagination': {
-                    'page': activities.page,
-                    'per_page': activities.per_page,
-                    'total': activities.total,
-                    'pages': activities.pages
-                }
+                'pagination': pagination_info(page, per_page)
             }
         })
     except Exception as e:
@@ -212,22 +218,9 @@ def get_activities_list(current_user):
 @api_dashboard_bp.route('/parking-sessions/active')
 @limiter.limit("60 per minute")
 @token_required
-def get_active_sessions():
+def get_active_sessions(current_user):
     try:
-        active_sessions = ParkingTickets.query\
-            .filter_by(Status='active')\
-            .order_by(ParkingTickets.EntryTime.desc())\
-            .all()
-        
-        return jsonify({
-            'status': 'success',
-            'data': [{
-                'ticket_number': session.TicketNumber,
-                'vehicle_plate': session.Vehicle.plate_number if session.Vehicle else 'Unknown',
-                'entry_time': session.EntryTime.isoformat(),
-                'duration': (datetime.utcnow() - session.EntryTime).total_seconds()
-            } for session in active_sessions]
-        })
+        return active_sessions_response(request.args)
     except Exception as e:
         current_app.logger.error(f"Active sessions error: {str(e)}")
         return jsonify({'status': 'error', 'message': 'Failed to get active sessions', 'code': 500}), 500
@@ -236,23 +229,20 @@ def get_active_sessions():
 @api_dashboard_bp.route('/reports/daily')
 @limiter.limit("60 per minute")
 @token_required
-def get_daily_report():
+def get_daily_report(current_user):
     try:
         today = datetime.now().date()
         
-        # Get daily transactions
-        transactions = ParkingTransactions.query\
-            .filter(func.date(ParkingTransactions.created_at) == today)\
-            .all()
-        
-        total_revenue = sum(t.amount for t in transactions)
+        # Get daily totals from the hourly rollup
+        start = datetime.combine(today, datetime.min.time())
+        totals = rollup_totals(start, start + timedelta(days=1))
         
         return jsonify({
             'status': 'success',
             'data': {
                 'date': today.isoformat(),
-                'total_revenue': float(total_revenue),
-                'transaction_count': len(transactions)
+                'total_revenue': totals['Revenue'],
+                'transaction_count': totals['Transactions']
             }
         })
     except Exception as e:
@@ -263,19 +253,34 @@ def get_daily_report():
 @api_vehicles_bp.route('')
 @limiter.limit("60 per minute")
 @token_required
-def get_vehicles():
+def get_vehicles(current_user):
     try:
-        vehicles = Vehicles.query.all()
+        cursor, per_page, total = page_args(request.args)
+        try:
+            page = ParkingService.search_vehicles(
+                search=request.args.get('search'),
+                vehicle_type=request.args.get('type') or None,
+                status=request.args.get('status') or None,
+                cursor=cursor,
+                limit=per_page,
+                total=total
+            )
+        except ValueError as e:
+            return jsonify({'message': str(e), 'error': 'BadRequest', 'code': 400}), 400
+        
+        entry_times = page['entry_times']
         return jsonify({
             'status': 'success',
             'data': {
-                'total': len(vehicles),
                 'vehicles': [{
                     'id': vehicle.Id,
                     'plate_number': vehicle.plate_number,
                     'vehicle_type': vehicle.vehicle_type,
-                    'is_parked': vehicle.IsParked
-                } for vehicle in vehicles]
+                    'status': vehicle.status,
+                    'is_parked': str(vehicle.Id) in entry_times,
+                    'entry_time': entry_times[str(vehicle.Id)].isoformat() if str(vehicle.Id) in entry_times else None
+                } for vehicle in page['items']],
+                'pagination': pagination_info(page, per_page)
             }
         })
     except Exception as e:
@@ -289,8 +294,9 @@ def get_vehicles():
 def get_dashboard():
     try:
         # Get overview statistics
-        total_spaces = ParkingSpaces.query.count()
-        occupied_spaces = ParkingSpaces.query.filter_by(IsOccupied=True).count()
+        spaces = occupancy_counts()
+        total_spaces = spaces['Total']
+        occupied_spaces = spaces['Occupied']
         total_vehicles = Vehicles.query.count()
         active_sessions = ParkingTickets.query.filter_by(Status='active').count()
         
@@ -326,29 +332,21 @@ def get_dashboard():
 @api_stats_bp.route('', methods=['GET'])
 @limiter.limit("120 per minute")
 @token_required
-def get_realtime_stats():
+def get_realtime_stats(current_user):
     try:
         now = datetime.utcnow()
         hour_ago = now - timedelta(hours=1)
         
-        # Get hourly statistics
-        hourly_entries = ParkingTickets.query\
-            .filter(ParkingTickets.EntryTime >= hour_ago)\
-            .count()
-            
-        hourly_exits = ParkingTickets.query\
-            .filter(ParkingTickets.ExitTime >= hour_ago)\
-            .count()
-            
-        hourly_revenue = db.session.query(func.sum(ParkingTransactions.amount))\
-            .filter(ParkingTransactions.created_at >= hour_ago)\
-            .scalar() or 0
+        # Get hourly statistics from the rollup, whole hours since an hour ago
+        hourly = rollup_totals(hour_start(hour_ago), hour_start(now) + timedelta(hours=1))
+        hourly_entries = hourly['Entries']
+        hourly_exits = hourly['Exits']
+        hourly_revenue = hourly['Revenue']
         
-        # Get space utilization
-        total_spaces = ParkingSpaces.query.count()
-        occupied_spaces = ParkingSpaces.query.filter(
-            ParkingSpaces.Status != 'available'
-        ).count()
+        # Get space utilization from the occupancy counters
+        spaces = occupancy_counts()
+        total_spaces = spaces['Total']
+        occupied_spaces = total_spaces - spaces['Available']
         
         return jsonify({
             'status': 'success',
@@ -488,6 +486,7 @@ def create_parking_rate():
         new_rate = ParkingRate(**rate_data)
         db.session.add(new_rate)
         db.session.commit()
+        reload_tariff_table()
 
         # Log activity
         activity_data = {
@@ -542,6 +541,7 @@ def update_parking_rate(rate_id):
         rate.IsActive = data.get('is_active', True)
         
         db.session.commit()
+        reload_tariff_table()
         
         # Log activity
         activity_data = {
@@ -595,6 +595,7 @@ def delete_parking_rate(rate_id):
         db.session.delete(rate)
         db.session.add(activity)
         db.session.commit()
+        reload_tariff_table()
         
         return jsonify({
             'status': 'success',
@@ -664,22 +665,123 @@ def get_system_health():
         current_app.logger.error(f"System health error: {str(e)}")
         return jsonify({'message': str(e), 'error': 'InternalError', 'code': 500}), 500
 
+@api_dashboard_bp.route('/occupancy')
+@limiter.limit("60 per minute")
+@token_required
+def get_occupancy(current_user):
+    """Vehicles inside over time, optionally per vehicle type, level or section"""
+    try:
+        now = datetime.now()
+        try:
+            start = datetime.fromisoformat(request.args['start']) if request.args.get('start') \
+                else now.replace(hour=0, minute=0, second=0, microsecond=0)
+            end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else now
+            series = occupancy_series(
+                start, end,
+                resolution=request.args.get('resolution', type=int),
+                group_by=request.args.get('by') or None
+            )
+        except ValueError as e:
+            return jsonify({'message': str(e), 'error': 'BadRequest', 'code': 400}), 400
+        
+        return jsonify({
+            'status': 'success',
+            'data': series
+        })
+    except Exception as e:
+        current_app.logger.error(f"Occupancy error: {str(e)}")
+        return jsonify({'message': str(e), 'error': 'InternalError', 'code': 500}), 500
+
+@api_dashboard_bp.route('/occupancy/current')
+@limiter.limit("600 per minute")
+@token_required
+def get_current_occupancy(current_user):
+    """Space counts for the display board, optionally for one level, section or vehicle type"""
+    try:
+        counts = occupancy_counts(
+            level=request.args.get('level'),
+            section=request.args.get('section'),
+            vehicle_type=request.args.get('vehicle_type')
+        )
+        data = {name.lower(): value for name, value in counts.items()}
+        if request.args.get('groups') == 'true':
+            data['groups'] = occupancy_groups()
+        return jsonify({
+            'status': 'success',
+            'data': data
+        })
+    except Exception as e:
+        current_app.logger.error(f"Current occupancy error: {str(e)}")
+        return jsonify({'message': str(e), 'error': 'InternalError', 'code': 500}), 500
+
+@api_dashboard_bp.route('/snapshot')
+@limiter.limit("120 per minute")
+@token_required
+def get_snapshot(current_user):
+    """
+    Every dashboard widget in one response, shared by all users
+
+    The snapshot is rebuilt at most once per DASHBOARD_SNAPSHOT_SECONDS, or
+    sooner after a dashboard event; clients revalidate with If-None-Match.
+    """
+    try:
+        snapshot = get_snapshot_cache().get(
+            current_app.config.get('DASHBOARD_SNAPSHOT_SECONDS', 5),
+            lambda: {'status': 'success', 'data': build_snapshot()}
+        )
+        return conditional_response(snapshot.body, snapshot.etag)
+    except Exception as e:
+        current_app.logger.error(f"Snapshot error: {str(e)}")
+        return jsonify({'message': str(e), 'error': 'InternalError', 'code': 500}), 500
+
+@api_dashboard_bp.route('/events')
+@limiter.limit("120 per minute")
+@token_required
+def get_events(current_user):
+    """
+    Server-Sent Events for entries, exits, payments and hardware changes
+
+    Pages share one subscription; a reconnecting client sends
+    Last-Event-ID to resume on any worker, or is sent 'reset' if it has to
+    reload. Each stream stays open for EVENTS_STREAM_SECONDS and holds a
+    worker meanwhile; with 0 it answers at once and the client comes back
+    after EVENTS_RETRY_SECONDS.
+    """
+    config = current_app.config
+    resume_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    # The stream opens its own app contexts, so the request's DB session is released
+    stream = event_stream(
+        current_app._get_current_object(),
+        get_event_log(),
+        resume_id,
+        coalesce=config.get('EVENTS_COALESCE_SECONDS', 0.5),
+        heartbeat=config.get('EVENTS_HEARTBEAT_SECONDS', 15),
+        lifetime=config.get('EVENTS_STREAM_SECONDS', 300),
+        poll=config.get('EVENTS_POLL_SECONDS', 1),
+        retry=config.get('EVENTS_RETRY_SECONDS', 3)
+    )
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @api_dashboard_bp.route('/notifications')
 @limiter.limit("60 per minute")
 @token_required
-def get_notifications():
+def get_notifications(current_user):
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        cursor, per_page, total = page_args(request.args)
         read = request.args.get('read', None)
         
         query = ActivityLog.query
         if read is not None:
             query = query.filter_by(IsRead=read == 'true')
             
-        notifications = query\
-            .order_by(ActivityLog.CreatedAt.desc())\
-            .paginate(page=page, per_page=per_page)
+        try:
+            notifications = keyset_page(query, ActivityLog.CreatedAt, ActivityLog.Id,
+                                        cursor=cursor, limit=per_page, total=total)
+        except ValueError as e:
+            return jsonify({'message': str(e), 'error': 'BadRequest', 'code': 400}), 400
             
         unread_count = ActivityLog.query.filter_by(IsRead=False).count()
         
@@ -691,15 +793,10 @@ def get_notifications():
                     'type': notification.Action,
                     'message': notification.Details,
                     'read': notification.IsRead,
-                    'timestamp': notification.CreatedAt.isoformat()
-                } for notification in notifications.items],
+                    'timestamp': notification.CreatedAt.isoformat() if notification.CreatedAt else None
+                } for notification in notifications['items']],
                 'unread_count': unread_count,
-                'pagination': {
-                    'total': notifications.total,
-                    'pages': notifications.pages,
-                    'current_page': notifications.page,
-                    'per_page': notifications.per_page
-                }
+                'pagination': pagination_info(notifications, per_page)
             }
         })
     except Exception as e:
@@ -753,10 +850,9 @@ def get_alerts():
 @api_dashboard_bp.route('/audit')
 @limiter.limit("60 per minute")
 @token_required
-def get_audit_logs():
+def get_audit_logs(current_user):
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        cursor, per_page, total = page_args(request.args)
         user_id = request.args.get('user_id', None)
         action = request.args.get('action', None)
         start_date = request.args.get('start_date', None)
@@ -772,25 +868,33 @@ def get_audit_logs():
         if end_date:
             query = query.filter(ActivityLog.CreatedAt <= end_date)
             
-        audit_logs = query\
-            .order_by(ActivityLog.CreatedAt.desc())\
-            .paginate(page=page, per_page=per_page)
+        try:
+            audit_logs = keyset_page(query, ActivityLog.CreatedAt, ActivityLog.Id,
+                                     cursor=cursor, limit=per_page, total=total)
+        except ValueError as e:
+            return jsonify({'message': str(e), 'error': 'BadRequest', 'code': 400}), 400
+        
+        # Resolve user names for this page only
+        user_ids = {log.UserId for log in audit_logs['items'] if log.UserId}
+        usernames = {
+            user.Id: user.UserName
+            for user in AspNetUsers.query.filter(AspNetUsers.Id.in_(user_ids)).all()
+        } if user_ids else {}
         
         return jsonify({
             'status': 'success',
             'data': {
                 'entries': [{
-                    'id': log.id,
+                    'id': log.Id,
                     'user_id': log.UserId,
-                    'username': log.UserName,
+                    'username': usernames.get(log.UserId),
                     'action': log.Action,
-                    'resource': log.Resource,
-                    'resource_id': log.ResourceId,
+                    'status': log.Status,
                     'details': log.Details,
-                    'timestamp': log.CreatedAt.isoformat(),
+                    'timestamp': log.CreatedAt.isoformat() if log.CreatedAt else None,
                     'ip_address': log.IpAddress
-                } for log in audit_logs.items],
-                'total': audit_logs.total
+                } for log in audit_logs['items']],
+                'pagination': pagination_info(audit_logs, per_page)
             }
         })
     except Exception as e:
@@ -800,30 +904,28 @@ def get_audit_logs():
 @api_dashboard_bp.route('/activities')
 @limiter.limit("60 per minute")
 @token_required
-def get_dashboard_activities():
+def get_dashboard_activities(current_user):
     try:
-        page = request.args.get('page', 1, type=int)
+        cursor, _, total = page_args(request.args)
         per_page = request.args.get('per_page', 5, type=int)
         
-        activities = ActivityLog.query\
-            .order_by(ActivityLog.CreatedAt.desc())\
-            .paginate(page=page, per_page=per_page)
+        try:
+            activities = keyset_page(ActivityLog.query, ActivityLog.CreatedAt, ActivityLog.Id,
+                                     cursor=cursor, limit=per_page, total=total)
+        except ValueError as e:
+            return jsonify({'message': str(e), 'error': 'BadRequest', 'code': 400}), 400
         
         return jsonify({
             'status': 'success',
             'data': {
                 'activities': [{
-                    'id': activity.id,
+                    'id': activity.Id,
                     'action': activity.Action,
                     'details': activity.Details,
                     'status': activity.Status,
-                    'created_at': activity.CreatedAt.isoformat()
-                } for activity in activities.items],
-                'pagination': {
-                    'page': activities.page,
-                    'pages': activities.pages,
-                    'total': activities.total
-                }
+                    'created_at': activity.CreatedAt.isoformat() if activity.CreatedAt else None
+                } for activity in activities['items']],
+                'pagination': pagination_info(activities, per_page)
             }
         })
     except Exception as e:
@@ -915,7 +1017,7 @@ def create_session(current_user):
 
         # Create new session using setattr
         session = ParkingTickets()
-        setattr(session, 'TicketNumber', str(uuid.uuid4())[:8].upper())
+        setattr(session, 'TicketNumber', generate_ticket_number())
         setattr(session, 'VehicleId', vehicle_id)
         setattr(session, 'SpaceId', parking_space_id)
         setattr(session, 'EntryTime', datetime.utcnow())
@@ -927,7 +1029,9 @@ def create_session(current_user):
             space.IsOccupied = True
             
             db.session.add(session)
+            record_entry(session.EntryTime, vehicle.vehicle_type)
             db.session.commit()
+            index_ticket_entry(session, vehicle)
 
             return jsonify({
                 'status': 'success',
@@ -956,7 +1060,7 @@ def create_session(current_user):
 
 @api_dashboard_bp.route('/parking-sessions/<ticket_number>/end', methods=['POST'])
 @token_required
-def end_session(ticket_number):
+def end_session(current_user, ticket_number):
     try:
         session = ParkingTickets.query.filter_by(TicketNumber=ticket_number).first()
         if not session:
@@ -966,7 +1070,7 @@ def end_session(ticket_number):
                 'code': 404
             }), 404
             
-        if not session.IsActive:
+        if session.Status != 'active':
             return jsonify({
                 'status': 'error',
                 'message': 'Session is already ended',
@@ -976,9 +1080,7 @@ def end_session(ticket_number):
         # Calculate duration and amount
         exit_time = datetime.utcnow()
         duration = exit_time - session.EntryTime
-        hours = duration.total_seconds() / 3600
         
-        # Get parking rate
         vehicle = Vehicles.query.get(session.VehicleId)
         if not vehicle:
             return jsonify({
@@ -987,29 +1089,20 @@ def end_session(ticket_number):
                 'code': 404
             }), 404
             
-        rate = ParkingRate.query.filter_by(
-            vehicle_type=vehicle.vehicle_type,
-            is_active=True
-        ).first()
+        amount = quote_fee(session.EntryTime, exit_time, vehicle.vehicle_type)
         
-        if not rate:
-            # Use default rate if no specific rate found
-            amount = 10000  # Default amount (e.g., 10,000 IDR)
-        else:
-            # Calculate amount
-            base_fee = float(rate.BaseRate)
-            additional_fee = float(rate.AdditionalRate) if rate.AdditionalRate else 0
-            amount = base_fee + (max(0, hours - rate.BaseDuration) * additional_fee)
-        
-        # Update session
-        session.ExitTime = exit_time
-        session.IsActive = False
-        session.Amount = amount
-        
-        # Update parking space
-        space = ParkingSpaces.query.get(session.SpaceId)
-        if space:
-            space.IsOccupied = False
+        # Update session; only one lane can close the ticket
+        minutes = int(duration.total_seconds() // 60)
+        closed = ParkingService.close_ticket(session.Id, exit_time, amount, minutes)
+        index_ticket_exit(session.TicketNumber)
+        if not closed:
+            db.session.rollback()
+            return jsonify({
+                'status': 'error',
+                'message': 'Session is already ended',
+                'code': 409
+            }), 409
+        record_exit(exit_time, vehicle.vehicle_type, minutes)
             
         # Update vehicle status
         if vehicle:
@@ -1036,6 +1129,69 @@ def end_session(ticket_number):
             'code': 500
         }), 500
 
+@api_dashboard_bp.route('/parking-sessions/bulk-end', methods=['POST'])
+@limiter.limit("10 per minute")
+@token_required
+def bulk_end_sessions(current_user):
+    """Close many active sessions at once (lost tickets, end-of-day sweeps)"""
+    try:
+        data = request.get_json() or {}
+        ticket_numbers = data.get('ticketNumbers') or None
+        older_than_hours = data.get('olderThanHours')
+        vehicle_type = data.get('vehicleType')
+
+        # Refuse to close every active session by accident
+        if not ticket_numbers and older_than_hours is None and not vehicle_type:
+            return jsonify({
+                'status': 'error',
+                'message': 'At least one of ticketNumbers, olderThanHours or vehicleType is required',
+                'code': 400
+            }), 400
+        if ticket_numbers is not None and not isinstance(ticket_numbers, list):
+            return jsonify({
+                'status': 'error',
+                'message': 'ticketNumbers must be a list',
+                'code': 400
+            }), 400
+
+        try:
+            older_than_hours = float(older_than_hours) if older_than_hours is not None else None
+            chunk_size = min(max(int(data.get('chunkSize', 500)), 50), 1000)
+        except (TypeError, ValueError):
+            return jsonify({
+                'status': 'error',
+                'message': 'olderThanHours and chunkSize must be numbers',
+                'code': 400
+            }), 400
+
+        result = ParkingService.bulk_close_tickets(
+            ticket_numbers=ticket_numbers,
+            older_than_hours=older_than_hours,
+            vehicle_type=vehicle_type,
+            payment_method=data.get('paymentMethod', 'cash'),
+            user_id=current_user.Id,
+            chunk_size=chunk_size,
+            dry_run=bool(data.get('dryRun', False))
+        )
+        logger.info(
+            f"Bulk close by {current_user.Id}: {result['closed']} closed, "
+            f"{result['failed']} failed, {result['tickets_per_second']} tickets/sec"
+        )
+
+        return jsonify({
+            'status': 'success',
+            'data': result,
+            'message': 'Bulk close completed' if not result['failed'] else 'Bulk close completed with failures'
+        })
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk end sessions error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to end sessions',
+            'code': 500
+        }), 500
+
 @api_dashboard_bp.route('/recent-vehicles', methods=['GET'])
 @limiter.limit("60 per minute")
 @token_required
@@ -1162,6 +1318,7 @@ def update_rate_settings(current_user):
 
         # Commit transaction
         db.session.commit()
+        reload_tariff_table()
         return jsonify({
             'message': f'Rate settings {action.lower()} successfully',
             'rate': {
@@ -1336,6 +1493,7 @@ def delete_rate_setting(current_user, rate_id):
         db.session.add(activity_log)
         
         db.session.commit()
+        reload_tariff_table()
         return jsonify({'message': 'Rate setting deleted successfully'}), 200
         
     except Exception as e:
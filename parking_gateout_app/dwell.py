@@ -0,0 +1,84 @@
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Quantiles come back within 1% of the true stay length
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def dwell_bucket(minutes: Optional[float]) -> int:
+    """
+    Sketch bucket of a stay length
+
+    Bucket 0 holds stays under a minute; bucket i > 0 holds stays in
+    (GAMMA^(i-2), GAMMA^(i-1)] minutes, so every bucket spans the same
+    relative width and the number of buckets only grows with the log of
+    the longest stay.
+    """
+    if not minutes or minutes < 1:
+        return 0
+    return 1 + math.ceil(math.log(minutes) / _LOG_GAMMA)
+
+
+def bucket_values(buckets: np.ndarray) -> np.ndarray:
+    """Representative stay length of each bucket, within RELATIVE_ACCURACY of its members"""
+    buckets = np.asarray(buckets, dtype=np.float64)
+    values = 2 * GAMMA ** (buckets - 1) / (GAMMA + 1)
+    return np.where(buckets > 0, values, 0.0)
+
+
+class DwellSketch:
+    """
+    Mergeable quantile sketch of stay lengths
+
+    A log-bucketed histogram: adding and merging are count additions, so
+    sketches stored per hour can be summed over any range, and quantiles
+    are read from the cumulative counts.
+    """
+
+    def __init__(self, counts: Optional[Dict[int, int]] = None):
+        self.counts: Dict[int, int] = dict(counts or {})
+
+    def add(self, minutes: Optional[float], count: int = 1) -> None:
+        bucket = dwell_bucket(minutes)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+    def merge(self, other: 'DwellSketch') -> 'DwellSketch':
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        return self
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    def quantiles(self, qs: Sequence[float] = DEFAULT_QUANTILES) -> List[Optional[float]]:
+        """
+        Estimated stay lengths at the given quantiles
+
+        Args:
+            qs: Quantiles between 0 and 1
+
+        Returns:
+            List: Minutes per quantile, or None for each if the sketch is empty
+        """
+        if not self.counts:
+            return [None] * len(qs)
+        buckets = np.array(sorted(self.counts), dtype=np.int64)
+        cumulative = np.cumsum([self.counts[bucket] for bucket in buckets])
+        ranks = np.asarray(qs, dtype=np.float64) * (cumulative[-1] - 1)
+        positions = np.searchsorted(cumulative, ranks, side='right')
+        return [round(float(value), 1) for value in bucket_values(buckets[positions])]
+
+
+def sketches_from_rows(rows: Iterable[Tuple]) -> Dict[Tuple, DwellSketch]:
+    """Build sketches from (group..., bucket, count) rows"""
+    sketches: Dict[Tuple, DwellSketch] = {}
+    for *group, bucket, count in rows:
+        sketch = sketches.setdefault(tuple(group), DwellSketch())
+        sketch.counts[bucket] = sketch.counts.get(bucket, 0) + int(count)
+    return sketches
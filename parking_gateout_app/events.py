@@ -0,0 +1,394 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import itertools
+import json
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from flask import Flask, current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from .models import DashboardEvents, HardwareStatus, db
+
+EVENT_TYPES = ('entry', 'exit', 'payment', 'hardware')
+# Most recent events sent along with the per-type counts of a batch
+MAX_BATCH_EVENTS = 50
+# Events read from the log at a time
+MAX_READ_EVENTS = 1000
+# Events of the log's tail kept in memory for this process's open streams
+MAX_MIRROR_EVENTS = 5000
+# Seconds between deletions of old events by one process
+PRUNE_INTERVAL = 60
+# Seconds a missing event ID may still belong to an uncommitted transaction
+SETTLE_SECONDS = 10
+
+
+class Event(NamedTuple):
+    id: int
+    type: str
+    data: Dict[str, Any]
+
+
+class _Row(NamedTuple):
+    id: int
+    type: str
+    data: Optional[Dict[str, Any]]
+    created_at: datetime
+
+
+class Cursor(NamedTuple):
+    """
+    How far a client has read the event log
+
+    Event IDs are taken when the row is inserted, so transactions can
+    commit out of ID order and a rolled-back one leaves a gap. Every event
+    up to `settled` has been sent or given up on; `sent` lists the events
+    after it that were sent while an earlier ID was still missing.
+    """
+    settled: int
+    sent: Tuple[int, ...]
+    issued: float  # time.time() when the cursor was handed out
+
+    def format(self) -> str:
+        return f"{self.settled}:{','.join(str(event_id) for event_id in self.sent)}:{int(self.issued)}"
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> Optional['Cursor']:
+        """The cursor in a Last-Event-ID, or None if it is not one"""
+        parts = (value or '').split(':')
+        if len(parts) != 3 or not parts[0].isdigit() or not parts[2].isdigit():
+            return None
+        sent = parts[1].split(',') if parts[1] else []
+        if not all(event_id.isdigit() for event_id in sent):
+            return None
+        return cls(int(parts[0]), tuple(int(event_id) for event_id in sent), float(parts[2]))
+
+
+def _advance(rows: Iterable[_Row], cursor: Cursor) -> Tuple[List[Event], Cursor]:
+    """
+    Events in rows not sent yet, and the cursor after them
+
+    Args:
+        rows: Every known row after cursor.settled, by ID
+
+    A missing ID holds `settled` back until the row after it is
+    SETTLE_SECONDS old: its transaction inserted before that row did, so by
+    then it has rolled back.
+    """
+    sent = set(cursor.sent)
+    settled = cursor.settled
+    cutoff = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+    events = []
+    held = False
+    for row in rows:
+        if row.id <= settled:
+            continue
+        if row.id not in sent:
+            events.append(Event(row.id, row.type, row.data or {}))
+            sent.add(row.id)
+        if not held and (row.id == settled + 1 or row.created_at <= cutoff):
+            settled = row.id
+        else:
+            held = True
+    return events, Cursor(settled, tuple(sorted(event_id for event_id in sent if event_id > settled)), time.time())
+
+
+class EventLog:
+    """
+    Committed entries, exits, payments and hardware changes, shared by
+    every process through the dashboard_events table
+
+    Events are written in the same transaction as the change they describe,
+    so every worker serves the same feed and a client can resume on any
+    worker with its cursor. Events older than EVENTS_KEEP_SECONDS are
+    pruned; a client whose cursor is about that old is told to reload
+    instead. While streams are open one thread per process polls the log
+    and keeps its tail in memory, so open streams cost no queries; commits
+    made in this process make it poll at once. Reading needs an app context.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+        self._pruned_at = 0.0
+        self._followers = 0
+        self._polling = False
+        self._version = 0  # bumped whenever the mirror gains rows
+        self._mirror: List[_Row] = []
+        self._mirror_floor: Optional[int] = None  # every row after this is mirrored once polled
+        self._mirror_cursor: Optional[Cursor] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def latest_id(self) -> int:
+        return db.session.execute(db.select(func.max(DashboardEvents.Id))).scalar() or 0
+
+    def _settled_id(self) -> int:
+        """An ID that every transaction before it has committed or rolled back by now"""
+        cutoff = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+        return db.session.execute(
+            db.select(func.max(DashboardEvents.Id)).where(DashboardEvents.CreatedAt <= cutoff)
+        ).scalar() or 0
+
+    def _fetch(self, after: int) -> List[_Row]:
+        return [_Row(*row) for row in db.session.execute(
+            db.select(DashboardEvents.Id, DashboardEvents.Type, DashboardEvents.Data, DashboardEvents.CreatedAt)
+            .where(DashboardEvents.Id > after)
+            .order_by(DashboardEvents.Id)
+            .limit(MAX_READ_EVENTS)
+        )]
+
+    def start(self) -> Cursor:
+        """A cursor past every committed event, for a client about to load its state"""
+        settled = self._settled_id()
+        return _advance(self._fetch(settled), Cursor(settled, (), time.time()))[1]
+
+    def read(self, cursor: Cursor) -> Tuple[Optional[List[Event]], Cursor]:
+        """
+        Events after a cursor, oldest first and at most MAX_READ_EVENTS
+
+        Returns:
+            Tuple: The events, or None if some of them may have been pruned,
+            and the cursor after them
+        """
+        keep = current_app.config.get('EVENTS_KEEP_SECONDS', 3600)
+        if time.time() - cursor.issued > keep - SETTLE_SECONDS:
+            return None, cursor
+        with self._condition:
+            mirrored = self._mirror_floor is not None and cursor.settled >= self._mirror_floor
+            if mirrored:
+                rows = [row for row in self._mirror if row.id > cursor.settled]
+        if not mirrored:
+            rows = self._fetch(cursor.settled)
+        return _advance(rows, cursor)
+
+    def wait(self, version: int, timeout: float) -> bool:
+        """Block until the mirror gains rows after `version`, or the timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version > version, timeout)
+
+    def notify(self) -> None:
+        """Have the poller read the log now, after a commit in this process"""
+        self._wake.set()
+
+    def follow(self, app: Flask, poll: float) -> None:
+        """Keep the tail of the log in memory until unfollow(); starts the poller"""
+        with self._condition:
+            self._followers += 1
+            if self._polling:
+                return
+            self._polling = True
+        threading.Thread(target=self._poll, args=(app, poll), daemon=True).start()
+
+    def unfollow(self) -> None:
+        with self._condition:
+            self._followers -= 1
+
+    def _poll(self, app: Flask, interval: float) -> None:
+        while True:
+            with app.app_context():
+                try:
+                    self._refresh()
+                except Exception as e:
+                    app.logger.warning(f"Could not read dashboard events: {str(e)}")
+                finally:
+                    db.session.remove()
+            with self._condition:
+                if not self._followers:
+                    # Nobody is listening: drop the mirror, the next stream starts afresh
+                    self._polling = False
+                    self._mirror, self._mirror_floor, self._mirror_cursor = [], None, None
+                    return
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def _refresh(self) -> None:
+        """Add rows committed since the last poll to the mirror"""
+        with self._condition:
+            cursor = self._mirror_cursor
+        floor = None
+        if cursor is None:
+            floor = self._settled_id()
+            cursor = Cursor(floor, (), time.time())
+        rows = self._fetch(cursor.settled)
+        _, cursor = _advance(rows, cursor)
+        with self._condition:
+            if floor is not None:
+                self._mirror, self._mirror_floor = [], floor
+            known = {row.id for row in self._mirror}
+            added = [row for row in rows if row.id not in known]
+            if added:
+                self._mirror = sorted(self._mirror + added, key=lambda row: row.id)
+                excess = len(self._mirror) - MAX_MIRROR_EVENTS
+                if excess > 0:
+                    dropped = [row for row in self._mirror[:excess] if row.id <= cursor.settled]
+                    if dropped:
+                        self._mirror = self._mirror[len(dropped):]
+                        self._mirror_floor = dropped[-1].id
+                self._version += 1
+                self._condition.notify_all()
+            self._mirror_cursor = cursor
+
+    def write(self, session: Session, events: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Insert events in the session's transaction, pruning old ones now and then"""
+        now = datetime.utcnow()
+        connection = session.connection()
+        connection.execute(DashboardEvents.__table__.insert(), [
+            {'Type': event_type, 'Data': data, 'CreatedAt': now} for event_type, data in events
+        ])
+        if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+            self._pruned_at = time.monotonic()
+            keep = timedelta(seconds=current_app.config.get('EVENTS_KEEP_SECONDS', 3600))
+            connection.execute(DashboardEvents.__table__.delete().where(DashboardEvents.CreatedAt < now - keep))
+
+
+_log = EventLog()
+
+
+def get_event_log() -> EventLog:
+    return _log
+
+
+def _message(cursor: Cursor, event_type: str, data: Dict[str, Any]) -> str:
+    return f"id: {cursor.format()}\nevent: {event_type}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+def _change(cursor: Cursor, events: List[Event]) -> str:
+    return _message(cursor, 'change', {
+        'counts': dict(Counter(item.type for item in events)),
+        'events': [{'type': item.type, **item.data} for item in events[-MAX_BATCH_EVENTS:]]
+    })
+
+
+def event_stream(app: Flask, log: EventLog, resume_id: Optional[str], coalesce: float = 0.5,
+                 heartbeat: float = 15, lifetime: float = 300, poll: float = 1,
+                 retry: float = 3) -> Iterator[str]:
+    """
+    Server-Sent Events for a client
+
+    The stream stays open for its lifetime and sends events in batches:
+    once one arrives it waits for the coalescing window so a burst of exits
+    becomes a single 'change' message and a single refresh on the client.
+    Comments are sent as heartbeats, and the browser reconnects with its
+    cursor when the stream ends. This holds a worker for the whole
+    lifetime, so it needs a threaded or async server; with no lifetime the
+    stream sends what happened since the cursor and ends at once, and the
+    browser comes back after `retry` seconds instead.
+
+    Args:
+        app: The app, for the DB reads made while streaming
+        log: The event log
+        resume_id: Last-Event-ID sent by a reconnecting client
+        coalesce: Seconds to collect events before sending them
+        heartbeat: Seconds between keep-alive comments
+        lifetime: Seconds before the stream is closed; 0 to close it at once
+        poll: Seconds between reads of the log by this process's poller
+        retry: Seconds the client waits before reconnecting to a closed stream
+
+    Yields:
+        str: SSE messages
+    """
+    yield f'retry: {int((retry if lifetime <= 0 else 1) * 1000)}\n\n'
+    with app.app_context():
+        cursor = Cursor.parse(resume_id)
+        if cursor is not None and cursor.settled > log.latest_id():
+            cursor = None  # issued for another database
+        events = None
+        if cursor is not None:
+            events, cursor = log.read(cursor)
+        if events is None:
+            # Unknown or expired cursor: the client has to reload its state
+            cursor = log.start()
+    if events is None:
+        yield _message(cursor, 'reset' if resume_id else 'ready', {})
+    elif events:
+        yield _change(cursor, events)
+    else:
+        # A bare ID still moves the client's cursor on, so a quiet hour does not expire it
+        yield f'id: {cursor.format()}\n\n'
+    if lifetime <= 0:
+        return
+
+    log.follow(app, poll)
+    try:
+        deadline = time.monotonic() + lifetime
+        quiet_since = time.monotonic()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            version = log.version
+            with app.app_context():
+                events, cursor = log.read(cursor)
+                if events:
+                    time.sleep(coalesce)
+                    more, cursor = log.read(cursor)
+                    events = None if more is None else events + more
+                if events is None:
+                    cursor = log.start()
+            if events is None:
+                yield _message(cursor, 'reset', {})
+            elif events:
+                yield _change(cursor, events)
+            elif time.monotonic() - quiet_since >= heartbeat:
+                yield f'id: {cursor.format()}\n: keep-alive\n\n'
+            else:
+                log.wait(version, min(heartbeat - (time.monotonic() - quiet_since), remaining))
+                continue
+            quiet_since = time.monotonic()
+    finally:
+        log.unfollow()
+
+
+def queue_event(session: Session, event_type: str, data: Dict[str, Any]) -> None:
+    """
+    Add an event to the log in the session's transaction, so streams see
+    it once the session commits; it is dropped on rollback
+
+    Args:
+        session: The session the change was made in
+        event_type: One of EVENT_TYPES
+        data: JSON-serialisable details
+    """
+    session.info.setdefault('pending_events', []).append((event_type, data))
+
+
+@event.listens_for(Session, 'after_flush')
+def _queue_hardware_changes(session: Session, flush_context: Any) -> None:
+    for instance in itertools.chain(session.new, session.dirty):
+        if isinstance(instance, HardwareStatus) and session.is_modified(instance):
+            queue_event(session, 'hardware', {
+                'device_id': instance.DeviceId,
+                'device_type': instance.DeviceType,
+                'status': instance.Status,
+                'time': (instance.LastPing or datetime.now()).isoformat()
+            })
+    _write_pending(session)
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_before_commit(session: Session) -> None:
+    _write_pending(session)
+
+
+def _write_pending(session: Session) -> None:
+    events = session.info.pop('pending_events', None)
+    if events:
+        _log.write(session, events)
+        session.info['wrote_events'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_streams(session: Session) -> None:
+    if session.info.pop('wrote_events', None):
+        _log.notify()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop('pending_events', None)
+    session.info.pop('wrote_events', None)
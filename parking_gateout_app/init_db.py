@@ -1,5 +1,6 @@
 from parking_gateout_app.app import create_app
 from parking_gateout_app.models import db, AspNetUsers, AspNetRoles, AspNetUserRoles, ParkingSpaces, Vehicles, ParkingTickets
+from parking_gateout_app.utils import generate_ticket_number
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
 import uuid
@@ -113,7 +114,7 @@ def init_db():
                     if space:
                         space.IsOccupied = True
                         ticket_data = {
-                            'TicketNumber': f'TKT{datetime.now().strftime("%Y%m%d%H%M%S")}{vehicle.Id}',
+                            'TicketNumber': generate_ticket_number(),
                             'VehicleId': vehicle.Id,
                             'SpaceId': space.Id,
                             'EntryTime': datetime.now() - timedelta(hours=2),
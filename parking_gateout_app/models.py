@@ -2,7 +2,7 @@ from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Numeric, ForeignKey, JSON, func, literal_column
 from sqlalchemy.ext.hybrid import hybrid_property
 
 db = SQLAlchemy()
@@ -117,6 +117,11 @@ class Shifts(db.Model):
 
 class Vehicles(db.Model):
     __tablename__ = 'Vehicles'
+    __table_args__ = (
+        db.Index('ix_vehicles_created_at_id', 'created_at', 'Id'),
+        db.Index('ix_vehicles_vehicle_type_created_at_id', 'vehicle_type', 'created_at', 'Id'),
+        db.Index('ix_vehicles_status_created_at_id', 'status', 'created_at', 'Id'),
+    )
     Id = db.Column(db.String(36), primary_key=True)
     plate_number = db.Column(db.String(20), unique=True, nullable=False)
     vehicle_type = db.Column(db.String(50), nullable=False)
@@ -124,6 +129,17 @@ class Vehicles(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+def normalized_plate(column):
+    """SQL form of utils.normalize_plate; literals keep it identical to the indexed expression"""
+    return func.upper(func.replace(func.replace(column, literal_column("' '"), literal_column("''")),
+                                   literal_column("'-'"), literal_column("''")))
+
+# Expression index for plate prefix search in any spacing or case; attached
+# explicitly because the table cannot be inferred from nested functions
+Vehicles.__table__.append_constraint(
+    db.Index('ix_vehicles_plate_normalized', normalized_plate(Vehicles.plate_number))
+)
+
 class ParkingSpaces(db.Model):
     Id = db.Column(db.Integer, primary_key=True)
     SpaceNumber = db.Column(db.String(10))
@@ -134,9 +150,14 @@ class ParkingSpaces(db.Model):
     Status = db.Column(db.String(20))  # available, maintenance, reserved
 
 class ParkingTickets(db.Model):
+    __table_args__ = (
+        db.Index('ix_parking_tickets_status_entry_time_id', 'Status', 'EntryTime', 'Id'),
+        db.Index('ix_parking_tickets_vehicle_id_status', 'VehicleId', 'Status'),
+        db.Index('ix_parking_tickets_entry_time', 'EntryTime'),
+    )
     Id = db.Column(db.Integer, primary_key=True)
     TicketNumber = db.Column(db.String(20), unique=True)
-    VehicleId = db.Column(db.Integer, db.ForeignKey('vehicles.Id'))
+    VehicleId = db.Column(db.Integer, db.ForeignKey('Vehicles.Id'))
     SpaceId = db.Column(db.Integer, db.ForeignKey('parking_spaces.Id'))
     EntryTime = db.Column(db.DateTime, default=datetime.utcnow)
     ExitTime = db.Column(db.DateTime)
@@ -147,15 +168,84 @@ class ParkingTickets(db.Model):
 
 class ParkingTransactions(db.Model):
     __tablename__ = 'ParkingTransactions'
+    __table_args__ = (db.Index('ix_parking_transactions_created_at_id', 'created_at', 'Id'),)
     Id = db.Column(db.String(36), primary_key=True)
-    ticket_id = db.Column(db.String(36), db.ForeignKey('ParkingTickets.Id'), nullable=False)
+    ticket_id = db.Column(db.String(36), db.ForeignKey('parking_tickets.Id'), nullable=False)
     transaction_number = db.Column(db.String(50), unique=True, nullable=False)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     payment_method = db.Column(db.String(50), nullable=False)
     status = db.Column(db.String(20), default='pending')
-    processed_by = db.Column(db.String(36), db.ForeignKey('AspNetUsers.Id'))
+    processed_by = db.Column(db.String(36), db.ForeignKey('asp_net_users.Id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class TicketNumberLeases(db.Model):
+    Id = db.Column(db.Integer, primary_key=True)
+    TerminalId = db.Column(db.String(50), nullable=False)
+    StartNumber = db.Column(db.BigInteger, unique=True, nullable=False)
+    EndNumber = db.Column(db.BigInteger, nullable=False)  # exclusive
+    CreatedAt = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ParkingHourlyStats(db.Model):
+    __tablename__ = 'parking_hourly_stats'
+    __table_args__ = (db.UniqueConstraint('Hour', 'VehicleType'),)
+    Id = db.Column(db.Integer, primary_key=True)
+    Hour = db.Column(db.DateTime, nullable=False)  # start of the hour
+    VehicleType = db.Column(db.String(50), nullable=False)
+    Entries = db.Column(db.Integer, nullable=False, default=0)  # no longer written, see rollup.ROLLUP_METRICS
+    Exits = db.Column(db.Integer, nullable=False, default=0)
+    DwellMinutes = db.Column(db.BigInteger, nullable=False, default=0)  # sum over exits
+    Transactions = db.Column(db.Integer, nullable=False, default=0)
+    Revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+class ParkingOccupancy(db.Model):
+    __tablename__ = 'parking_occupancy'
+    __table_args__ = (db.UniqueConstraint('Level', 'Section', 'VehicleType'),)
+    Id = db.Column(db.Integer, primary_key=True)
+    Level = db.Column(db.String(10), nullable=False, default='')  # '' for spaces without one
+    Section = db.Column(db.String(10), nullable=False, default='')
+    VehicleType = db.Column(db.String(50), nullable=False, default='')
+    Total = db.Column(db.Integer, nullable=False, default=0)
+    Occupied = db.Column(db.Integer, nullable=False, default=0)
+    Reserved = db.Column(db.Integer, nullable=False, default=0)
+    Maintenance = db.Column(db.Integer, nullable=False, default=0)
+    Available = db.Column(db.Integer, nullable=False, default=0)  # free and in service
+
+class ParkingDwellSketch(db.Model):
+    __tablename__ = 'parking_dwell_sketches'
+    __table_args__ = (db.UniqueConstraint('Hour', 'VehicleType', 'Bucket'),)
+    Id = db.Column(db.Integer, primary_key=True)
+    Hour = db.Column(db.DateTime, nullable=False)  # start of the exit hour
+    VehicleType = db.Column(db.String(50), nullable=False)
+    Bucket = db.Column(db.Integer, nullable=False)  # see dwell.dwell_bucket
+    Count = db.Column(db.Integer, nullable=False, default=0)
+
+class ParkingDwellMonthlySketch(db.Model):
+    __tablename__ = 'parking_dwell_monthly_sketches'
+    __table_args__ = (db.UniqueConstraint('Month', 'HourOfDay', 'VehicleType', 'Bucket'),)
+    Id = db.Column(db.Integer, primary_key=True)
+    Month = db.Column(db.DateTime, nullable=False)  # start of the exit month
+    HourOfDay = db.Column(db.Integer, nullable=False)
+    VehicleType = db.Column(db.String(50), nullable=False)
+    Bucket = db.Column(db.Integer, nullable=False)
+    Count = db.Column(db.Integer, nullable=False, default=0)
+
+class ReportInvalidations(db.Model):
+    __tablename__ = 'report_invalidations'
+    # AUTOINCREMENT so SQLite never reuses the Id of a pruned row
+    __table_args__ = ({'sqlite_autoincrement': True},)
+    Id = db.Column(db.Integer, primary_key=True)
+    Day = db.Column(db.Date, nullable=False)  # closed day whose reports went stale
+    CreatedAt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class DashboardEvents(db.Model):
+    __tablename__ = 'dashboard_events'
+    # AUTOINCREMENT so SQLite never reuses the Id of a pruned row
+    __table_args__ = ({'sqlite_autoincrement': True},)
+    Id = db.Column(db.Integer, primary_key=True)
+    Type = db.Column(db.String(20), nullable=False)  # see events.EVENT_TYPES
+    Data = db.Column(db.JSON)
+    CreatedAt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
 class HardwareStatus(db.Model):
     Id = db.Column(db.Integer, primary_key=True)
     DeviceId = db.Column(db.String(50))
@@ -168,11 +258,16 @@ class HardwareStatus(db.Model):
 
 class ActivityLog(db.Model):
     __tablename__ = 'ActivityLog'
+    __table_args__ = (
+        db.Index('ix_activity_log_created_at_id', 'CreatedAt', 'Id'),
+        db.Index('ix_activity_log_is_read_created_at_id', 'IsRead', 'CreatedAt', 'Id'),
+        db.Index('ix_activity_log_user_created_at_id', 'UserId', 'CreatedAt', 'Id'),
+    )
     Id = db.Column(db.Integer, primary_key=True)
     Action = db.Column(db.String(50), nullable=False)
     Details = db.Column(db.String(500))
     Status = db.Column(db.String(20), default='success')
-    UserId = db.Column(db.String(36), db.ForeignKey('AspNetUsers.Id'))
+    UserId = db.Column(db.String(36), db.ForeignKey('asp_net_users.Id'))
     IpAddress = db.Column(db.String(15))
     IsRead = db.Column(db.Boolean, default=False)
     CreatedAt = db.Column(db.DateTime, default=datetime.utcnow)
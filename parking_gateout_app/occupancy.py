@@ -0,0 +1,204 @@
+from datetime import date, datetime, timedelta
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import or_
+
+from .models import ParkingSpaces, ParkingTickets, Vehicles, db
+from .report_cache import CachedReport, ReportCache, cache_deadline, register_cache, sync_invalidations
+from .rollup import UNKNOWN_VEHICLE_TYPE
+
+MINUTES_PER_DAY = 24 * 60
+MAX_RANGE_DAYS = 366
+MAX_POINTS = 1440
+UNASSIGNED = 'Unassigned'
+
+GROUP_COLUMNS = {
+    'vehicle_type': Vehicles.vehicle_type,
+    'level': ParkingSpaces.Level,
+    'section': ParkingSpaces.Section
+}
+
+DayCurve = Tuple[List[str], np.ndarray]  # group labels, (groups x minutes) counts
+
+
+class _DayCurveCache(ReportCache):
+    """
+    Per-day occupancy curves for closed days
+
+    A late entry or exit changes who was inside on every later day too, so
+    a write to a past day invalidates that day and all the days after it.
+    """
+
+    def invalidate_days(self, days: Iterable[date]) -> int:
+        days = set(days)
+        if not days:
+            return 0
+        day, today = min(days), date.today()
+        while day < today:
+            days.add(day)
+            day += timedelta(days=1)
+        return super().invalidate_days(days)
+
+
+_curves = register_cache(_DayCurveCache(max_entries=2048))
+
+
+def _curve_key(day: date, group_by: Optional[str]) -> Tuple[str, Tuple[Tuple[str, Any], ...]]:
+    return ('occupancy', (('by', group_by or ''), ('day', day.isoformat())))
+
+
+def _minute_offsets(moments: np.ndarray, origin: datetime) -> np.ndarray:
+    """Minutes from origin to each moment, rounded up to the next whole minute"""
+    seconds = (moments - np.datetime64(origin, 's')).astype('timedelta64[s]').astype(np.int64)
+    return -(-seconds // 60)
+
+
+def _build_curves(start: datetime, end: datetime, group_by: Optional[str]) -> DayCurve:
+    """
+    Minute-by-minute occupancy over [start, end), which must be whole days
+
+    Each stay adds +1 at its entry minute and -1 at its exit minute; a
+    cumulative sum along the minutes then gives the number of vehicles
+    inside at the start of each minute. Stays still open count until now.
+    """
+    group = GROUP_COLUMNS.get(group_by)
+    columns = [ParkingTickets.EntryTime, ParkingTickets.ExitTime]
+    query = db.select(*columns, group if group is not None else db.literal(None))
+    if group_by == 'vehicle_type':
+        query = query.outerjoin(Vehicles, Vehicles.Id == ParkingTickets.VehicleId)
+    elif group is not None:
+        query = query.outerjoin(ParkingSpaces, ParkingSpaces.Id == ParkingTickets.SpaceId)
+    rows = db.session.execute(query.where(
+        ParkingTickets.EntryTime < end,
+        or_(ParkingTickets.ExitTime.is_(None), ParkingTickets.ExitTime > start),
+        or_(ParkingTickets.Status.is_(None), ParkingTickets.Status != 'cancelled')
+    )).all()
+
+    minutes = int((end - start).total_seconds() // 60)
+    if not rows:
+        return [], np.zeros((0, minutes), dtype=np.int32)
+
+    now = datetime.now()
+    entries = np.array([row[0] for row in rows], dtype='datetime64[s]')
+    exits = np.array([row[1] or now for row in rows], dtype='datetime64[s]')
+    default = {None: 'all', 'vehicle_type': UNKNOWN_VEHICLE_TYPE}.get(group_by, UNASSIGNED)
+    labels, codes = np.unique(np.array([row[2] or default for row in rows], dtype=str), return_inverse=True)
+
+    first = np.clip(_minute_offsets(entries, start), 0, minutes)
+    last = np.clip(_minute_offsets(exits, start), 0, minutes)
+    stays = first < last
+    deltas = np.zeros((len(labels), minutes + 1), dtype=np.int32)
+    np.add.at(deltas, (codes[stays], first[stays]), 1)
+    np.add.at(deltas, (codes[stays], last[stays]), -1)
+    return [str(label) for label in labels], np.cumsum(deltas[:, :-1], axis=1, dtype=np.int32)
+
+
+def _day_curves(first_day: date, last_day: date, group_by: Optional[str]) -> Dict[date, DayCurve]:
+    """Curves for each day in [first_day, last_day), reusing cached closed days"""
+    sync_invalidations()
+    curves: Dict[date, DayCurve] = {}
+    missing: List[date] = []
+    day = first_day
+    while day < last_day:
+        entry = _curves.get(_curve_key(day, group_by))
+        if entry is None:
+            missing.append(day)
+        else:
+            curves[day] = entry.body
+        day += timedelta(days=1)
+    if not missing:
+        return curves
+
+    # One query for the whole uncached span, split into days afterwards
+    started = _curves.begin()
+    span_start = datetime.combine(missing[0], datetime.min.time())
+    span_days = (missing[-1] - missing[0]).days + 1
+    labels, counts = _build_curves(span_start, span_start + timedelta(days=span_days), group_by)
+    today = date.today()
+    expires_at = cache_deadline(True)
+    for day in missing:
+        offset = (day - missing[0]).days * MINUTES_PER_DAY
+        # Copy so a cached day does not keep the whole span alive
+        curve = (labels, counts[:, offset:offset + MINUTES_PER_DAY].copy())
+        curves[day] = curve
+        if day < today:
+            _curves.put(_curve_key(day, group_by), CachedReport(
+                body=curve, etag=None, start=day, end=day + timedelta(days=1), expires_at=expires_at
+            ), started)
+    return curves
+
+
+def occupancy_series(start: datetime, end: datetime, resolution: Optional[int] = None,
+                     group_by: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Number of vehicles inside over [start, end)
+
+    Args:
+        start: Start of the range, rounded down to the minute
+        end: End of the range (exclusive), rounded up to the minute
+        resolution: Minutes per point; defaults to the smallest that keeps
+            the series within MAX_POINTS points
+        group_by: None, 'vehicle_type', 'level' or 'section'
+
+    Returns:
+        Dict: Point timestamps, and per group the occupancy at the start of
+        each point and the peak within it
+
+    Raises:
+        ValueError: If the range, resolution or grouping is not supported
+    """
+    if group_by is not None and group_by not in GROUP_COLUMNS:
+        raise ValueError(f"Unsupported grouping: {group_by}")
+    start = start.replace(second=0, microsecond=0)
+    if end.second or end.microsecond:
+        end = end.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    if end <= start:
+        raise ValueError('end must be after start')
+    if end - start > timedelta(days=MAX_RANGE_DAYS):
+        raise ValueError(f'Range is limited to {MAX_RANGE_DAYS} days')
+
+    total_minutes = int((end - start).total_seconds() // 60)
+    if resolution is None:
+        resolution = max(1, math.ceil(total_minutes / MAX_POINTS))
+    if resolution < 1:
+        raise ValueError('resolution must be at least one minute')
+
+    first_day = start.date()
+    last_day = (end - timedelta(minutes=1)).date() + timedelta(days=1)
+    curves = _day_curves(first_day, last_day, group_by)
+
+    # Line the days up on one set of groups
+    labels = sorted({label for day_labels, _ in curves.values() for label in day_labels})
+    rows = {label: i for i, label in enumerate(labels)}
+    counts = np.zeros((len(labels), (last_day - first_day).days * MINUTES_PER_DAY), dtype=np.int32)
+    for day, (day_labels, day_counts) in curves.items():
+        offset = (day - first_day).days * MINUTES_PER_DAY
+        for i, label in enumerate(day_labels):
+            counts[rows[label], offset:offset + MINUTES_PER_DAY] = day_counts[i]
+
+    offset = int((start - datetime.combine(first_day, datetime.min.time())).total_seconds() // 60)
+    counts = counts[:, offset:offset + total_minutes]
+
+    # Occupancy at the start of each point, and the peak within it
+    points = math.ceil(total_minutes / resolution)
+    padded = np.zeros((len(labels), points * resolution), dtype=np.int32)
+    padded[:, :total_minutes] = counts
+    peaks = padded.reshape(len(labels), points, resolution).max(axis=2)
+
+    series = {
+        label: {
+            'occupancy': counts[i, ::resolution].tolist(),
+            'peak': peaks[i].tolist()
+        } for i, label in enumerate(labels)
+    }
+    if group_by is None:
+        series = {'all': series.get('all', {'occupancy': [0] * points, 'peak': [0] * points})}
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'resolution': resolution,
+        'timestamps': [(start + timedelta(minutes=resolution * i)).isoformat() for i in range(points)],
+        'series': series
+    }
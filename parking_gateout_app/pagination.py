@@ -0,0 +1,142 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+
+from .models import db
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+# Counting stops here when an approximate total is requested
+TOTAL_COUNT_CAP = 10000
+
+
+def encode_cursor(created_at: Optional[datetime], row_id: Any) -> str:
+    """
+    Opaque token for the position after a row
+
+    Args:
+        created_at: The row's timestamp, None if it has none
+        row_id: The row's primary key
+
+    Returns:
+        str: URL-safe cursor token
+    """
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[Optional[datetime], Any]:
+    """
+    Read a cursor token produced by encode_cursor
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = datetime.fromisoformat(created_at) if created_at is not None else None
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+    # Keys are integers or strings; anything else was not written by encode_cursor
+    if isinstance(row_id, bool) or not isinstance(row_id, (int, str)):
+        raise ValueError('Invalid cursor')
+    return created_at, row_id
+
+
+def keyset_page(query: Any, created_column: Any, id_column: Any, cursor: Optional[str] = None,
+                limit: int = DEFAULT_PAGE_SIZE, total: Optional[str] = None,
+                max_limit: int = MAX_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Fetch one page of a query, newest first, by (created_at, Id) keyset
+
+    Every page is an index range scan on (created_at, Id) that starts right
+    after the previous page, so deep pages cost the same as the first one.
+    Rows without a timestamp come last, newest Id first; their cursors
+    carry only the Id.
+
+    Args:
+        query: Filtered ORM query (without ordering or limits)
+        created_column: The timestamp column to page on
+        id_column: The primary key column, used as the tie breaker
+        cursor: Token from the previous page's next_cursor
+        limit: Page size, capped at max_limit
+        total: 'exact' for a full count, 'approx' for a count capped at
+            TOTAL_COUNT_CAP, anything else for no count
+        max_limit: Largest page size allowed
+
+    Returns:
+        Dict: items, next_cursor (None on the last page), has_more and,
+        when requested, total and total_capped
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, max_limit))
+    filtered = query
+
+    created_at, row_id = decode_cursor(cursor) if cursor else (None, None)
+    rows: List[Any] = []
+    if created_at is not None or not cursor:
+        if created_at is not None:
+            # The leading bound lets the planner seek into the index; a bare
+            # OR of the two cases turns into a scan on some engines
+            timed = query.filter(and_(
+                created_column <= created_at,
+                or_(created_column < created_at, id_column < row_id)
+            ))
+        else:
+            timed = query.filter(created_column.isnot(None))
+        rows = timed.order_by(created_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        # Continue into the rows without a timestamp, which no <= bound reaches
+        untimed = query.filter(created_column.is_(None))
+        if cursor and created_at is None:
+            untimed = untimed.filter(id_column < row_id)
+        rows += untimed.order_by(id_column.desc()).limit(limit + 1 - len(rows)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    page = {
+        'items': rows,
+        'next_cursor': None,
+        'has_more': has_more
+    }
+    if has_more:
+        last = rows[-1]
+        page['next_cursor'] = encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+
+    if total == 'exact':
+        page['total'] = filtered.order_by(None).count()
+        page['total_capped'] = False
+    elif total == 'approx':
+        capped = filtered.order_by(None).with_entities(id_column).limit(TOTAL_COUNT_CAP + 1).subquery()
+        count = db.session.execute(db.select(func.count()).select_from(capped)).scalar()
+        page['total'] = min(count, TOTAL_COUNT_CAP)
+        page['total_capped'] = count > TOTAL_COUNT_CAP
+    return page
+
+
+def page_args(args: Any, default_size: int = DEFAULT_PAGE_SIZE) -> Tuple[Optional[str], int, Optional[str]]:
+    """Cursor, page size and total mode from request arguments"""
+    return (
+        args.get('cursor') or None,
+        args.get('per_page', default_size, type=int),
+        args.get('total')
+    )
+
+
+def pagination_info(page: Dict[str, Any], per_page: int, max_limit: int = MAX_PAGE_SIZE) -> Dict[str, Any]:
+    """The pagination block of a list response"""
+    info = {
+        'per_page': max(1, min(per_page or DEFAULT_PAGE_SIZE, max_limit)),
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more']
+    }
+    if 'total' in page:
+        info['total'] = page['total']
+        info['total_capped'] = page['total_capped']
+    return info
@@ -0,0 +1,266 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import hashlib
+import itertools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from flask import current_app, request
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session
+
+from .models import ReportInvalidations, db
+
+CacheKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+# Invalidations this recent are read again, as their Ids may have been
+# taken by transactions that committed after a higher Id was applied
+RECHECK_SECONDS = 10
+
+
+class CachedReport(NamedTuple):
+    body: Any  # rendered JSON for reports, or any derived data
+    etag: Optional[str]
+    start: date  # first day covered
+    end: date  # day after the last day covered
+    expires_at: Optional[float]  # time.monotonic() deadline, None to keep until invalidated
+
+
+class ReportCache:
+    """
+    Rendered report bodies keyed by report name and parameters
+
+    Reports covering only closed days are kept until a late write to one of
+    those days invalidates them, or for REPORT_CACHE_CLOSED_SECONDS at most;
+    reports that include today expire after a short TTL instead of being
+    invalidated on every exit. Each worker process keeps its own cache; late
+    writes made by other processes reach it through sync_invalidations().
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[CacheKey, CachedReport]' = OrderedDict()
+        self._sequence = itertools.count(1)
+        self._invalidated: Dict[date, int] = {}
+        self.max_entries = max_entries
+
+    def get(self, key: CacheKey) -> Optional[CachedReport]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def begin(self) -> int:
+        """Mark the start of a build; pass the result to put()"""
+        with self._lock:
+            return next(self._sequence)
+
+    def put(self, key: CacheKey, entry: CachedReport, started: int) -> bool:
+        """
+        Store a report unless one of its days was invalidated while it was built
+
+        Returns:
+            bool: Whether the report was stored
+        """
+        with self._lock:
+            day = entry.start
+            while day < entry.end:
+                if self._invalidated.get(day, 0) > started:
+                    return False
+                day += timedelta(days=1)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate_days(self, days: Iterable[date]) -> int:
+        """
+        Drop every report covering any of the given days
+
+        Returns:
+            int: Number of reports dropped
+        """
+        days = set(days)
+        if not days:
+            return 0
+        with self._lock:
+            sequence = next(self._sequence)
+            for day in days:
+                self._invalidated[day] = sequence
+            stale = [key for key, entry in self._entries.items()
+                     if any(entry.start <= day < entry.end for day in days)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache = ReportCache()
+# Every cache here is invalidated by late writes to past days
+_caches: List[ReportCache] = [_cache]
+
+
+def get_report_cache() -> ReportCache:
+    return _cache
+
+
+def register_cache(cache: ReportCache) -> ReportCache:
+    """Have late writes to past days invalidate another per-day cache"""
+    _caches.append(cache)
+    return cache
+
+
+def _as_date(value: Any) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def cache_deadline(closed: bool) -> float:
+    """When an entry built now expires, for closed days or ranges that include today"""
+    if closed:
+        return time.monotonic() + current_app.config.get('REPORT_CACHE_CLOSED_SECONDS', 3600)
+    return time.monotonic() + current_app.config.get('REPORT_CACHE_TODAY_SECONDS', 30)
+
+
+_synced_lock = threading.Lock()
+_synced_id: Optional[int] = None  # last ReportInvalidations row applied here
+
+
+def sync_invalidations() -> None:
+    """
+    Apply late writes committed by any process since the last call
+
+    Every late write to a closed day leaves a ReportInvalidations row in
+    the same transaction, so the gate-in app, the rollup CLI and the other
+    workers all reach this process's caches. Costs one indexed range query;
+    call it before reading a cache. Rows from the last RECHECK_SECONDS are
+    applied again, so one that commits out of Id order is not missed.
+    """
+    global _synced_id
+    with _synced_lock:
+        last = _synced_id
+    if last is None:
+        # Nothing is cached yet, so only later rows matter
+        latest = db.session.execute(db.select(func.max(ReportInvalidations.Id))).scalar() or 0
+        with _synced_lock:
+            if _synced_id is None:
+                _synced_id = latest
+        return
+    recent = datetime.utcnow() - timedelta(seconds=RECHECK_SECONDS)
+    rows = db.session.execute(
+        db.select(ReportInvalidations.Id, ReportInvalidations.Day)
+        .where(or_(ReportInvalidations.Id > last, ReportInvalidations.CreatedAt >= recent))
+        .order_by(ReportInvalidations.Id)
+    ).all()
+    if not rows:
+        return
+    days = {day for _, day in rows}
+    for cache in _caches:
+        cache.invalidate_days(days)
+    with _synced_lock:
+        _synced_id = max(_synced_id, rows[-1][0])
+
+
+def cached_report(name: str, params: Dict[str, Any], start: Any, end: Any,
+                  build: Callable[[], Dict[str, Any]]) -> Any:
+    """
+    Serve a JSON report from the cache, building it on a miss
+
+    The response carries a strong ETag over the body, so a client sending
+    it back in If-None-Match gets 304 Not Modified without the report being
+    rebuilt.
+
+    Args:
+        name: Report name
+        params: Every request parameter the report depends on
+        start: First day covered
+        end: Day after the last day covered
+        build: Builds the report payload
+
+    Returns:
+        Response: 200 with the report, or 304
+    """
+    sync_invalidations()
+    key = (name, tuple(sorted(params.items())))
+    entry = _cache.get(key)
+    if entry is None:
+        started = _cache.begin()
+        body = json.dumps(build(), separators=(',', ':')).encode()
+        start, end = _as_date(start), _as_date(end)
+        entry = CachedReport(
+            body=body,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            start=start,
+            end=end,
+            expires_at=cache_deadline(end <= date.today())
+        )
+        _cache.max_entries = current_app.config.get('REPORT_CACHE_MAX_ENTRIES', 512)
+        _cache.put(key, entry, started)
+    return conditional_response(entry.body, entry.etag)
+
+
+def conditional_response(body: bytes, etag: str) -> Any:
+    """
+    JSON response with a strong ETag, or 304 if the client already has it
+
+    Args:
+        body: Rendered JSON
+        etag: Tag of the body
+
+    Returns:
+        Response: 200 with the body, or 304
+    """
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Let clients keep the body but always revalidate it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def mark_changed(session: Session, moments: Iterable[datetime]) -> None:
+    """
+    Note report data written in a session; past days are invalidated on commit
+
+    Args:
+        session: The session the write was made in
+        moments: Times whose days the write changed
+    """
+    today = date.today()
+    days = {moment.date() for moment in moments if moment.date() < today}
+    noted = session.info.setdefault('report_cache_days', set())
+    days -= noted
+    if not days:
+        return
+    noted.update(days)
+    # Other processes pick these up in sync_invalidations(); rows older than
+    # the closed-day TTL can go, as no entry they would drop is still alive
+    session.add_all([ReportInvalidations(Day=day) for day in sorted(days)])
+    keep_seconds = current_app.config.get('REPORT_CACHE_CLOSED_SECONDS', 3600)
+    session.execute(db.delete(ReportInvalidations).where(
+        ReportInvalidations.CreatedAt < datetime.utcnow() - timedelta(seconds=keep_seconds)
+    ))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session: Session) -> None:
+    days = session.info.pop('report_cache_days', None)
+    if days:
+        for cache in _caches:
+            cache.invalidate_days(days)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop('report_cache_days', None)
@@ -0,0 +1,516 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, func, or_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from .bucketing import as_datetime, bucketed_series, hour_of_day, truncate
+from .dwell import DEFAULT_QUANTILES, dwell_bucket, sketches_from_rows
+from .events import queue_event
+from .models import (
+    ParkingDwellMonthlySketch, ParkingDwellSketch, ParkingHourlyStats, ParkingTickets, ParkingTransactions, Vehicles, db
+)
+from .report_cache import mark_changed
+
+METRICS = ('Entries', 'Exits', 'DwellMinutes', 'Transactions', 'Revenue')
+# Metrics kept in ParkingHourlyStats; entries are counted from the tickets,
+# as the gate-in terminals create tickets through their own backend, which
+# never updates the rollup. The Entries column is no longer written.
+ROLLUP_METRICS = ('Exits', 'DwellMinutes', 'Transactions', 'Revenue')
+UNKNOWN_VEHICLE_TYPE = 'Unknown'
+
+RollupKey = Tuple[datetime, str]
+DwellKey = Tuple[datetime, str, int]
+
+
+def hour_start(moment: datetime) -> datetime:
+    """Start of the hour a timestamp falls in"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def month_start(moment: datetime) -> datetime:
+    """Start of the month a timestamp falls in"""
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(moment: datetime) -> datetime:
+    """Start of the month after the one a timestamp falls in"""
+    return (month_start(moment) + timedelta(days=32)).replace(day=1)
+
+
+class RollupBatch:
+    """
+    Changes to ParkingHourlyStats and the dwell sketches, collected and
+    then written in one go
+
+    apply() runs inside the caller's transaction, so the rollup commits or
+    rolls back together with the tickets and transactions it counts. The
+    same changes are queued as dashboard events, published on commit;
+    entries only produce an event.
+    """
+
+    def __init__(self):
+        self._deltas: Dict[RollupKey, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(ROLLUP_METRICS, 0))
+        self._dwell: Dict[DwellKey, int] = defaultdict(int)
+        self._events: List[Tuple[str, Dict[str, Any]]] = []
+
+    def _bucket(self, moment: datetime, vehicle_type: Optional[str]) -> Dict[str, float]:
+        return self._deltas[(hour_start(moment), vehicle_type or UNKNOWN_VEHICLE_TYPE)]
+
+    def entry(self, entry_time: datetime, vehicle_type: Optional[str]) -> None:
+        self._events.append(('entry', {'time': entry_time.isoformat(), 'vehicle_type': vehicle_type}))
+
+    def exit(self, exit_time: datetime, vehicle_type: Optional[str], duration: Optional[int]) -> None:
+        bucket = self._bucket(exit_time, vehicle_type)
+        bucket['Exits'] += 1
+        bucket['DwellMinutes'] += duration or 0
+        self._dwell[(hour_start(exit_time), vehicle_type or UNKNOWN_VEHICLE_TYPE, dwell_bucket(duration))] += 1
+        self._events.append(('exit', {
+            'time': exit_time.isoformat(), 'vehicle_type': vehicle_type, 'duration': duration
+        }))
+
+    def transaction(self, created_at: datetime, vehicle_type: Optional[str], amount: Optional[float]) -> None:
+        bucket = self._bucket(created_at, vehicle_type)
+        bucket['Transactions'] += 1
+        bucket['Revenue'] += float(amount or 0)
+        self._events.append(('payment', {
+            'time': created_at.isoformat(), 'vehicle_type': vehicle_type, 'amount': float(amount or 0)
+        }))
+
+    def apply(self) -> None:
+        """Add the collected changes to the rollup, without committing"""
+        rows = [{
+            'Hour': hour,
+            'VehicleType': vehicle_type,
+            **deltas
+        } for (hour, vehicle_type), deltas in self._deltas.items()]
+        self._deltas.clear()
+        if rows:
+            upsert_add(ParkingHourlyStats, ('Hour', 'VehicleType'), ROLLUP_METRICS, rows)
+            mark_changed(db.session, (row['Hour'] for row in rows))
+        if self._dwell:
+            _write_dwell(self._dwell)
+            self._dwell.clear()
+        for event_type, data in self._events:
+            queue_event(db.session, event_type, data)
+        self._events.clear()
+
+
+def _write_dwell(counts: Dict[DwellKey, int]) -> None:
+    """Add hourly sketch counts to the hourly and monthly sketch tables"""
+    monthly: Dict[Tuple[datetime, int, str, int], int] = defaultdict(int)
+    for (hour, vehicle_type, bucket), count in counts.items():
+        monthly[(month_start(hour), hour.hour, vehicle_type, bucket)] += count
+    tiers = (
+        (ParkingDwellSketch, ('Hour', 'VehicleType', 'Bucket'), counts),
+        (ParkingDwellMonthlySketch, ('Month', 'HourOfDay', 'VehicleType', 'Bucket'), monthly)
+    )
+    for model, keys, tier in tiers:
+        rows = [{**dict(zip(keys, key)), 'Count': count} for key, count in tier.items()]
+        if rows:
+            upsert_add(model, keys, ('Count',), rows)
+
+
+def upsert_add(model: Any, keys: Sequence[str], metrics: Sequence[str], rows: List[Dict[str, Any]]) -> None:
+    """Insert rows, adding their metrics to any existing row with the same keys"""
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={metric: table.c[metric] + statement.excluded[metric] for metric in metrics}
+        )
+        db.session.execute(statement, rows)
+    elif dialect in ('mysql', 'mariadb'):
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            {metric: table.c[metric] + statement.inserted[metric] for metric in metrics}
+        )
+        db.session.execute(statement, rows)
+    else:
+        for row in rows:
+            updated = db.session.execute(
+                table.update().where(
+                    *(table.c[key] == row[key] for key in keys)
+                ).values({metric: table.c[metric] + row[metric] for metric in metrics})
+            ).rowcount
+            if not updated:
+                db.session.execute(table.insert(), row)
+
+
+def record_entry(entry_time: datetime, vehicle_type: Optional[str]) -> None:
+    """Announce an entry on the dashboard; entries are counted from the tickets"""
+    batch = RollupBatch()
+    batch.entry(entry_time, vehicle_type)
+    batch.apply()
+
+
+def record_exit(exit_time: datetime, vehicle_type: Optional[str], duration: Optional[int],
+                amount: Optional[float] = None) -> None:
+    """
+    Count an exit, and its payment if a transaction was written with it
+
+    Args:
+        exit_time: When the vehicle exited
+        vehicle_type: The type of vehicle
+        duration: Length of stay in minutes
+        amount: Amount of the transaction written with the exit, if any
+    """
+    batch = RollupBatch()
+    batch.exit(exit_time, vehicle_type, duration)
+    if amount is not None:
+        batch.transaction(exit_time, vehicle_type, amount)
+    batch.apply()
+
+
+def record_transaction(created_at: datetime, vehicle_type: Optional[str], amount: Optional[float]) -> None:
+    batch = RollupBatch()
+    batch.transaction(created_at, vehicle_type, amount)
+    batch.apply()
+
+
+def ticket_vehicle_type(ticket_id: Any) -> Optional[str]:
+    """Vehicle type of a ticket, for callers that only have its Id"""
+    return db.session.execute(
+        db.select(Vehicles.vehicle_type).join(
+            ParkingTickets, Vehicles.Id == ParkingTickets.VehicleId
+        ).where(ParkingTickets.Id == ticket_id)
+    ).scalar()
+
+
+def rollup_rows(start: datetime, end: datetime) -> List[ParkingHourlyStats]:
+    """Rollup rows for the hours in [start, end)"""
+    return ParkingHourlyStats.query.filter(
+        ParkingHourlyStats.Hour >= start,
+        ParkingHourlyStats.Hour < end
+    ).order_by(ParkingHourlyStats.Hour, ParkingHourlyStats.VehicleType).all()
+
+
+def _rolled_up(metric: str) -> bool:
+    """Whether a metric is read from the rollup; entries are a range scan on the EntryTime index"""
+    return metric in ROLLUP_METRICS
+
+
+def rollup_totals(start: datetime, end: datetime) -> Dict[str, float]:
+    """Sum of every metric over the hours in [start, end)"""
+    row = db.session.execute(
+        db.select(*[
+            func.coalesce(func.sum(getattr(ParkingHourlyStats, metric)), 0)
+            if _rolled_up(metric) else db.select(func.count()).where(
+                ParkingTickets.EntryTime >= start,
+                ParkingTickets.EntryTime < end
+            ).scalar_subquery()
+            for metric in METRICS
+        ]).where(
+            ParkingHourlyStats.Hour >= start,
+            ParkingHourlyStats.Hour < end
+        )
+    ).one()
+    return {metric: float(value) if metric == 'Revenue' else int(value) for metric, value in zip(METRICS, row)}
+
+
+def rollup_series(start: datetime, end: datetime, size: str = 'day') -> List[Dict[str, Any]]:
+    """
+    Every metric per time bucket over the hours in [start, end), gaps filled with zeros
+
+    Args:
+        start: Start of the range
+        end: End of the range (exclusive)
+        size: Bucket size, one of bucketing.BUCKET_SIZES
+
+    Returns:
+        List: One dict per bucket with 'bucket' (its start) and each metric
+    """
+    series = bucketed_series(ParkingHourlyStats.Hour, start, end, size, {
+        metric: func.sum(getattr(ParkingHourlyStats, metric)) for metric in METRICS if _rolled_up(metric)
+    })
+    entries = bucketed_series(ParkingTickets.EntryTime, start, end, size, {'Entries': func.count()})
+    for point, entry_point in zip(series, entries):
+        point['Entries'] = entry_point['Entries']
+        for metric in METRICS:
+            point[metric] = float(point[metric]) if metric == 'Revenue' else int(point[metric])
+    return series
+
+
+DWELL_GROUPS = ('vehicle_type', 'hour')
+
+
+def dwell_quantiles(start: datetime, end: datetime, by: Sequence[str] = ('vehicle_type',),
+                    qs: Sequence[float] = DEFAULT_QUANTILES) -> List[Dict[str, Any]]:
+    """
+    Stay length quantiles for exits in the hours in [start, end)
+
+    Sketches are merged in SQL by summing bucket counts. Whole months are
+    read from the monthly sketches (one per hour of day) and only the
+    partial months at either end from the hourly ones, so a year costs
+    about as much as two months of hourly sketches at most, and the number
+    of exits in the range does not matter.
+
+    Args:
+        start: First hour (inclusive)
+        end: Last hour (exclusive)
+        by: Any of 'vehicle_type' and 'hour' (hour of day)
+        qs: Quantiles between 0 and 1
+
+    Returns:
+        List: One dict per group with its keys, exit count and a p<q> entry
+        (minutes) per quantile
+
+    Raises:
+        ValueError: If a grouping is not supported
+    """
+    unsupported = set(by) - set(DWELL_GROUPS)
+    if unsupported:
+        raise ValueError(f"Unsupported grouping: {', '.join(sorted(unsupported))}")
+    first_month = start if start == month_start(start) else next_month(start)
+    last_month = month_start(end)
+    if first_month < last_month:
+        hourly_ranges = [(start, first_month), (last_month, end)]
+    else:
+        hourly_ranges = [(start, end)]
+
+    hourly = {'vehicle_type': ParkingDwellSketch.VehicleType, 'hour': hour_of_day(ParkingDwellSketch.Hour)}
+    groups = [hourly[key] for key in by]
+    rows = db.session.execute(
+        db.select(*groups, ParkingDwellSketch.Bucket, func.sum(ParkingDwellSketch.Count)).where(or_(*(
+            and_(ParkingDwellSketch.Hour >= low, ParkingDwellSketch.Hour < high)
+            for low, high in hourly_ranges if low < high
+        ))).group_by(*groups, ParkingDwellSketch.Bucket)
+    ).all() if any(low < high for low, high in hourly_ranges) else []
+
+    if first_month < last_month:
+        monthly = {'vehicle_type': ParkingDwellMonthlySketch.VehicleType, 'hour': ParkingDwellMonthlySketch.HourOfDay}
+        groups = [monthly[key] for key in by]
+        rows += db.session.execute(
+            db.select(*groups, ParkingDwellMonthlySketch.Bucket, func.sum(ParkingDwellMonthlySketch.Count)).where(
+                ParkingDwellMonthlySketch.Month >= first_month,
+                ParkingDwellMonthlySketch.Month < last_month
+            ).group_by(*groups, ParkingDwellMonthlySketch.Bucket)
+        ).all()
+
+    results = []
+    for group, sketch in sorted(sketches_from_rows(rows).items()):
+        result = dict(zip(by, group))
+        result['count'] = sketch.count
+        for q, value in zip(qs, sketch.quantiles(qs)):
+            result[f'p{q * 100:g}'] = value
+        results.append(result)
+    return results
+
+
+def compute_from_raw(start: datetime, end: datetime) -> Dict[RollupKey, Dict[str, float]]:
+    """
+    Recompute the rollup for [start, end) from tickets and transactions
+
+    Args:
+        start: First hour (inclusive)
+        end: Last hour (exclusive)
+
+    Returns:
+        Dict: ROLLUP_METRICS by (hour, vehicle type)
+    """
+    counts: Dict[RollupKey, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(ROLLUP_METRICS, 0))
+    vehicle_type = func.coalesce(Vehicles.vehicle_type, UNKNOWN_VEHICLE_TYPE)
+
+    hour = truncate(ParkingTickets.ExitTime, 'hour')
+    for bucket, vtype, exits, dwell in db.session.execute(
+        db.select(
+            hour, vehicle_type, func.count(ParkingTickets.Id),
+            func.coalesce(func.sum(ParkingTickets.Duration), 0)
+        ).outerjoin(
+            Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+        ).where(
+            ParkingTickets.ExitTime >= start,
+            ParkingTickets.ExitTime < end,
+            ParkingTickets.Status == 'completed'
+        ).group_by(hour, vehicle_type)
+    ):
+        counts[(as_datetime(bucket), vtype)].update(Exits=exits, DwellMinutes=int(dwell))
+
+    hour = truncate(ParkingTransactions.created_at, 'hour')
+    for bucket, vtype, transactions, revenue in db.session.execute(
+        db.select(
+            hour, vehicle_type, func.count(ParkingTransactions.Id),
+            func.coalesce(func.sum(ParkingTransactions.amount), 0)
+        ).outerjoin(
+            ParkingTickets, ParkingTransactions.ticket_id == func.cast(ParkingTickets.Id, db.String)
+        ).outerjoin(
+            Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+        ).where(
+            ParkingTransactions.created_at >= start,
+            ParkingTransactions.created_at < end
+        ).group_by(hour, vehicle_type)
+    ):
+        counts[(as_datetime(bucket), vtype)].update(Transactions=transactions, Revenue=float(revenue))
+
+    return counts
+
+
+def _history_bounds() -> Tuple[Optional[datetime], Optional[datetime]]:
+    firsts = [db.session.execute(db.select(func.min(column))).scalar() for column in (
+        ParkingTickets.EntryTime, ParkingTransactions.created_at
+    )]
+    firsts = [value for value in firsts if value is not None]
+    if not firsts:
+        return None, None
+    return hour_start(min(firsts)), hour_start(datetime.now()) + timedelta(hours=2)
+
+
+def backfill(start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    """
+    Rebuild the rollup for [start, end) from tickets and transactions
+
+    Replaces the rollup rows and dwell sketches in the range in one
+    transaction. Exits and payments recorded while the backfill runs may
+    be counted twice or not at all, so run it while the gates are quiet
+    and check with verify().
+
+    Args:
+        start: First hour, defaults to the oldest ticket or transaction
+        end: End of the range (exclusive), defaults to the next hour
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    first, last = _history_bounds()
+    start = hour_start(start) if start else first
+    end = hour_start(end) if end else last
+    if start is None or end is None:
+        return 0
+
+    counts = compute_from_raw(start, end)
+    ParkingHourlyStats.query.filter(
+        ParkingHourlyStats.Hour >= start,
+        ParkingHourlyStats.Hour < end
+    ).delete(synchronize_session=False)
+    rows = [{
+        'Hour': hour,
+        'VehicleType': vehicle_type,
+        **metrics
+    } for (hour, vehicle_type), metrics in sorted(counts.items())]
+    if rows:
+        db.session.execute(db.insert(ParkingHourlyStats), rows)
+    _rebuild_dwell(start, end)
+    mark_changed(db.session, (start + timedelta(days=day) for day in range((end - start).days + 1)))
+    db.session.commit()
+    return len(rows)
+
+
+def _rebuild_dwell(start: datetime, end: datetime) -> None:
+    """Replace the dwell sketches for [start, end) with ones built from completed tickets"""
+    ParkingDwellSketch.query.filter(
+        ParkingDwellSketch.Hour >= start,
+        ParkingDwellSketch.Hour < end
+    ).delete(synchronize_session=False)
+    # Monthly sketches of the months touched are rebuilt from the hourly
+    # sketches outside [start, end) here, and from the new ones below
+    months_start, months_end = month_start(start), next_month(end - timedelta(microseconds=1))
+    ParkingDwellMonthlySketch.query.filter(
+        ParkingDwellMonthlySketch.Month >= months_start,
+        ParkingDwellMonthlySketch.Month < months_end
+    ).delete(synchronize_session=False)
+    kept = ParkingDwellSketch.query.filter(
+        ParkingDwellSketch.Hour >= months_start,
+        ParkingDwellSketch.Hour < months_end
+    ).all()
+    monthly: Dict[Tuple[datetime, int, str, int], int] = defaultdict(int)
+    for sketch in kept:
+        monthly[(month_start(sketch.Hour), sketch.Hour.hour, sketch.VehicleType, sketch.Bucket)] += sketch.Count
+    if monthly:
+        db.session.execute(db.insert(ParkingDwellMonthlySketch), [{
+            'Month': month, 'HourOfDay': hour, 'VehicleType': vehicle_type, 'Bucket': bucket, 'Count': count
+        } for (month, hour, vehicle_type, bucket), count in monthly.items()])
+
+    counts: Dict[DwellKey, int] = defaultdict(int)
+    query = db.select(
+        ParkingTickets.ExitTime, Vehicles.vehicle_type, ParkingTickets.Duration
+    ).outerjoin(
+        Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+    ).where(
+        ParkingTickets.ExitTime >= start,
+        ParkingTickets.ExitTime < end,
+        ParkingTickets.Status == 'completed'
+    ).execution_options(yield_per=5000)
+    for partition in db.session.execute(query).partitions():
+        for exit_time, vehicle_type, duration in partition:
+            counts[(hour_start(exit_time), vehicle_type or UNKNOWN_VEHICLE_TYPE, dwell_bucket(duration))] += 1
+    _write_dwell(counts)
+
+
+def verify(start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Compare the rollup for [start, end) with tickets and transactions
+
+    Only ROLLUP_METRICS are compared: entries are never rolled up, so a
+    clean rollup verifies without mismatches and the check can run from
+    cron.
+
+    Args:
+        start: First hour, defaults to the oldest ticket or transaction
+        end: End of the range (exclusive), defaults to the next hour
+
+    Returns:
+        List: One entry per differing (hour, vehicle type, metric)
+    """
+    first, last = _history_bounds()
+    start = hour_start(start) if start else first
+    end = hour_start(end) if end else last
+    if start is None or end is None:
+        return []
+
+    expected = compute_from_raw(start, end)
+    actual = {
+        (row.Hour, row.VehicleType): {metric: getattr(row, metric) for metric in ROLLUP_METRICS}
+        for row in rollup_rows(start, end)
+    }
+    zero = dict.fromkeys(ROLLUP_METRICS, 0)
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        raw, rolled = expected.get(key, zero), actual.get(key, zero)
+        for metric in ROLLUP_METRICS:
+            if abs(float(raw[metric]) - float(rolled[metric])) > 0.005:
+                mismatches.append({
+                    'hour': key[0].isoformat(),
+                    'vehicle_type': key[1],
+                    'metric': metric,
+                    'rollup': float(rolled[metric]),
+                    'raw': float(raw[metric])
+                })
+    return mismatches
+
+
+rollup_cli = AppGroup('rollup', help='Maintain the hourly statistics rollup.')
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+
+@rollup_cli.command('backfill')
+@click.option('--start', help='First day to rebuild (YYYY-MM-DD), defaults to the oldest data')
+@click.option('--end', help='Day after the last day to rebuild (YYYY-MM-DD), defaults to now')
+def backfill_command(start: Optional[str], end: Optional[str]) -> None:
+    """Rebuild the rollup from tickets and transactions."""
+    written = backfill(_parse_date(start), _parse_date(end))
+    click.echo(f"Wrote {written} rollup rows")
+
+
+@rollup_cli.command('verify')
+@click.option('--start', help='First day to check (YYYY-MM-DD), defaults to the oldest data')
+@click.option('--end', help='Day after the last day to check (YYYY-MM-DD), defaults to now')
+def verify_command(start: Optional[str], end: Optional[str]) -> None:
+    """Compare the rollup with tickets and transactions."""
+    mismatches = verify(_parse_date(start), _parse_date(end))
+    for mismatch in mismatches:
+        click.echo(
+            f"{mismatch['hour']} {mismatch['vehicle_type']} {mismatch['metric']}: "
+            f"rollup {mismatch['rollup']} != raw {mismatch['raw']}"
+        )
+    if mismatches:
+        raise SystemExit(1)
+    click.echo("Rollup matches raw data")
@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify, current_app, render_template, redirect, url_for, session
+from flask import Blueprint, request, jsonify, current_app, render_template, redirect, url_for, session, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
 from datetime import datetime, timedelta
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import jwt
+import csv
+import io
+import json
+import numpy as np
 import traceback
 import uuid
 from functools import wraps
@@ -12,6 +16,17 @@ from parking_gateout_app.models import (
     db, AspNetUsers, AspNetUserRoles, ParkingSpaces, Vehicles,
     ParkingTickets, ParkingTransactions, AccessTokens, ParkingRate, ActivityLog
 )
+from parking_gateout_app.tariff import quote_fee, quote_fees, build_candidate_table
+from parking_gateout_app.active_index import find_active_ticket, index_ticket_exit
+from parking_gateout_app.pagination import keyset_page, page_args, pagination_info
+from parking_gateout_app.report_cache import cached_report
+from parking_gateout_app.archive import ArchiveReader
+from parking_gateout_app.bucketing import BUCKET_SIZES
+from parking_gateout_app.services import ParkingService, ACTIVE_SESSIONS_PAGE_SIZE, ACTIVE_SESSIONS_MAX_PAGE_SIZE
+from parking_gateout_app.rollup import (
+    record_exit, record_transaction, ticket_vehicle_type, rollup_series, rollup_totals, dwell_quantiles, METRICS
+)
+from parking_gateout_app.utils import generate_transaction_id
 import logging
 from sqlalchemy import text
 import os
@@ -28,6 +43,7 @@ management_bp = Blueprint('management', __name__, url_prefix='/api/management')
 report_bp = Blueprint('report', __name__, url_prefix='/api/reports')
 main_bp = Blueprint('main', __name__, url_prefix='/api/main')
 health_bp = Blueprint('health', __name__, url_prefix='/api')
+lease_bp = Blueprint('lease', __name__, url_prefix='/api/ticket-leases')
 
 # Initialize rate limiter with fixed window and burst handling
 limiter = Limiter(
@@ -285,32 +301,45 @@ def process_exit(current_user):
         data = request.get_json()
         ticket_number = data.get('ticketNumber')
         
-        ticket = ParkingTickets.query.filter_by(TicketNumber=ticket_number).first()
+        # Active tickets resolve from the index, including the vehicle type
+        active = find_active_ticket(ticket_number=ticket_number)
+        if active:
+            ticket = db.session.get(ParkingTickets, active.Id)
+            vehicle_type = active.vehicle_type
+        else:
+            ticket = ParkingTickets.query.filter_by(TicketNumber=ticket_number).first()
+            vehicle = Vehicles.query.get(ticket.VehicleId) if ticket else None
+            vehicle_type = vehicle.vehicle_type if vehicle else None
         if not ticket:
             return jsonify({
                 'status': 'error',
                 'message': 'Invalid ticket number'
             }), 404
         
-        vehicle = Vehicles.query.get(ticket.VehicleId)
-        if not vehicle or not vehicle.IsParked:
+        if ticket.Status != 'active':
             return jsonify({
                 'status': 'error',
                 'message': 'Vehicle not found or already exited'
             }), 404
         
-        # Calculate parking duration and fee
+        # Calculate parking duration and fee; tickets without a vehicle pay the default rate
         exit_time = datetime.utcnow()
-        duration = exit_time - vehicle.EntryTime
+        duration = exit_time - ticket.EntryTime
         hours = duration.total_seconds() / 3600
+        total_fee = quote_fee(ticket.EntryTime, exit_time, vehicle_type or '')
         
-        space = ParkingSpaces.query.get(vehicle.ParkingSpaceId)
-        hourly_rate = float(space.HourlyRate if space else current_app.config['DEFAULT_HOURLY_RATE'])
-        total_fee = round(hours * hourly_rate, 2)
-        
-        # Update vehicle status
-        vehicle.ExitTime = exit_time
-        vehicle.IsParked = False
+        # Update ticket status; only one lane can close the ticket
+        minutes = int(duration.total_seconds() // 60)
+        closed = ParkingService.close_ticket(ticket.Id, exit_time, total_fee, minutes)
+        index_ticket_exit(ticket.TicketNumber)
+        if not closed:
+            db.session.rollback()
+            return jsonify({
+                'status': 'error',
+                'message': 'Ticket has already been used for exit',
+                'code': 409
+            }), 409
+        record_exit(exit_time, vehicle_type, minutes)
         db.session.commit()
         
         return jsonify({
@@ -331,21 +360,51 @@ def process_exit(current_user):
             'code': 500
         }), 500
 
+def active_sessions_response(args):
+    """
+    Active sessions as a columnar page
+    
+    One array per field instead of one object per session keeps the
+    payload small for a full lot. Durations are left to the client, which
+    subtracts entry_time from as_of; both are UTC.
+    """
+    cursor, per_page, total = page_args(args, ACTIVE_SESSIONS_PAGE_SIZE)
+    try:
+        page = ParkingService.get_active_sessions(
+            cursor=cursor,
+            limit=per_page,
+            vehicle_type=args.get('vehicle_type') or None,
+            level=args.get('level') or None,
+            total=total
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'code': 400}), 400
+    
+    rows = page['items']
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'as_of': datetime.utcnow().isoformat(),
+            'count': len(rows),
+            'columns': {
+                'ticket_number': [row.TicketNumber for row in rows],
+                'vehicle_plate': [row.plate_number for row in rows],
+                'vehicle_type': [row.vehicle_type for row in rows],
+                'space': [row.SpaceNumber for row in rows],
+                'level': [row.Level for row in rows],
+                'section': [row.Section for row in rows],
+                'entry_time': [row.EntryTime.isoformat() if row.EntryTime else None for row in rows]
+            }
+        },
+        'pagination': pagination_info(page, per_page, ACTIVE_SESSIONS_MAX_PAGE_SIZE)
+    })
+
 @parking_bp.route('/active', methods=['GET'])
 @limiter.limit("60 per minute;300 per hour")
 @token_required
 def get_active_sessions(current_user):
     try:
-        sessions = ParkingTickets.query.filter_by(IsActive=True).all()
-        return jsonify({
-            'status': 'success',
-            'data': [{
-                'ticket_number': session.TicketNumber,
-                'vehicle_plate': session.Vehicle.PlateNumber,
-                'entry_time': session.EntryTime.isoformat(),
-                'duration': str(datetime.utcnow() - session.EntryTime)
-            } for session in sessions]
-        })
+        return active_sessions_response(request.args)
     except Exception as e:
         current_app.logger.error(f"Active sessions error: {str(e)}")
         return jsonify({
@@ -379,7 +438,8 @@ def process_payment(current_user):
             'payment_method': payment_method,
             'status': 'COMPLETED',
             'processed_by': current_user.Id,
-            'transaction_number': f'TXN{datetime.now().strftime("%Y%m%d%H%M%S")}'
+            'transaction_number': generate_transaction_id(),
+            'created_at': datetime.utcnow()
         }
         transaction = ParkingTransactions(**transaction_data)
         
@@ -387,6 +447,7 @@ def process_payment(current_user):
         ticket.IsPaid = True
         
         db.session.add(transaction)
+        record_transaction(transaction.created_at, ticket_vehicle_type(ticket.Id), transaction.amount)
         db.session.commit()
         
         return jsonify({
@@ -430,9 +491,11 @@ def record_payment(current_user):
             'payment_method': data['paymentMethod'],
             'status': data.get('status', 'completed'),
             'processed_by': current_user.Id,
-            'transaction_number': f'TXN{datetime.now().strftime("%Y%m%d%H%M%S")}'
+            'transaction_number': generate_transaction_id(),
+            'created_at': datetime.utcnow()
         }
         transaction = ParkingTransactions(**transaction_data)
+        record_transaction(transaction.created_at, ticket_vehicle_type(data['ticketId']), data['amount'])
         
         # Create activity log
         activity_data = {
@@ -517,6 +580,60 @@ def get_operators(current_user):
         }), 500
 
 # Report routes
+EXPORT_FORMATS = ('json', 'csv', 'ndjson')
+EXPORT_BATCH_SIZE = 1000
+
+def stream_transactions(start_date, end_date, export_format, filename):
+    """
+    Stream the transactions in [start_date, end_date) as CSV or NDJSON
+
+    Rows are read from a server-side cursor in batches and written as they
+    arrive, so memory use does not grow with the size of the range.
+    """
+    query = db.select(
+        ParkingTransactions.Id, ParkingTransactions.transaction_number, ParkingTransactions.ticket_id,
+        ParkingTransactions.amount, ParkingTransactions.payment_method, ParkingTransactions.status,
+        ParkingTransactions.created_at
+    ).where(
+        ParkingTransactions.created_at >= start_date,
+        ParkingTransactions.created_at < end_date
+    ).order_by(ParkingTransactions.created_at, ParkingTransactions.Id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    fields = ['id', 'transactionNumber', 'ticketId', 'amount', 'method', 'status', 'processedAt']
+
+    def records():
+        for partition in db.session.execute(query).partitions():
+            yield [[
+                row.Id, row.transaction_number, row.ticket_id, float(row.amount or 0),
+                row.payment_method, row.status,
+                row.created_at.isoformat() if row.created_at else None
+            ] for row in partition]
+
+    def generate():
+        try:
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(fields)
+                yield buffer.getvalue()
+                for batch in records():
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(batch)
+                    yield buffer.getvalue()
+            else:
+                for batch in records():
+                    yield ''.join(json.dumps(dict(zip(fields, values))) + '\n' for values in batch)
+        except Exception as e:
+            current_app.logger.error(f"Transaction export error: {str(e)}")
+            raise
+
+    if export_format == 'csv':
+        return Response(
+            stream_with_context(generate()), mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'}
+        )
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @report_bp.route('/daily', methods=['GET'])
 @limiter.limit("60 per minute;300 per hour")
 @token_required
@@ -524,31 +641,50 @@ def get_daily_report(current_user):
     try:
         date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
         
-        # Find all transactions for the date
-        date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-        next_date = date_obj + timedelta(days=1)
+        export_format = request.args.get('format', 'json').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                'status': 'error',
+                'message': f'Unsupported format: {export_format}'
+            }), 400
         
-        transactions = ParkingTransactions.query\
-            .filter(ParkingTransactions.created_at >= date_obj)\
-            .filter(ParkingTransactions.created_at < next_date)\
-            .all()
+        date_obj = datetime.strptime(date, '%Y-%m-%d')
+        next_date = date_obj + timedelta(days=1)
+        if export_format != 'json':
+            return stream_transactions(date_obj, next_date, export_format, f'transactions-{date}')
         
-        total_amount = sum(float(t.amount or 0) for t in transactions)
+        # The raw transaction list is opt-in; /api/reports/transactions pages through it
+        include_transactions = request.args.get('include_transactions', 'false').lower() == 'true'
         
-        return jsonify({
-            'status': 'success',
-            'data': {
-                'date': date,
-                'totalTransactions': len(transactions),
-                'totalRevenue': total_amount,
-                'transactions': [{
-                    'id': t.Id,
-                    'amount': float(t.amount or 0),
-                    'method': t.payment_method,
-                    'processedAt': t.created_at.isoformat() if t.created_at else None
-                } for t in transactions]
+        def build():
+            # Totals come from the hourly rollup
+            totals = rollup_totals(date_obj, next_date)
+            
+            # The payments table on the dashboard asks for the day's transactions
+            transactions = ParkingTransactions.query\
+                .filter(ParkingTransactions.created_at >= date_obj)\
+                .filter(ParkingTransactions.created_at < next_date)\
+                .all() if include_transactions else []
+            
+            return {
+                'status': 'success',
+                'data': {
+                    'date': date,
+                    'totalTransactions': totals['Transactions'],
+                    'totalRevenue': totals['Revenue'],
+                    'entries': totals['Entries'],
+                    'exits': totals['Exits'],
+                    'transactions': [{
+                        'id': t.Id,
+                        'amount': float(t.amount or 0),
+                        'method': t.payment_method,
+                        'processedAt': t.created_at.isoformat() if t.created_at else None
+                    } for t in transactions]
+                }
             }
-        })
+        
+        return cached_report('daily', {'date': date, 'transactions': include_transactions},
+                             date_obj, next_date, build)
     except Exception as e:
         current_app.logger.error(f"Daily report error: {str(e)}")
         return jsonify({
@@ -570,46 +706,30 @@ def get_weekly_report(current_user):
             end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
             
         start_date = end_date - timedelta(days=6)  # Last 7 days
+        range_start = datetime.combine(start_date, datetime.min.time())
         
-        # Find all transactions for the date range
-        transactions = ParkingTransactions.query\
-            .filter(ParkingTransactions.created_at >= start_date)\
-            .filter(ParkingTransactions.created_at < end_date + timedelta(days=1))\
-            .all()
-        
-        # Group by day
-        daily_totals = {}
-        for t in transactions:
-            day = t.created_at.date()
-            if day not in daily_totals:
-                daily_totals[day] = {'vehicles': 0, 'revenue': 0}
+        def build():
+            # Daily totals, bucketed in SQL and gap-filled
+            daily_data = [{
+                'date': point['bucket'].strftime('%Y-%m-%d'),
+                'day': point['bucket'].strftime('%A'),
+                'vehicles': point['Transactions'],
+                'revenue': point['Revenue']
+            } for point in rollup_series(range_start, range_start + timedelta(days=7), 'day')]
                 
-            daily_totals[day]['vehicles'] += 1
-            daily_totals[day]['revenue'] += float(t.amount or 0)
-            
-        # Format for response
-        daily_data = []
-        current_date = start_date
-        while current_date <= end_date:
-            data = daily_totals.get(current_date, {'vehicles': 0, 'revenue': 0})
-            daily_data.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'day': current_date.strftime('%A'),
-                'vehicles': data['vehicles'],
-                'revenue': data['revenue']
-            })
-            current_date += timedelta(days=1)
-            
-        return jsonify({
-            'status': 'success',
-            'data': {
-                'startDate': start_date.strftime('%Y-%m-%d'),
-                'endDate': end_date.strftime('%Y-%m-%d'),
-                'totalVehicles': sum(d['vehicles'] for d in daily_data),
-                'totalRevenue': sum(d['revenue'] for d in daily_data),
-                'dailyData': daily_data
+            return {
+                'status': 'success',
+                'data': {
+                    'startDate': start_date.strftime('%Y-%m-%d'),
+                    'endDate': end_date.strftime('%Y-%m-%d'),
+                    'totalVehicles': sum(d['vehicles'] for d in daily_data),
+                    'totalRevenue': sum(d['revenue'] for d in daily_data),
+                    'dailyData': daily_data
+                }
             }
-        })
+        
+        return cached_report('weekly', {'end_date': end_date.isoformat()},
+                             start_date, end_date + timedelta(days=1), build)
     except Exception as e:
         current_app.logger.error(f"Weekly report error: {str(e)}")
         return jsonify({
@@ -642,38 +762,314 @@ def get_monthly_report(current_user):
         else:
             end_date = datetime(int(year), int(month) + 1, 1)
             
-        # Find all transactions for the month
-        transactions = ParkingTransactions.query\
-            .filter(ParkingTransactions.created_at >= start_date)\
-            .filter(ParkingTransactions.created_at < end_date)\
+        export_format = request.args.get('format', 'json').lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                'status': 'error',
+                'message': f'Unsupported format: {export_format}'
+            }), 400
+        if export_format != 'json':
+            return stream_transactions(
+                start_date, end_date, export_format, f'transactions-{int(year)}-{int(month):02d}'
+            )
+            
+        include_transactions = request.args.get('include_transactions', 'false').lower() == 'true'
+        
+        def build():
+            # Daily totals, bucketed in SQL and gap-filled
+            daily_data = [{
+                'date': point['bucket'].strftime('%Y-%m-%d'),
+                'vehicles': point['Transactions'],
+                'revenue': point['Revenue']
+            } for point in rollup_series(start_date, end_date, 'day')]
+            
+            # Listing a whole month of transactions is opt-in
+            transactions = ParkingTransactions.query\
+                .filter(ParkingTransactions.created_at >= start_date)\
+                .filter(ParkingTransactions.created_at < end_date)\
+                .all() if include_transactions else []
+            
+            # Format for response
+            return {
+                'status': 'success',
+                'data': {
+                    'month': month,
+                    'year': year,
+                    'totalTransactions': sum(d['vehicles'] for d in daily_data),
+                    'totalRevenue': sum(d['revenue'] for d in daily_data),
+                    'dailyData': daily_data,
+                    'transactions': [{
+                        'id': t.Id,
+                        'amount': float(t.amount or 0),
+                        'method': t.payment_method,
+                        'processedAt': t.created_at.isoformat() if t.created_at else None
+                    } for t in transactions]
+                }
+            }
+        
+        return cached_report('monthly', {'month': int(month), 'year': int(year), 'transactions': include_transactions},
+                             start_date, end_date, build)
+    except Exception as e:
+        current_app.logger.error(f"Monthly report error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to get monthly report',
+            'code': 500
+        }), 500
+
+@report_bp.route('/range', methods=['GET'])
+@limiter.limit("60 per minute;300 per hour")
+@token_required
+def get_range_report(current_user):
+    """Rollup totals over a custom range, per hour, day, week or month"""
+    try:
+        try:
+            start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d')
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d')
+        except (KeyError, ValueError):
+            return jsonify({
+                'status': 'error',
+                'message': 'start_date and end_date are required (YYYY-MM-DD)'
+            }), 400
+        bucket = request.args.get('bucket', 'day')
+        if bucket not in BUCKET_SIZES or end_date <= start_date:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid range or bucket: {bucket}'
+            }), 400
+        
+        def build():
+            series = rollup_series(start_date, end_date, bucket)
+            return {
+                'status': 'success',
+                'data': {
+                    'startDate': start_date.strftime('%Y-%m-%d'),
+                    'endDate': end_date.strftime('%Y-%m-%d'),
+                    'bucket': bucket,
+                    'totals': {
+                        metric[0].lower() + metric[1:]: sum(point[metric] for point in series)
+                        for metric in METRICS
+                    },
+                    'series': [{
+                        'bucket': point['bucket'].isoformat(),
+                        **{metric[0].lower() + metric[1:]: point[metric] for metric in METRICS}
+                    } for point in series]
+                }
+            }
+        
+        return cached_report('range', {'start': start_date.isoformat(), 'end': end_date.isoformat(),
+                                       'bucket': bucket}, start_date, end_date, build)
+    except Exception as e:
+        current_app.logger.error(f"Range report error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to get range report',
+            'code': 500
+        }), 500
+
+@report_bp.route('/dwell', methods=['GET'])
+@limiter.limit("60 per minute;300 per hour")
+@token_required
+def get_dwell_report(current_user):
+    """Stay length percentiles by vehicle type and/or hour of day"""
+    try:
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d') \
+                if request.args.get('start_date') else today
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d') \
+                if request.args.get('end_date') else start_date + timedelta(days=1)
+            group_by = tuple(key for key in request.args.get('by', 'vehicle_type').split(',') if key)
+            quantiles = tuple(float(q) for q in request.args.get('q', '0.5,0.9,0.99').split(','))
+            if not all(0 <= q <= 1 for q in quantiles):
+                raise ValueError('Quantiles must be between 0 and 1')
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        def build():
+            return {
+                'status': 'success',
+                'data': {
+                    'startDate': start_date.strftime('%Y-%m-%d'),
+                    'endDate': end_date.strftime('%Y-%m-%d'),
+                    'by': list(group_by),
+                    'groups': dwell_quantiles(start_date, end_date, by=group_by, qs=quantiles)
+                }
+            }
+        
+        try:
+            return cached_report('dwell', {'start': start_date.isoformat(), 'end': end_date.isoformat(),
+                                           'by': group_by, 'q': quantiles}, start_date, end_date, build)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+    except Exception as e:
+        current_app.logger.error(f"Dwell report error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to get dwell report',
+            'code': 500
+        }), 500
+
+@report_bp.route('/archive', methods=['GET'])
+@limiter.limit("30 per minute;300 per hour")
+@token_required
+def get_archive_report(current_user):
+    """Long-range totals from the monthly columnar archive"""
+    try:
+        dataset = request.args.get('dataset', 'transactions')
+        group_by = request.args.get('by') or None
+        try:
+            start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d')
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d')
+        except (KeyError, ValueError):
+            return jsonify({
+                'status': 'error',
+                'message': 'start_date and end_date are required (YYYY-MM-DD)'
+            }), 400
+        
+        reader = ArchiveReader()
+        try:
+            groups = reader.aggregate(dataset, start_date, end_date, by=group_by)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'dataset': dataset,
+                'startDate': start_date.strftime('%Y-%m-%d'),
+                'endDate': end_date.strftime('%Y-%m-%d'),
+                'by': group_by,
+                'archivedMonths': reader.months(),
+                'groups': [{'key': key, **metrics} for key, metrics in groups.items()]
+            }
+        })
+    except Exception as e:
+        current_app.logger.error(f"Archive report error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to get archive report',
+            'code': 500
+        }), 500
+
+@report_bp.route('/liability', methods=['GET'])
+@limiter.limit("60 per minute;300 per hour")
+@token_required
+def get_liability_report(current_user):
+    """Amount owed by all currently parked vehicles if they exited now"""
+    try:
+        as_of = datetime.utcnow()
+        
+        rows = db.session.query(ParkingTickets.EntryTime, Vehicles.vehicle_type)\
+            .outerjoin(Vehicles, Vehicles.Id == ParkingTickets.VehicleId)\
+            .filter(ParkingTickets.Status == 'active')\
             .all()
         
-        total_amount = sum(float(t.amount or 0) for t in transactions)
+        entry_times = np.array([r[0] for r in rows], dtype='datetime64[s]')
+        vehicle_types = np.array([r[1] or 'UNKNOWN' for r in rows], dtype=str)
+        fees = quote_fees(entry_times, as_of, vehicle_types)
+        
+        # Group by vehicle type
+        types, codes = np.unique(vehicle_types, return_inverse=True)
+        counts = np.bincount(codes, minlength=len(types))
+        amounts = np.bincount(codes, weights=fees, minlength=len(types))
         
-        # Format for response
         return jsonify({
             'status': 'success',
             'data': {
-                'month': month,
-                'year': year,
-                'totalTransactions': len(transactions),
-                'totalRevenue': total_amount,
-                'transactions': [{
-                    'id': t.Id,
-                    'amount': float(t.amount or 0),
-                    'method': t.payment_method,
-                    'processedAt': t.created_at.isoformat() if t.created_at else None
-                } for t in transactions]
+                'asOf': as_of.isoformat(),
+                'openTickets': int(fees.size),
+                'totalLiability': round(float(fees.sum()), 2),
+                'byVehicleType': [{
+                    'vehicleType': str(vehicle_type),
+                    'openTickets': int(count),
+                    'liability': round(float(amount), 2)
+                } for vehicle_type, count, amount in zip(types, counts, amounts)]
             }
         })
     except Exception as e:
-        current_app.logger.error(f"Monthly report error: {str(e)}")
+        current_app.logger.error(f"Liability report error: {str(e)}")
         return jsonify({
             'status': 'error',
-            'message': 'Failed to get monthly report',
+            'message': 'Failed to get liability report',
             'code': 500
         }), 500
 
+@report_bp.route('/tariff-simulation', methods=['POST'])
+@limiter.limit("10 per minute;30 per hour")
+@token_required
+def simulate_tariff(current_user):
+    """
+    Replay completed tickets against proposed rates
+
+    Streams newline-delimited JSON: a progress record per chunk of tickets,
+    then a result record with revenue deltas per vehicle type and hour.
+    """
+    try:
+        data = request.get_json() or {}
+        
+        # Validate required fields
+        for field in ['start_date', 'end_date', 'rates']:
+            if field not in data:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Missing required field: {field}'
+                }), 400
+        
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d')
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d') + timedelta(days=1)
+        chunk_size = max(100, min(int(data.get('chunk_size', 5000)), 50000))
+        
+        proposed = []
+        for rate in data['rates']:
+            for field in ['VehicleType', 'DurationType', 'BaseDuration', 'BaseRate']:
+                if field not in rate:
+                    return jsonify({
+                        'status': 'error',
+                        'message': f'Missing required rate field: {field}'
+                    }), 400
+            proposed.append(ParkingRate(
+                VehicleType=rate['VehicleType'],
+                DurationType=rate['DurationType'],
+                BaseDuration=int(rate['BaseDuration']),
+                BaseRate=float(rate['BaseRate']),
+                AdditionalRate=rate.get('AdditionalRate'),
+                MaxDailyRate=rate.get('MaxDailyRate')
+            ))
+        
+        candidate = build_candidate_table(proposed)
+    except (ValueError, TypeError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid simulation parameters: {str(e)}'
+        }), 400
+    except Exception as e:
+        current_app.logger.error(f"Tariff simulation error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to start tariff simulation',
+            'code': 500
+        }), 500
+    
+    def generate():
+        try:
+            for record in ParkingService.simulate_tariff(candidate, start_date, end_date, chunk_size):
+                yield json.dumps(record) + '\n'
+        except Exception as e:
+            current_app.logger.error(f"Tariff simulation error: {str(e)}")
+            yield json.dumps({'type': 'error', 'message': 'Tariff simulation failed'}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @report_bp.route('/recent-transactions')
 @limiter.limit("60 per minute")
 @token_required
@@ -709,8 +1105,7 @@ def get_recent_transactions(current_user):
 @token_required
 def get_transactions(current_user):
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        cursor, per_page, total = page_args(request.args)
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
@@ -723,10 +1118,15 @@ def get_transactions(current_user):
         if end_date:
             query = query.filter(ParkingTransactions.created_at < end_date)
             
-        # Order by and paginate
-        transactions = query.order_by(
-            ParkingTransactions.created_at.desc()
-        ).paginate(page=page, per_page=per_page)
+        # Newest first, one keyset page at a time
+        try:
+            page = keyset_page(query, ParkingTransactions.created_at, ParkingTransactions.Id,
+                               cursor=cursor, limit=per_page, total=total)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
         
         return jsonify({
             'status': 'success',
@@ -739,13 +1139,8 @@ def get_transactions(current_user):
                     'payment_method': t.payment_method,
                     'processed_by': t.processed_by,
                     'created_at': t.created_at.isoformat() if t.created_at else None
-                } for t in transactions.items],
-                'pagination': {
-                    'total': transactions.total,
-                    'pages': transactions.pages,
-                    'page': transactions.page,
-                    'per_page': transactions.per_page
-                }
+                } for t in page['items']],
+                'pagination': pagination_info(page, per_page)
             }
         })
     except Exception as e:
@@ -770,7 +1165,8 @@ def root():
     return redirect(url_for('dashboard'))
 
 @main_bp.route('/exit')
-def exit():
+@token_required
+def exit(current_user):
     """Handle exit requests"""
     try:
         # Get ticket ID from query parameters
@@ -792,19 +1188,19 @@ def exit():
         duration = exit_time - ticket.EntryTime
         hours = duration.total_seconds() / 3600
 
-        # Get parking rate
-        rate = ParkingRate.query.filter_by(
-            VehicleType=ticket.VehicleType,
-            DurationType='hourly'
-        ).first()
-
-        if not rate:
-            return jsonify({'status': 'error', 'message': 'Parking rate not found'}), 404
-
         # Calculate fee
-        base_fee = float(rate.BaseRate)
-        additional_fee = float(rate.AdditionalRate) if rate.AdditionalRate else 0
-        total_fee = base_fee + (max(0, hours - rate.BaseDuration) * additional_fee)
+        vehicle = Vehicles.query.get(ticket.VehicleId)
+        plate_number = vehicle.plate_number if vehicle else None
+        total_fee = quote_fee(ticket.EntryTime, exit_time, vehicle.vehicle_type if vehicle else '')
+
+        # Update ticket status; only one lane can close the ticket
+        minutes = int(duration.total_seconds() // 60)
+        closed = ParkingService.close_ticket(ticket.Id, exit_time, total_fee, minutes)
+        index_ticket_exit(ticket.TicketNumber)
+        if not closed:
+            db.session.rollback()
+            return jsonify({'status': 'error', 'message': 'Ticket already processed'}), 409
+        record_exit(exit_time, vehicle.vehicle_type if vehicle else None, minutes, total_fee)
 
         # Create transaction
         transaction_data = {
@@ -814,25 +1210,16 @@ def exit():
             'payment_method': 'CASH',
             'status': 'COMPLETED',
             'processed_by': current_user.Id,
-            'transaction_number': f'TXN{datetime.now().strftime("%Y%m%d%H%M%S")}'
+            'transaction_number': generate_transaction_id(),
+            'created_at': exit_time
         }
         processed_txn = ParkingTransactions(**transaction_data)
         db.session.add(processed_txn)
 
-        # Update ticket status
-        ticket.ExitTime = exit_time
-        ticket.Status = 'completed'
-        ticket.Amount = total_fee
-
-        # Update parking space
-        space = ParkingSpaces.query.get(ticket.SpaceId)
-        if space:
-            space.IsOccupied = False
-
         # Log activity
         activity_data = {
             'Action': 'exit',
-            'Details': f'Vehicle {ticket.PlateNumber} exited. Fee: {total_fee}',
+            'Details': f'Vehicle {plate_number} exited. Fee: {total_fee}',
             'Status': 'success'
         }
         activity = ActivityLog(**activity_data)
@@ -844,7 +1231,7 @@ def exit():
             'status': 'success',
             'data': {
                 'ticket_id': ticket.Id,
-                'plate_number': ticket.PlateNumber,
+                'plate_number': plate_number,
                 'entry_time': ticket.EntryTime.isoformat(),
                 'exit_time': exit_time.isoformat(),
                 'duration_hours': round(hours, 2),
@@ -857,6 +1244,57 @@ def exit():
         current_app.logger.error(f"Exit error: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# Ticket number leases for gate-in terminals
+@lease_bp.route('', methods=['POST'])
+@limiter.limit("30 per minute")
+def lease_ticket_numbers():
+    """Lease a block of ticket numbers that a terminal hands out locally"""
+    try:
+        api_key = current_app.config.get('TERMINAL_API_KEY')
+        if not api_key or request.headers.get('X-Terminal-Key') != api_key:
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid terminal key',
+                'code': 401
+            }), 401
+        
+        data = request.get_json() or {}
+        terminal_id = data.get('terminal_id')
+        if not terminal_id:
+            return jsonify({
+                'status': 'error',
+                'message': 'Missing required field: terminal_id'
+            }), 400
+        
+        try:
+            size = int(data.get('size', 1000))
+        except (TypeError, ValueError):
+            return jsonify({
+                'status': 'error',
+                'message': 'Invalid block size'
+            }), 400
+        size = max(1, min(size, current_app.config['TICKET_LEASE_MAX_SIZE']))
+        
+        lease = ParkingService.lease_ticket_numbers(str(terminal_id)[:50], size)
+        
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'lease_id': lease.Id,
+                'terminal_id': lease.TerminalId,
+                'start': lease.StartNumber,
+                'end': lease.EndNumber
+            }
+        })
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Ticket lease error: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to lease ticket numbers',
+            'code': 500
+        }), 500
+
 # Health check endpoint
 @health_bp.route('/health', methods=['GET'])
 def health_check():
@@ -1,12 +1,32 @@
 from datetime import datetime, timedelta
+import time
 import uuid
-from typing import Dict, Optional, Tuple, Any, List
+from typing import Dict, Optional, Tuple, Any, List, Iterator
 
-from .models import ParkingTickets, ParkingTransactions, ParkingRate, ActivityLog, db
+import numpy as np
+from flask import current_app
+from sqlalchemy import and_, case, func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from .models import (
+    ParkingTickets, ParkingTransactions, ActivityLog, Vehicles, ParkingSpaces, TicketNumberLeases, db, normalized_plate
+)
+from .tariff import quote_fee, quote_fees, get_tariff_table, TariffTable
+from .active_index import find_active_ticket, index_ticket_exit
+from .bucketing import hour_of_day
+from .rollup import RollupBatch, record_exit
+from .space_counters import release_spaces
+from .utils import generate_transaction_id, normalize_plate
+from .pagination import keyset_page
+
+# Active sessions come back in large columnar pages so a full lot fits in one request
+ACTIVE_SESSIONS_PAGE_SIZE = 500
+ACTIVE_SESSIONS_MAX_PAGE_SIZE = 5000
 
 class ParkingService:
     @staticmethod
-    def calculate_parking_fee(entry_time: datetime, exit_time: datetime, vehicle_type: str) -> float:
+    def calculate_parking_fee(entry_time: datetime, exit_time: datetime, vehicle_type: str,
+                              membership_type: Optional[str] = None) -> float:
         """
         Calculate parking fee based on duration and vehicle type
         
@@ -14,33 +34,13 @@ class ParkingService:
             entry_time: When the vehicle entered
             exit_time: When the vehicle is exiting
             vehicle_type: The type of vehicle
+            membership_type: Membership type of the driver as verified by the server, if any;
+                never a value supplied by the client
             
         Returns:
             float: The calculated parking fee
         """
-        # Get the rate for this vehicle type
-        rate = ParkingRate.query.filter_by(VehicleType=vehicle_type).first()
-        if not rate:
-            # Default rate if not found
-            base_rate = 5.0
-            hourly_rate = 2.0
-        else:
-            base_rate = float(rate.BaseRate)
-            hourly_rate = float(rate.AdditionalRate or 2.0)
-        
-        # Calculate duration in hours
-        duration = exit_time - entry_time
-        hours = duration.total_seconds() / 3600
-        
-        # Calculate fee (base rate + hourly rate * hours)
-        # First hour is covered by base rate
-        if hours <= 1:
-            fee = base_rate
-        else:
-            additional_hours = hours - 1
-            fee = base_rate + (hourly_rate * additional_hours)
-            
-        return round(fee, 2)
+        return quote_fee(entry_time, exit_time, vehicle_type, membership_type=membership_type)
     
     @staticmethod
     def get_active_ticket(ticket_id: Optional[str] = None, plate_number: Optional[str] = None) -> Optional[ParkingTickets]:
@@ -54,24 +54,33 @@ class ParkingService:
         Returns:
             ParkingTickets or None: The active ticket if found
         """
-        query = ParkingTickets.query.filter_by(Status='active')
-        
-        if ticket_id:
-            return query.filter_by(TicketNumber=ticket_id).first()
-        
-        if plate_number:
-            return query.filter(ParkingTickets.VehicleId.has(plate_number=plate_number)).first()
-            
-        return None
+        active = find_active_ticket(ticket_number=ticket_id, plate_number=plate_number)
+        if not active:
+            return None
+        
+        ticket = db.session.get(ParkingTickets, active.Id)
+        if ticket is None or ticket.Status != 'active':
+            # Closed by another worker since it was indexed
+            index_ticket_exit(active.TicketNumber)
+            query = ParkingTickets.query.filter_by(Status='active')
+            if ticket_id:
+                return query.filter_by(TicketNumber=ticket_id).first()
+            return query.join(Vehicles, Vehicles.Id == ParkingTickets.VehicleId).filter(
+                Vehicles.plate_number == plate_number
+            ).order_by(ParkingTickets.EntryTime.desc()).first()
+        return ticket
     
     @staticmethod
-    def create_transaction(ticket: ParkingTickets, amount: float) -> ParkingTransactions:
+    def create_transaction(ticket: ParkingTickets, amount: float, payment_method: str = 'cash',
+                           commit: bool = True) -> ParkingTransactions:
         """
         Create a new parking transaction
         
         Args:
             ticket: The parking ticket
             amount: The transaction amount
+            payment_method: Payment method used (cash, card, etc)
+            commit: Commit immediately, or leave it to the caller's transaction
             
         Returns:
             ParkingTransactions: The newly created transaction
@@ -79,20 +88,21 @@ class ParkingService:
         transaction_data = {
             'Id': str(uuid.uuid4()),
             'ticket_id': str(ticket.Id),
-            'transaction_number': f"TX-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+            'transaction_number': generate_transaction_id(),
             'amount': amount,
-            'payment_method': 'cash',  # Default method
+            'payment_method': payment_method,
             'status': 'completed'
         }
         
         transaction = ParkingTransactions(**transaction_data)
         db.session.add(transaction)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
         return transaction
     
     @staticmethod
-    def log_activity(action: str, details: str, status: str = 'success') -> ActivityLog:
+    def log_activity(action: str, details: str, status: str = 'success', commit: bool = True) -> ActivityLog:
         """
         Log system activity
         
@@ -100,6 +110,7 @@ class ParkingService:
             action: The action performed
             details: Details about the action
             status: Status of the action
+            commit: Commit immediately, or leave it to the caller's transaction
             
         Returns:
             ActivityLog: The created log entry
@@ -113,7 +124,8 @@ class ParkingService:
         
         activity = ActivityLog(**activity_data)
         db.session.add(activity)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
         return activity
     
@@ -135,35 +147,44 @@ class ParkingService:
             end_date = datetime.now()
             
         # Get completed transactions
-        transactions = ParkingTransactions.query.filter(
-            ParkingTransactions.created_at.between(start_date, end_date),
-            ParkingTransactions.status == 'completed'
-        ).all()
-        
-        # Calculate statistics
-        total_revenue = sum(float(t.amount) for t in transactions)
-        total_vehicles = len(transactions)
+        total_vehicles, total_revenue = db.session.execute(
+            db.select(
+                func.count(ParkingTransactions.Id),
+                func.coalesce(func.sum(ParkingTransactions.amount), 0)
+            ).where(
+                ParkingTransactions.created_at.between(start_date, end_date),
+                ParkingTransactions.status == 'completed'
+            )
+        ).one()
+        total_revenue = float(total_revenue)
         
         # Get statistics by vehicle type
-        vehicle_stats = {}
-        tickets = ParkingTickets.query.filter(
-            ParkingTickets.ExitTime.between(start_date, end_date),
-            ParkingTickets.Status == 'completed'
+        vehicle_type = func.coalesce(Vehicles.vehicle_type, 'Unknown').label('vehicle_type')
+        rows = db.session.execute(
+            db.select(
+                vehicle_type,
+                func.count(func.distinct(ParkingTickets.Id)).label('count'),
+                func.coalesce(func.sum(ParkingTransactions.amount), 0).label('revenue')
+            ).select_from(ParkingTickets).outerjoin(
+                Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+            ).outerjoin(
+                ParkingTransactions, and_(
+                    ParkingTransactions.ticket_id == func.cast(ParkingTickets.Id, db.String),
+                    ParkingTransactions.created_at.between(start_date, end_date),
+                    ParkingTransactions.status == 'completed'
+                )
+            ).where(
+                ParkingTickets.ExitTime.between(start_date, end_date),
+                ParkingTickets.Status == 'completed'
+            ).group_by(vehicle_type)
         ).all()
         
-        for ticket in tickets:
-            # Use the related vehicle to get vehicle_type
-            vehicle_type = ticket.VehicleId.vehicle_type if ticket.VehicleId else "Unknown"
-            if vehicle_type not in vehicle_stats:
-                vehicle_stats[vehicle_type] = {
-                    'count': 0,
-                    'revenue': 0
-                }
-            
-            vehicle_stats[vehicle_type]['count'] += 1
-            vehicle_trans = next((t for t in transactions if t.ticket_id == str(ticket.Id)), None)
-            if vehicle_trans:
-                vehicle_stats[vehicle_type]['revenue'] += float(vehicle_trans.amount)
+        vehicle_stats = {
+            row.vehicle_type: {
+                'count': row.count,
+                'revenue': float(row.revenue)
+            } for row in rows
+        }
                 
         return {
             'total_vehicles': total_vehicles,
@@ -198,17 +219,26 @@ class ParkingService:
         return True, ticket, "Ticket is valid"
         
     @staticmethod
-    def process_vehicle_exit(ticket_number: str, payment_method: str = 'cash') -> Dict[str, Any]:
+    def process_vehicle_exit(ticket_number: str, payment_method: str = 'cash',
+                             membership_type: Optional[str] = None, fast: Optional[bool] = None) -> Dict[str, Any]:
         """
         Process a vehicle exit using a ticket
         
         Args:
             ticket_number: The ticket number
             payment_method: Payment method used (cash, card, etc)
+            membership_type: Membership type of the driver as verified by the server, if any;
+                never a value supplied by the client
+            fast: Use the single-transaction exit path (defaults to FAST_EXIT)
             
         Returns:
             Dict: Result of the exit operation
         """
+        if fast is None:
+            fast = current_app.config.get('FAST_EXIT', True)
+        if fast:
+            return ParkingService.process_vehicle_exit_fast(ticket_number, payment_method, membership_type)
+        
         is_valid, ticket, message = ParkingService.validate_ticket(ticket_number)
         
         if not is_valid:
@@ -233,9 +263,9 @@ class ParkingService:
         # Calculate parking fee
         exit_time = datetime.now()
         vehicle_type = "Standard"
+        vehicle = None
         if ticket and ticket.VehicleId:
             # Get the vehicle type from the related Vehicle object
-            from .models import Vehicles
             vehicle = Vehicles.query.get(ticket.VehicleId)
             if vehicle:
                 vehicle_type = vehicle.vehicle_type
@@ -244,20 +274,39 @@ class ParkingService:
             fee = ParkingService.calculate_parking_fee(
                 ticket.EntryTime, 
                 exit_time, 
-                vehicle_type
+                vehicle_type,
+                membership_type
             )
             
-            # Update ticket
-            ticket.ExitTime = exit_time
-            ticket.Status = 'completed'
-            ticket.Amount = fee
+            # Update ticket, unless another lane closed it since validation
+            duration = int((exit_time - ticket.EntryTime).total_seconds() // 60)
+            if not ParkingService.close_ticket(ticket.Id, exit_time, fee, duration):
+                db.session.rollback()
+                index_ticket_exit(ticket.TicketNumber)
+                message = "Ticket has already been used for exit"
+                ParkingService.log_activity(
+                    action="VEHICLE_EXIT_FAILED",
+                    details=f"Failed exit attempt: {message} for ticket {ticket_number}",
+                    status="failed"
+                )
+                return {
+                    'success': False,
+                    'message': message,
+                    'ticket': {
+                        'id': ticket.Id,
+                        'ticket_number': ticket.TicketNumber,
+                        'status': ticket.Status
+                    }
+                }
             
             # Create transaction
-            transaction = ParkingService.create_transaction(ticket, fee)
-            transaction.payment_method = payment_method
+            transaction = ParkingService.create_transaction(ticket, fee, payment_method, commit=False)
+            transaction.created_at = exit_time
+            record_exit(exit_time, vehicle.vehicle_type if vehicle else None, duration, fee)
             
             # Save changes
             db.session.commit()
+            index_ticket_exit(ticket.TicketNumber)
             
             # Log activity
             ParkingService.log_activity(
@@ -296,6 +345,419 @@ class ParkingService:
             'ticket': None
         }
         
+    @staticmethod
+    def close_ticket(ticket_id: int, exit_time: datetime, amount: float, duration: int) -> bool:
+        """
+        Move an active ticket to 'completed', unless another lane got there first
+        
+        The UPDATE is conditional on the ticket still being active, so when
+        two lanes scan the same ticket exactly one of them closes it, without
+        locking the table. The ticket's space, if it has one, is freed and
+        counted out of the occupancy counters in the same transaction. The
+        commit is left to the caller, which should roll back when this
+        returns False.
+        
+        Args:
+            ticket_id: The ticket Id
+            exit_time: When the vehicle is exiting
+            amount: The parking fee
+            duration: Length of stay in minutes
+            
+        Returns:
+            bool: True if this call closed the ticket
+        """
+        statement = db.update(ParkingTickets).where(
+            ParkingTickets.Id == ticket_id,
+            ParkingTickets.Status == 'active',
+            ParkingTickets.ExitTime.is_(None)
+        ).values(
+            ExitTime=exit_time,
+            Status='completed',
+            Amount=amount,
+            Duration=duration
+        )
+        if db.engine.dialect.update_returning:
+            row = db.session.execute(statement.returning(ParkingTickets.SpaceId)).first()
+            if row is None:
+                return False
+            space_id = row.SpaceId
+        else:
+            if db.session.execute(statement).rowcount != 1:
+                return False
+            space_id = db.session.execute(
+                db.select(ParkingTickets.SpaceId).where(ParkingTickets.Id == ticket_id)
+            ).scalar()
+        if space_id:
+            release_spaces([space_id])
+        return True
+    
+    @staticmethod
+    def process_vehicle_exit_fast(ticket_number: str, payment_method: str = 'cash',
+                                  membership_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Process a vehicle exit in a single database transaction
+        
+        The ticket and vehicle type come from the active ticket index (one
+        query on a miss), the fee is quoted
+        from the in-memory tariff table, and the ticket is closed with a
+        conditional UPDATE (with RETURNING where the database supports it).
+        The transaction and audit rows are written in the same transaction,
+        so an exit costs one commit instead of three.
+        
+        Args:
+            ticket_number: The ticket number
+            payment_method: Payment method used (cash, card, etc)
+            membership_type: Membership type of the driver as verified by the server, if any;
+                never a value supplied by the client
+            
+        Returns:
+            Dict: Result of the exit operation, same shape as process_vehicle_exit
+        """
+        # A scan of an active ticket resolves from the index without a query
+        row = find_active_ticket(ticket_number=ticket_number)
+        message = None
+        if not row:
+            row = db.session.execute(
+                db.select(
+                    ParkingTickets.Id, ParkingTickets.TicketNumber, ParkingTickets.Status
+                ).where(ParkingTickets.TicketNumber == ticket_number)
+            ).first()
+            if not row:
+                message = "Ticket not found"
+            else:
+                message = f"Invalid ticket status: {row.Status}"
+        
+        exit_time = datetime.now()
+        if not message:
+            fee = quote_fee(row.EntryTime, exit_time, row.vehicle_type or "Standard", membership_type=membership_type)
+            duration = int((exit_time - row.EntryTime).total_seconds() // 60)
+            
+            claimed = ParkingService.close_ticket(row.Id, exit_time, fee, duration)
+            index_ticket_exit(ticket_number)
+            if not claimed:
+                db.session.rollback()
+                message = "Ticket has already been used for exit"
+        
+        if message:
+            ParkingService.log_activity(
+                action="VEHICLE_EXIT_FAILED",
+                details=f"Failed exit attempt: {message} for ticket {ticket_number}",
+                status="failed"
+            )
+            return {
+                'success': False,
+                'message': message,
+                'ticket': {
+                    'id': row.Id,
+                    'ticket_number': row.TicketNumber,
+                    'status': getattr(row, 'Status', 'active')
+                } if row else None
+            }
+        
+        transaction = ParkingTransactions(
+            Id=str(uuid.uuid4()),
+            ticket_id=str(row.Id),
+            transaction_number=generate_transaction_id(),
+            amount=fee,
+            payment_method=payment_method,
+            status='completed',
+            created_at=exit_time
+        )
+        db.session.add(transaction)
+        record_exit(exit_time, row.vehicle_type, duration, fee)
+        ParkingService.log_activity(
+            action="VEHICLE_EXIT",
+            details=f"Vehicle exit processed: {row.TicketNumber}, Fee: {fee}",
+            status="success",
+            commit=False
+        )
+        db.session.commit()
+        
+        return {
+            'success': True,
+            'message': "Exit processed successfully",
+            'ticket': {
+                'id': row.Id,
+                'ticket_number': row.TicketNumber,
+                'entry_time': row.EntryTime,
+                'exit_time': exit_time,
+                'status': 'completed',
+                'fee': fee
+            },
+            'fee': fee,
+            'transaction': {
+                'id': transaction.Id,
+                'amount': transaction.amount,
+                'payment_method': transaction.payment_method,
+                'timestamp': transaction.created_at
+            }
+        }
+        
+    @staticmethod
+    def bulk_close_tickets(ticket_numbers: Optional[List[str]] = None, older_than_hours: Optional[float] = None,
+                           vehicle_type: Optional[str] = None, payment_method: str = 'cash',
+                           user_id: Optional[str] = None, chunk_size: int = 500,
+                           dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Close many active tickets at once, e.g. for lost tickets or an end-of-day sweep
+        
+        Fees for all matching tickets are quoted in one vectorized pass. Each
+        chunk is then written in its own transaction: one conditional UPDATE
+        for the tickets and bulk inserts for the transactions and activity
+        log. A ticket closed by a lane in the meantime is reported as a
+        failure, as is every ticket of a chunk whose transaction failed.
+        
+        Args:
+            ticket_numbers: Only close these tickets
+            older_than_hours: Only close tickets that entered at least this long ago
+            vehicle_type: Only close tickets of this vehicle type
+            payment_method: Payment method recorded on the transactions
+            user_id: The operator performing the sweep
+            chunk_size: Tickets written per transaction
+            dry_run: Only quote the fees, without closing anything
+            
+        Returns:
+            Dict: Counts, total amount, throughput and per-ticket failures
+        """
+        started = time.perf_counter()
+        exit_time = datetime.now()
+        
+        query = db.select(
+            ParkingTickets.Id, ParkingTickets.TicketNumber, ParkingTickets.EntryTime,
+            ParkingTickets.SpaceId, Vehicles.vehicle_type
+        ).outerjoin(
+            Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+        ).where(ParkingTickets.Status == 'active', ParkingTickets.ExitTime.is_(None))
+        if ticket_numbers:
+            query = query.where(ParkingTickets.TicketNumber.in_(ticket_numbers))
+        if older_than_hours is not None:
+            query = query.where(ParkingTickets.EntryTime <= exit_time - timedelta(hours=older_than_hours))
+        if vehicle_type:
+            query = query.where(func.upper(Vehicles.vehicle_type) == vehicle_type.upper())
+        rows = db.session.execute(query.order_by(ParkingTickets.Id)).all()
+        
+        failures = []
+        if ticket_numbers:
+            matched = {row.TicketNumber for row in rows}
+            failures.extend({
+                'ticket_number': number,
+                'reason': 'Ticket not found or not active'
+            } for number in dict.fromkeys(ticket_numbers) if number not in matched)
+        
+        fees = quote_fees(
+            [row.EntryTime for row in rows], exit_time,
+            [row.vehicle_type or "Standard" for row in rows]
+        ) if rows else np.zeros(0)
+        
+        closed = 0
+        total_amount = 0.0
+        chunks = 0
+        if not dry_run:
+            for offset in range(0, len(rows), chunk_size):
+                chunk = rows[offset:offset + chunk_size]
+                chunk_fees = [float(fee) for fee in fees[offset:offset + chunk_size]]
+                chunks += 1
+                try:
+                    claimed = ParkingService._close_ticket_chunk(
+                        chunk, chunk_fees, exit_time, payment_method, user_id
+                    )
+                    db.session.commit()
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"Bulk close chunk {chunks} failed: {str(e)}")
+                    failures.extend({
+                        'ticket_number': row.TicketNumber,
+                        'reason': f'Database error: {str(e)}'
+                    } for row in chunk)
+                    continue
+                
+                for row, fee in zip(chunk, chunk_fees):
+                    if row.Id in claimed:
+                        index_ticket_exit(row.TicketNumber)
+                        closed += 1
+                        total_amount += fee
+                    else:
+                        failures.append({
+                            'ticket_number': row.TicketNumber,
+                            'reason': 'Ticket has already been used for exit'
+                        })
+        
+        elapsed = time.perf_counter() - started
+        return {
+            'dry_run': dry_run,
+            'matched': len(rows),
+            'closed': closed,
+            'failed': len(failures),
+            'total_amount': round(float(fees.sum()) if dry_run else total_amount, 2),
+            'chunks': chunks,
+            'elapsed_seconds': round(elapsed, 3),
+            'tickets_per_second': round(closed / elapsed, 1) if closed and elapsed else 0.0,
+            'failures': failures
+        }
+    
+    @staticmethod
+    def _close_ticket_chunk(rows: List[Any], fees: List[float], exit_time: datetime,
+                            payment_method: str, user_id: Optional[str]) -> set:
+        """
+        Write one chunk of a bulk close, leaving the commit to the caller
+        
+        Returns:
+            set: Ids of the tickets this chunk closed
+        """
+        ids = [row.Id for row in rows]
+        amounts = {row.Id: fee for row, fee in zip(rows, fees)}
+        durations = {row.Id: int((exit_time - row.EntryTime).total_seconds() // 60) for row in rows}
+        
+        statement = db.update(ParkingTickets).where(
+            ParkingTickets.Id.in_(ids),
+            ParkingTickets.Status == 'active',
+            ParkingTickets.ExitTime.is_(None)
+        ).values(
+            ExitTime=exit_time,
+            Status='completed',
+            Amount=case(amounts, value=ParkingTickets.Id),
+            Duration=case(durations, value=ParkingTickets.Id)
+        ).execution_options(synchronize_session=False)
+        if db.engine.dialect.update_returning:
+            claimed = set(db.session.execute(statement.returning(ParkingTickets.Id)).scalars())
+        else:
+            db.session.execute(statement)
+            claimed = set(db.session.execute(
+                db.select(ParkingTickets.Id).where(
+                    ParkingTickets.Id.in_(ids),
+                    ParkingTickets.ExitTime == exit_time
+                )
+            ).scalars())
+        if not claimed:
+            return claimed
+        
+        closed_rows = [row for row in rows if row.Id in claimed]
+        db.session.execute(db.insert(ParkingTransactions), [{
+            'Id': str(uuid.uuid4()),
+            'ticket_id': str(row.Id),
+            'transaction_number': generate_transaction_id(),
+            'amount': amounts[row.Id],
+            'payment_method': payment_method,
+            'status': 'completed',
+            'processed_by': user_id,
+            'created_at': exit_time
+        } for row in closed_rows])
+        db.session.execute(db.insert(ActivityLog), [{
+            'Action': 'VEHICLE_EXIT_BULK',
+            'Details': f"Vehicle exit closed in bulk: {row.TicketNumber}, Fee: {amounts[row.Id]}",
+            'Status': 'success',
+            'UserId': user_id,
+            'IsRead': False,
+            'CreatedAt': exit_time
+        } for row in closed_rows])
+        
+        rollup = RollupBatch()
+        for row in closed_rows:
+            rollup.exit(exit_time, row.vehicle_type, durations[row.Id])
+            rollup.transaction(exit_time, row.vehicle_type, amounts[row.Id])
+        rollup.apply()
+        
+        release_spaces([row.SpaceId for row in closed_rows if row.SpaceId])
+        return claimed
+    
+    @staticmethod
+    def get_active_sessions(cursor: Optional[str] = None, limit: int = ACTIVE_SESSIONS_PAGE_SIZE,
+                            vehicle_type: Optional[str] = None, level: Optional[str] = None,
+                            total: Optional[str] = None) -> Dict[str, Any]:
+        """
+        One page of active sessions, newest entry first
+        
+        Vehicles and spaces are joined in the same query and only the
+        columns shown are selected, so a page is a single round trip.
+        
+        Args:
+            cursor: Token from the previous page's next_cursor
+            limit: Page size, capped at ACTIVE_SESSIONS_MAX_PAGE_SIZE
+            vehicle_type: Only sessions of this vehicle type
+            level: Only sessions parked on this level
+            total: 'exact' or 'approx' to count the matching sessions
+            
+        Returns:
+            Dict: Keyset page (see pagination.keyset_page) of rows with
+            Id, TicketNumber, EntryTime, plate_number, vehicle_type,
+            SpaceNumber, Level and Section
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        query = db.session.query(
+            ParkingTickets.Id, ParkingTickets.TicketNumber, ParkingTickets.EntryTime,
+            Vehicles.plate_number, Vehicles.vehicle_type,
+            ParkingSpaces.SpaceNumber, ParkingSpaces.Level, ParkingSpaces.Section
+        ).outerjoin(
+            Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+        ).outerjoin(
+            ParkingSpaces, ParkingSpaces.Id == ParkingTickets.SpaceId
+        ).filter(ParkingTickets.Status == 'active')
+        if vehicle_type:
+            query = query.filter(Vehicles.vehicle_type == vehicle_type)
+        if level:
+            query = query.filter(ParkingSpaces.Level == level)
+        return keyset_page(query, ParkingTickets.EntryTime, ParkingTickets.Id, cursor=cursor, limit=limit,
+                           total=total, max_limit=ACTIVE_SESSIONS_MAX_PAGE_SIZE)
+    
+    @staticmethod
+    def search_vehicles(search: Optional[str] = None, vehicle_type: Optional[str] = None,
+                        status: Optional[str] = None, cursor: Optional[str] = None,
+                        limit: int = 10, total: Optional[str] = None) -> Dict[str, Any]:
+        """
+        One page of registered vehicles, newest first
+        
+        Every filter is served by an index, so a page costs the same however
+        large the registry grows.
+        
+        Args:
+            search: Plate prefix, in any spacing or case
+            vehicle_type: Only vehicles of this type
+            status: 'parked' or 'not_parked' for vehicles with or without an
+                active ticket, or a value of Vehicles.status
+            cursor: Token from the previous page's next_cursor
+            limit: Page size
+            total: 'exact' or 'approx' to count the matching vehicles
+            
+        Returns:
+            Dict: Keyset page (see pagination.keyset_page) of Vehicles, plus
+            entry_times mapping the Id of each parked vehicle on the page to
+            its entry time
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        query = Vehicles.query
+        prefix = normalize_plate(search)
+        if prefix:
+            # A range on the normalized plate index; LIKE could not use it
+            plate = normalized_plate(Vehicles.plate_number)
+            query = query.filter(plate >= prefix, plate < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        if vehicle_type:
+            query = query.filter(Vehicles.vehicle_type == vehicle_type)
+        if status in ('parked', 'not_parked'):
+            active = db.select(ParkingTickets.Id).where(
+                ParkingTickets.VehicleId == Vehicles.Id,
+                ParkingTickets.Status == 'active'
+            ).exists()
+            query = query.filter(active if status == 'parked' else ~active)
+        elif status:
+            query = query.filter(Vehicles.status == status)
+        
+        page = keyset_page(query, Vehicles.created_at, Vehicles.Id, cursor=cursor, limit=limit, total=total)
+        ids = [vehicle.Id for vehicle in page['items']]
+        page['entry_times'] = {}
+        if ids:
+            rows = db.session.execute(
+                db.select(ParkingTickets.VehicleId, func.max(ParkingTickets.EntryTime)).where(
+                    ParkingTickets.VehicleId.in_(ids),
+                    ParkingTickets.Status == 'active'
+                ).group_by(ParkingTickets.VehicleId)
+            ).all()
+            page['entry_times'] = {str(vehicle_id): entry_time for vehicle_id, entry_time in rows}
+        return page
+    
     @staticmethod
     def search_tickets(search_term: str, limit: int = 10) -> List[ParkingTickets]:
         """
@@ -350,36 +812,169 @@ class ParkingService:
         # Get basic statistics
         stats = ParkingService.get_parking_statistics(start_date, end_date)
         
-        # Get hourly breakdown
-        hourly_data = {}
-        for hour in range(24):
-            hour_start = start_date + timedelta(hours=hour)
-            hour_end = hour_start + timedelta(hours=1) - timedelta(microseconds=1)
-            
-            tickets = ParkingTickets.query.filter(
-                ParkingTickets.EntryTime.between(hour_start, hour_end)
-            ).all()
-            
-            hourly_data[hour] = len(tickets)
+        # Get hourly breakdown, busiest hour first
+        hour = hour_of_day(ParkingTickets.EntryTime).label('hour')
+        rows = db.session.execute(
+            db.select(hour, func.count(ParkingTickets.Id).label('entries')).where(
+                ParkingTickets.EntryTime.between(start_date, end_date)
+            ).group_by(hour).order_by(func.count(ParkingTickets.Id).desc(), hour)
+        ).all()
+        
+        hourly_data = dict.fromkeys(range(24), 0)
+        for row in rows:
+            hourly_data[int(row.hour)] = row.entries
             
         # Get peak hour
-        peak_hour = None
-        if hourly_data:
-            peak_hour = max(hourly_data.items(), key=lambda x: x[1])[0]
+        peak_hour = int(rows[0].hour) if rows else 0
         
-        # Add activity logs
-        activity_logs = ActivityLog.query.filter(
-            ActivityLog.CreatedAt.between(start_date, end_date)
-        ).all()
-        
-        # Count issues/errors
-        issues = [log for log in activity_logs if log.Status == 'failed']
+        # Count activity logs and issues/errors
+        activity_count, issue_count = db.session.execute(
+            db.select(
+                func.count(ActivityLog.Id),
+                func.coalesce(func.sum(case((ActivityLog.Status == 'failed', 1), else_=0)), 0)
+            ).where(ActivityLog.CreatedAt.between(start_date, end_date))
+        ).one()
         
         return {
             **stats,
             'hourly_breakdown': hourly_data,
             'peak_hour': peak_hour,
-            'activity_count': len(activity_logs),
-            'issue_count': len(issues),
+            'activity_count': activity_count,
+            'issue_count': issue_count,
             'report_date': report_date.strftime('%Y-%m-%d')
-        } 
\ No newline at end of file
+        }
+
+    @staticmethod
+    def simulate_tariff(candidate: TariffTable, start_date: datetime, end_date: datetime,
+                        chunk_size: int = 5000) -> Iterator[Dict[str, Any]]:
+        """
+        Replay completed tickets against a candidate tariff table
+
+        Tickets are streamed from the database in chunks and rated in
+        vectorized batches under both the current and the candidate rates,
+        so memory use does not depend on the size of the date range.
+
+        Args:
+            candidate: The proposed tariff table
+            start_date: Start of the exit time range
+            end_date: End of the exit time range (exclusive)
+            chunk_size: Number of tickets rated per batch
+
+        Yields:
+            dict: A progress record after every chunk, then the final result
+            with revenue per vehicle type and hour of exit
+        """
+        current = get_tariff_table()
+        
+        filters = (
+            ParkingTickets.Status == 'completed',
+            ParkingTickets.ExitTime >= start_date,
+            ParkingTickets.ExitTime < end_date,
+            # Tickets without an entry time cannot be rated
+            ParkingTickets.EntryTime.isnot(None)
+        )
+        total = db.session.query(db.func.count(ParkingTickets.Id)).filter(*filters).scalar() or 0
+        
+        query = db.select(
+            ParkingTickets.EntryTime, ParkingTickets.ExitTime,
+            ParkingTickets.Amount, Vehicles.vehicle_type
+        ).outerjoin(
+            Vehicles, Vehicles.Id == ParkingTickets.VehicleId
+        ).where(*filters).execution_options(yield_per=chunk_size)
+        
+        # Per vehicle type: [charged, current, candidate] x 24 hours, and counts
+        revenue: Dict[str, np.ndarray] = {}
+        counts: Dict[str, np.ndarray] = {}
+        processed = 0
+        
+        for rows in db.session.execute(query).partitions():
+            entry_times = np.array([r[0] for r in rows], dtype='datetime64[s]')
+            exit_times = np.array([r[1] for r in rows], dtype='datetime64[s]')
+            charged = np.array([float(r[2] or 0) for r in rows], dtype=np.float64)
+            vehicle_types = np.array([r[3] or 'UNKNOWN' for r in rows], dtype=str)
+            
+            fees_current = current.quote_batch(entry_times, exit_times, vehicle_types)
+            fees_candidate = candidate.quote_batch(entry_times, exit_times, vehicle_types)
+            hours = (exit_times.astype('datetime64[h]') - exit_times.astype('datetime64[D]')).astype(np.int64)
+            
+            types, codes = np.unique(vehicle_types, return_inverse=True)
+            codes = codes.reshape(-1)
+            for index, vehicle_type in enumerate(types):
+                mask = codes == index
+                vehicle_type = str(vehicle_type)
+                if vehicle_type not in revenue:
+                    revenue[vehicle_type] = np.zeros((3, 24), dtype=np.float64)
+                    counts[vehicle_type] = np.zeros(24, dtype=np.int64)
+                for row, fees in enumerate((charged, fees_current, fees_candidate)):
+                    np.add.at(revenue[vehicle_type][row], hours[mask], fees[mask])
+                np.add.at(counts[vehicle_type], hours[mask], 1)
+            
+            processed += len(rows)
+            yield {
+                'type': 'progress',
+                'processed': processed,
+                'total': total
+            }
+        
+        vehicle_stats = {}
+        for vehicle_type, values in revenue.items():
+            charged, current_revenue, candidate_revenue = values
+            vehicle_stats[vehicle_type] = {
+                'tickets': int(counts[vehicle_type].sum()),
+                'charged': round(float(charged.sum()), 2),
+                'current': round(float(current_revenue.sum()), 2),
+                'candidate': round(float(candidate_revenue.sum()), 2),
+                'delta': round(float(candidate_revenue.sum() - current_revenue.sum()), 2),
+                'hourly': [{
+                    'hour': hour,
+                    'tickets': int(counts[vehicle_type][hour]),
+                    'current': round(float(current_revenue[hour]), 2),
+                    'candidate': round(float(candidate_revenue[hour]), 2),
+                    'delta': round(float(candidate_revenue[hour] - current_revenue[hour]), 2)
+                } for hour in range(24) if counts[vehicle_type][hour]]
+            }
+        
+        yield {
+            'type': 'result',
+            'processed': processed,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'current_revenue': round(sum(v['current'] for v in vehicle_stats.values()), 2),
+            'candidate_revenue': round(sum(v['candidate'] for v in vehicle_stats.values()), 2),
+            'delta': round(sum(v['delta'] for v in vehicle_stats.values()), 2),
+            'vehicle_stats': vehicle_stats
+        }
+
+    @staticmethod
+    def lease_ticket_numbers(terminal_id: str, size: int, attempts: int = 5) -> TicketNumberLeases:
+        """
+        Lease a block of globally unique ticket numbers to a gate-in terminal
+        
+        Blocks are allocated after the highest block handed out so far. Two
+        concurrent requests can pick the same start; the unique StartNumber
+        makes the loser fail on commit and retry with the next block.
+        
+        Args:
+            terminal_id: The terminal requesting numbers
+            size: Number of ticket numbers in the block
+            attempts: How many times to retry on a conflicting allocation
+            
+        Returns:
+            TicketNumberLeases: The lease, covering [StartNumber, EndNumber)
+        """
+        for attempt in range(attempts):
+            start = db.session.query(db.func.max(TicketNumberLeases.EndNumber)).scalar() or 1
+            lease = TicketNumberLeases(
+                TerminalId=terminal_id,
+                StartNumber=start,
+                EndNumber=start + size
+            )
+            db.session.add(lease)
+            try:
+                db.session.commit()
+                return lease
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == attempts - 1:
+                    raise
+        raise RuntimeError("Could not lease ticket numbers")
@@ -0,0 +1,213 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from sqlalchemy import func
+
+from .events import get_event_log
+from .models import (
+    ActivityLog, HardwareStatus, ParkingTickets, ParkingTransactions, Vehicles, db
+)
+from .rollup import hour_start, rollup_totals
+from .space_counters import occupancy_counts
+
+RECENT_LIMIT = 5
+ACTIVE_SESSIONS_LIMIT = 10
+
+
+class Snapshot(NamedTuple):
+    body: bytes
+    etag: str
+    built_at: float  # time.monotonic()
+    event_id: int  # latest event in the log when the build started
+
+
+class SnapshotCache:
+    """
+    The latest dashboard snapshot, shared by every user
+
+    A snapshot is reused until it is older than the window or any process
+    has logged a dashboard event since it was built; checking the log costs
+    one primary key lookup. Only one
+    request builds at a time: requests arriving during a build wait for it
+    and share its result, so a crowd of operators refreshing after the same
+    event costs one build.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self._building: Optional[threading.Event] = None
+
+    def get(self, max_age: float, build: Callable[[], Dict[str, Any]]) -> Snapshot:
+        log = get_event_log()
+        latest = log.latest_id()
+        while True:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is not None and snapshot.event_id == latest \
+                        and time.monotonic() - snapshot.built_at < max_age:
+                    return snapshot
+                done = self._building
+                if done is None:
+                    done = self._building = threading.Event()
+                    break
+            done.wait()
+            with self._lock:
+                if self._snapshot is not snapshot and self._snapshot is not None:
+                    return self._snapshot
+            # The build we waited for failed; try again
+
+        try:
+            event_id = latest
+            body = json.dumps(build(), separators=(',', ':')).encode()
+            snapshot = Snapshot(body, hashlib.sha256(body).hexdigest()[:32], time.monotonic(), event_id)
+            with self._lock:
+                self._snapshot = snapshot
+            return snapshot
+        finally:
+            with self._lock:
+                self._building = None
+            done.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+
+_cache = SnapshotCache()
+
+
+def get_snapshot_cache() -> SnapshotCache:
+    return _cache
+
+
+def build_snapshot() -> Dict[str, Any]:
+    """
+    Every dashboard widget from one batch of queries
+
+    Returns:
+        Dict: Overview counts, space usage, last-hour and today's rollup
+        totals, the newest active sessions, recent activities, vehicles and
+        transactions, unread notifications and hardware status
+    """
+    now = datetime.now()
+    # EntryTime is stored in UTC, so durations are measured against UTC
+    utc_now = datetime.utcnow()
+
+    # Every space figure comes from the space counters, so they always agree
+    spaces = occupancy_counts()
+    total_spaces = spaces['Total']
+    # The remaining counters in a single round trip; sessions are counted by
+    # ticket, as gate-in tickets often have no space
+    total_vehicles, active_count, unread_count = db.session.execute(db.select(
+        db.select(func.count()).select_from(Vehicles).scalar_subquery(),
+        db.select(func.count()).where(ParkingTickets.Status == 'active').scalar_subquery(),
+        db.select(func.count()).where(ActivityLog.IsRead.is_(False)).scalar_subquery()
+    )).one()
+
+    last_hour = rollup_totals(hour_start(now - timedelta(hours=1)), hour_start(now) + timedelta(hours=1))
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today = rollup_totals(today_start, today_start + timedelta(days=1))
+
+    active_sessions = db.session.execute(
+        db.select(ParkingTickets.TicketNumber, ParkingTickets.EntryTime, Vehicles.plate_number)
+        .outerjoin(Vehicles, Vehicles.Id == ParkingTickets.VehicleId)
+        .where(ParkingTickets.Status == 'active')
+        .order_by(ParkingTickets.EntryTime.desc())
+        .limit(ACTIVE_SESSIONS_LIMIT)
+    ).all()
+    activities = db.session.execute(
+        db.select(ActivityLog).order_by(ActivityLog.CreatedAt.desc(), ActivityLog.Id.desc()).limit(RECENT_LIMIT)
+    ).scalars().all()
+    notifications = db.session.execute(
+        db.select(ActivityLog).where(ActivityLog.IsRead.is_(False))
+        .order_by(ActivityLog.CreatedAt.desc(), ActivityLog.Id.desc()).limit(RECENT_LIMIT)
+    ).scalars().all()
+    vehicles = db.session.execute(
+        db.select(Vehicles).order_by(Vehicles.created_at.desc()).limit(RECENT_LIMIT)
+    ).scalars().all()
+    transactions = db.session.execute(
+        db.select(ParkingTransactions).order_by(ParkingTransactions.created_at.desc()).limit(RECENT_LIMIT)
+    ).scalars().all()
+    devices = db.session.execute(db.select(HardwareStatus).order_by(HardwareStatus.Id)).scalars().all()
+
+    return {
+        'generated_at': now.isoformat(),
+        'overview': {
+            'total_spaces': total_spaces,
+            'occupied_spaces': spaces['Occupied'],
+            'available_spaces': spaces['Available'],
+            'active_sessions': active_count,
+            'total_vehicles': total_vehicles
+        },
+        'spaces': {
+            'total': total_spaces,
+            'occupied': spaces['Occupied'],
+            'available': spaces['Available'],
+            'reserved': spaces['Reserved'],
+            'maintenance': spaces['Maintenance']
+        },
+        'hourly': {
+            'entries': last_hour['Entries'],
+            'exits': last_hour['Exits'],
+            'revenue': last_hour['Revenue']
+        },
+        'today': {
+            'date': today_start.date().isoformat(),
+            'entries': today['Entries'],
+            'exits': today['Exits'],
+            'total_revenue': today['Revenue'],
+            'transaction_count': today['Transactions']
+        },
+        'active_sessions': [{
+            'ticket_number': row.TicketNumber,
+            'vehicle_plate': row.plate_number or 'Unknown',
+            'entry_time': row.EntryTime.isoformat(),
+            'duration': (utc_now - row.EntryTime).total_seconds()
+        } for row in active_sessions],
+        'recent_activities': [{
+            'id': activity.Id,
+            'action': activity.Action,
+            'details': activity.Details,
+            'created_at': activity.CreatedAt.isoformat() if activity.CreatedAt else None,
+            'status': activity.Status
+        } for activity in activities],
+        'notifications': {
+            'unread_count': unread_count,
+            'latest': [{
+                'id': notification.Id,
+                'type': notification.Action,
+                'message': notification.Details,
+                'timestamp': notification.CreatedAt.isoformat() if notification.CreatedAt else None
+            } for notification in notifications]
+        },
+        'recent_vehicles': [{
+            'id': vehicle.Id,
+            'plateNumber': vehicle.plate_number,
+            'vehicleType': vehicle.vehicle_type,
+            'status': vehicle.status,
+            'createdAt': vehicle.created_at.isoformat() if vehicle.created_at else None
+        } for vehicle in vehicles],
+        'recent_transactions': [{
+            'id': transaction.Id,
+            'ticketId': transaction.ticket_id,
+            'transactionNumber': transaction.transaction_number,
+            'amount': float(transaction.amount) if transaction.amount else 0.0,
+            'paymentMethod': transaction.payment_method,
+            'status': transaction.status,
+            'createdAt': transaction.created_at.isoformat() if transaction.created_at else None
+        } for transaction in transactions],
+        'hardware': {
+            'devices': [{
+                'device_id': device.DeviceId,
+                'device_type': device.DeviceType,
+                'location': device.Location,
+                'status': device.Status,
+                'last_ping': device.LastPing.isoformat() if device.LastPing else None
+            } for device in devices]
+        }
+    }
@@ -0,0 +1,305 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, attributes
+
+from .models import ParkingOccupancy, ParkingSpaces, db
+from .rollup import upsert_add
+
+COUNTERS = ('Total', 'Occupied', 'Reserved', 'Maintenance', 'Available')
+GROUP_KEYS = ('Level', 'Section', 'VehicleType')
+_TRACKED = ('Level', 'Section', 'VehicleType', 'IsOccupied', 'Status')
+
+CounterKey = Tuple[str, str, str]
+
+
+def _space_counts(is_occupied: Optional[bool], status: Optional[str]) -> Dict[str, int]:
+    """What a single space adds to each counter"""
+    return {
+        'Total': 1,
+        'Occupied': 1 if is_occupied else 0,
+        'Reserved': 1 if status == 'reserved' else 0,
+        'Maintenance': 1 if status == 'maintenance' else 0,
+        'Available': 1 if not is_occupied and status in (None, 'available') else 0
+    }
+
+
+def _counter_key(level: Optional[str], section: Optional[str], vehicle_type: Optional[str]) -> CounterKey:
+    return (level or '', section or '', vehicle_type or '')
+
+
+class _Deltas:
+    """Counter changes per (level, section, vehicle type)"""
+
+    def __init__(self):
+        self.by_key: Dict[CounterKey, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    def add(self, values: Dict[str, Any], sign: int) -> None:
+        key = _counter_key(values['Level'], values['Section'], values['VehicleType'])
+        for counter, count in _space_counts(values['IsOccupied'], values['Status']).items():
+            self.by_key[key][counter] += sign * count
+
+    def apply(self) -> None:
+        """Add the changes to the counter table, inside the caller's transaction"""
+        rows = [{
+            **dict(zip(GROUP_KEYS, key)),
+            **counts
+        } for key, counts in self.by_key.items() if any(counts.values())]
+        if rows:
+            upsert_add(ParkingOccupancy, GROUP_KEYS, COUNTERS, rows)
+
+
+def _old_values(space: ParkingSpaces) -> Dict[str, Any]:
+    """Tracked columns of a space as they were before the pending changes"""
+    values = {}
+    for name in _TRACKED:
+        history = attributes.get_history(space, name)
+        if history.deleted:
+            values[name] = history.deleted[0]
+        elif history.unchanged:
+            values[name] = history.unchanged[0]
+        else:
+            values[name] = getattr(space, name)
+    return values
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_space_changes(session: Session, flush_context: Any) -> None:
+    """Keep the counters in step with spaces added, changed or removed through the ORM"""
+    deltas = _Deltas()
+    for space in session.new:
+        if isinstance(space, ParkingSpaces):
+            deltas.add({name: getattr(space, name) for name in _TRACKED}, 1)
+    for space in session.dirty:
+        if isinstance(space, ParkingSpaces) and any(
+            attributes.get_history(space, name).has_changes() for name in _TRACKED
+        ):
+            deltas.add(_old_values(space), -1)
+            deltas.add({name: getattr(space, name) for name in _TRACKED}, 1)
+    for space in session.deleted:
+        if isinstance(space, ParkingSpaces):
+            deltas.add(_old_values(space), -1)
+    deltas.apply()
+
+
+def release_spaces(space_ids: Sequence[int]) -> int:
+    """
+    Mark spaces free with a bulk UPDATE and count them out, without committing
+
+    Bulk updates bypass the ORM listener, so the spaces that were actually
+    occupied are read (and locked) first.
+
+    Args:
+        space_ids: Spaces to free
+
+    Returns:
+        int: Number of spaces that were occupied
+    """
+    if not space_ids:
+        return 0
+    occupied = db.session.execute(
+        db.select(ParkingSpaces.Level, ParkingSpaces.Section, ParkingSpaces.VehicleType, ParkingSpaces.Status)
+        .where(ParkingSpaces.Id.in_(space_ids), ParkingSpaces.IsOccupied.is_(True))
+        .with_for_update()
+    ).all()
+    db.session.execute(
+        db.update(ParkingSpaces).where(ParkingSpaces.Id.in_(space_ids)).values(IsOccupied=False)
+        .execution_options(synchronize_session=False)
+    )
+    deltas = _Deltas()
+    for row in occupied:
+        values = dict(zip(('Level', 'Section', 'VehicleType', 'Status'), row))
+        deltas.add({**values, 'IsOccupied': True}, -1)
+        deltas.add({**values, 'IsOccupied': False}, 1)
+    deltas.apply()
+    return len(occupied)
+
+
+def _lock_counters() -> None:
+    """
+    Stop other transactions from changing the counters until this one ends
+
+    Space changes update the counters in the same transaction, so once the
+    counters are locked every committed space change is counted and no
+    other can commit until this transaction ends.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # Any write takes SQLite's database write lock, even one that changes nothing
+        db.session.execute(
+            db.update(ParkingOccupancy).where(db.false()).values(Total=ParkingOccupancy.Total)
+            .execution_options(synchronize_session=False)
+        )
+    elif dialect == 'postgresql':
+        db.session.execute(db.text('LOCK TABLE parking_occupancy IN SHARE ROW EXCLUSIVE MODE'))
+    else:
+        db.session.execute(db.select(ParkingOccupancy.Id).with_for_update()).all()
+
+
+def _counter_drift() -> List[Tuple[CounterKey, Dict[str, int], Dict[str, int]]]:
+    """
+    Groups whose stored counters differ from the spaces table, with the
+    stored and actual values, read in one statement
+    """
+    actual = {name: func.coalesce(func.sum(expression), 0) for name, expression in (
+        ('Total', 1),
+        ('Occupied', db.case((ParkingSpaces.IsOccupied.is_(True), 1), else_=0)),
+        ('Reserved', db.case((ParkingSpaces.Status == 'reserved', 1), else_=0)),
+        ('Maintenance', db.case((ParkingSpaces.Status == 'maintenance', 1), else_=0)),
+        ('Available', db.case((db.and_(
+            db.or_(ParkingSpaces.IsOccupied.is_(None), ParkingSpaces.IsOccupied.is_(False)),
+            db.or_(ParkingSpaces.Status.is_(None), ParkingSpaces.Status == 'available')
+        ), 1), else_=0))
+    )}
+    groups = [func.coalesce(getattr(ParkingSpaces, key), '') for key in GROUP_KEYS]
+    zero = db.literal(0)
+    # Actual counts per group next to zeros, and stored counters next to zeros
+    both = db.union_all(
+        db.select(
+            *(group.label(key) for group, key in zip(groups, GROUP_KEYS)),
+            *(actual[name].label(f'actual_{name}') for name in COUNTERS),
+            *(zero.label(f'stored_{name}') for name in COUNTERS)
+        ).group_by(*groups),
+        db.select(
+            *(getattr(ParkingOccupancy, key) for key in GROUP_KEYS),
+            *(zero for _ in COUNTERS),
+            *(getattr(ParkingOccupancy, name) for name in COUNTERS)
+        )
+    ).subquery()
+    keys = [both.c[key] for key in GROUP_KEYS]
+    sums = [func.sum(both.c[f'{side}_{name}']) for side in ('actual', 'stored') for name in COUNTERS]
+    rows = db.session.execute(
+        db.select(*keys, *sums).group_by(*keys).having(db.or_(*(
+            func.sum(both.c[f'actual_{name}']) != func.sum(both.c[f'stored_{name}']) for name in COUNTERS
+        ))).order_by(*keys)
+    ).all()
+    return [(
+        tuple(row[:3]),
+        dict(zip(COUNTERS, (int(value) for value in row[3:3 + len(COUNTERS)]))),
+        dict(zip(COUNTERS, (int(value) for value in row[3 + len(COUNTERS):])))
+    ) for row in rows]
+
+
+def reconcile_occupancy(repair: bool = True) -> List[Dict[str, Any]]:
+    """
+    Compare the counters with the spaces table and correct any drift
+
+    Runs in its own transaction with the counters locked, and compares
+    them with the spaces in a single statement, so writes committed
+    meanwhile are never mistaken for drift. Corrections are added to the
+    stored counters rather than overwriting them. Runs from the CLI (flask
+    occupancy reconcile), e.g. every few minutes from cron, never from a
+    request.
+
+    Args:
+        repair: Write the corrections; otherwise only report them
+
+    Returns:
+        List: One entry per counter that was off, with the stored and actual values
+    """
+    drift = []
+    deltas = _Deltas()
+    try:
+        _lock_counters()
+        for key, actual, stored in _counter_drift():
+            for counter in COUNTERS:
+                if stored[counter] != actual[counter]:
+                    drift.append({
+                        'level': key[0],
+                        'section': key[1],
+                        'vehicle_type': key[2],
+                        'counter': counter,
+                        'stored': stored[counter],
+                        'actual': actual[counter]
+                    })
+                    deltas.by_key[key][counter] += actual[counter] - stored[counter]
+        if drift:
+            current_app.logger.warning(f"Occupancy counter drift in {len(drift)} counters")
+        if repair:
+            deltas.apply()
+            db.session.commit()
+        else:
+            db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        raise
+    return drift
+
+
+def seed_occupancy() -> bool:
+    """
+    Fill the counters from the spaces table if they have never been filled
+
+    The counter table is created empty on an existing database, which
+    would read as no spaces at all until the next reconciliation.
+
+    Returns:
+        bool: Whether the counters were seeded
+    """
+    if db.session.execute(db.select(ParkingOccupancy.Id).limit(1)).first() is not None:
+        return False
+    if db.session.execute(db.select(ParkingSpaces.Id).limit(1)).first() is None:
+        return False
+    # Locked and additive, so workers starting together seed only once
+    reconcile_occupancy()
+    return True
+
+
+def occupancy_counts(level: Optional[str] = None, section: Optional[str] = None,
+                     vehicle_type: Optional[str] = None) -> Dict[str, int]:
+    """
+    Current space counts from the counter table
+
+    Args:
+        level: Only spaces on this level
+        section: Only spaces in this section
+        vehicle_type: Only spaces for this vehicle type
+
+    Returns:
+        Dict: Total, Occupied, Reserved, Maintenance and Available
+    """
+    filters = [
+        getattr(ParkingOccupancy, key) == value
+        for key, value in zip(GROUP_KEYS, (level, section, vehicle_type)) if value is not None
+    ]
+    row = db.session.execute(
+        db.select(*(func.coalesce(func.sum(getattr(ParkingOccupancy, name)), 0) for name in COUNTERS))
+        .where(*filters)
+    ).one()
+    return {name: int(value) for name, value in zip(COUNTERS, row)}
+
+
+def occupancy_groups() -> List[Dict[str, Any]]:
+    """Counters per level, section and vehicle type"""
+    rows = db.session.execute(
+        db.select(ParkingOccupancy).where(ParkingOccupancy.Total > 0)
+        .order_by(*(getattr(ParkingOccupancy, key) for key in GROUP_KEYS))
+    ).scalars()
+    return [{
+        'level': row.Level or None,
+        'section': row.Section or None,
+        'vehicle_type': row.VehicleType or None,
+        **{name.lower(): getattr(row, name) for name in COUNTERS}
+    } for row in rows]
+
+
+occupancy_cli = AppGroup('occupancy', help='Maintain the parking space occupancy counters.')
+
+
+@occupancy_cli.command('reconcile')
+@click.option('--check', is_flag=True, help='Only report drift, do not correct it')
+def reconcile_command(check: bool) -> None:
+    """Compare the occupancy counters with the spaces table."""
+    drift = reconcile_occupancy(repair=not check)
+    for item in drift:
+        click.echo(
+            f"{item['level'] or '-'}/{item['section'] or '-'}/{item['vehicle_type'] or '-'} "
+            f"{item['counter']}: stored {item['stored']} != actual {item['actual']}"
+        )
+    if drift and check:
+        raise SystemExit(1)
+    click.echo("Occupancy counters match the spaces table" if not drift else f"Corrected {len(drift)} counters")
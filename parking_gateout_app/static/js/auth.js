@@ -360,8 +360,12 @@ async function checkApiHealth() {
     }
 }
 
-// Periodically check API health (every 30 seconds)
-setInterval(checkApiHealth, 30000);
+// Check API health when the live event stream drops, instead of polling
+document.addEventListener('DOMContentLoaded', function() {
+    if (window.parkingEvents && getAuthToken()) {
+        window.parkingEvents.subscribe({ onError: checkApiHealth });
+    }
+});
 
 // Function to get dashboard data
 async function getDashboardData() {
@@ -375,9 +379,12 @@ async function getDashboardData() {
 }
 
 // Function to get activities
-async function getActivities(page = 1, perPage = 5) {
+// Pass the previous page's pagination.next_cursor to fetch the next page
+async function getActivities(cursor = null, perPage = 5) {
     try {
-        const response = await makeApiRequest(`/api/activities?page=${page}&per_page=${perPage}`);
+        const params = new URLSearchParams({ per_page: perPage });
+        if (cursor) params.set('cursor', cursor);
+        const response = await makeApiRequest(`/api/activities?${params}`);
         return response.data;
     } catch (error) {
         console.error('Error fetching activities:', error);
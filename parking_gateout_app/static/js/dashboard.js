@@ -12,49 +12,27 @@ document.addEventListener('DOMContentLoaded', async function() {
         loadDashboardData();
     });
     
-    // Auto refresh every 30 seconds
-    setInterval(loadDashboardData, 30000);
+    // Refresh when vehicles enter, exit or pay, or a device changes status
+    window.parkingEvents.subscribe({
+        types: ['entry', 'exit', 'payment', 'hardware'],
+        onChange: loadDashboardData
+    });
 });
 
 // Function to load all dashboard data
 async function loadDashboardData() {
     try {
-        // Load overview stats
-        const overviewData = await window.auth.makeApiRequest('/api/dashboard/stats/overview');
-        if (overviewData) {
-            updateOverviewStats(overviewData.data);
-        }
-        
-        // Load active sessions
-        const sessionsData = await window.auth.makeApiRequest('/api/parking-sessions/active');
-        if (sessionsData) {
-            updateActiveSessions(sessionsData.data);
-            document.getElementById('activeSessions').textContent = sessionsData.data.length;
-        }
-        
-        // Load daily report
-        const reportData = await window.auth.makeApiRequest('/api/reports/daily');
-        if (reportData) {
-            updateRevenueStats(reportData.data);
-        }
-        
-        // Load recent activities
-        const activitiesData = await window.auth.makeApiRequest('/api/activities?per_page=5');
-        if (activitiesData) {
-            updateRecentActivities(activitiesData.data.activities);
-        }
-        
-        // Load vehicles count
-        const vehiclesData = await window.auth.makeApiRequest('/api/vehicles');
-        if (vehiclesData) {
-            document.getElementById('totalVehicles').textContent = vehiclesData.data.total;
-        }
+        // One snapshot for every widget; the browser revalidates it with its ETag
+        const snapshot = await window.auth.makeApiRequest('/api/dashboard/snapshot');
+        if (!snapshot) return;
+        const data = snapshot.data;
         
-        // Load hardware status
-        const hardwareData = await window.auth.makeApiRequest('/api/hardware/status');
-        if (hardwareData) {
-            updateHardwareStatus(hardwareData);
-        }
+        updateOverviewStats(data.overview);
+        updateActiveSessions(data.active_sessions);
+        updateRevenueStats(data.today);
+        updateRecentActivities(data.recent_activities);
+        document.getElementById('totalVehicles').textContent = data.overview.total_vehicles;
+        updateHardwareStatus(data.hardware);
     } catch (error) {
         console.error('Error loading dashboard data:', error);
         showToast('Error loading dashboard data', 'error');
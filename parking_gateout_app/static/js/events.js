@@ -0,0 +1,148 @@
+// Live dashboard updates from /api/dashboard/events (Server-Sent Events)
+// EventSource cannot send the Authorization header, so the stream is read with fetch.
+// One connection is shared by every subscriber on the page. The server ends each
+// stream after a while (at once on sync workers); the next request resumes from the
+// last event ID after `retry`.
+(function() {
+    const EVENTS_URL = '/api/dashboard/events';
+    const MAX_RECONNECT_DELAY = 30000; // 30 seconds
+    // Changes that bypass the event log (e.g. direct writes by the gate-in app) still show up
+    const REVALIDATE_INTERVAL = 60000; // 60 seconds
+
+    const subscribers = [];
+    let lastEventId = null;
+    let reconnectDelay = 1000;
+    let failures = 0;
+    let connected = false;
+
+    function getToken() {
+        return localStorage.getItem('parking_auth_token') || localStorage.getItem('token');
+    }
+
+    // Run a refresh at most once at a time; changes arriving meanwhile trigger one more run
+    function serialize(callback) {
+        let running = false;
+        let pending = false;
+        return async function run(...args) {
+            if (running) {
+                pending = true;
+                return;
+            }
+            running = true;
+            try {
+                await callback(...args);
+            } catch (error) {
+                console.error('Error refreshing after server event:', error);
+            } finally {
+                running = false;
+                if (pending) {
+                    pending = false;
+                    run(...args);
+                }
+            }
+        };
+    }
+
+    function dispatch(type, data) {
+        subscribers.forEach(subscriber => {
+            if (type === 'reset') {
+                subscriber.onReset(data);
+            } else if (type === 'revalidate') {
+                if (subscriber.types.length) subscriber.onReset(data);
+            } else if (type === 'change') {
+                const changed = Object.keys(data.counts || {});
+                if (changed.some(eventType => subscriber.types.includes(eventType))) {
+                    subscriber.onChange(data);
+                }
+            }
+        });
+    }
+
+    function handleMessage(block) {
+        let type = 'message';
+        const dataLines = [];
+        block.split('\n').forEach(line => {
+            if (!line || line.startsWith(':')) return; // keep-alive comment
+            const colon = line.indexOf(':');
+            const field = colon < 0 ? line : line.slice(0, colon);
+            const value = colon < 0 ? '' : line.slice(colon + 1).replace(/^ /, '');
+            if (field === 'id') lastEventId = value;
+            else if (field === 'event') type = value;
+            else if (field === 'data') dataLines.push(value);
+            else if (field === 'retry' && /^\d+$/.test(value)) reconnectDelay = parseInt(value, 10);
+        });
+        if (dataLines.length) {
+            dispatch(type, JSON.parse(dataLines.join('\n')));
+        }
+    }
+
+    async function connect() {
+        const token = getToken();
+        if (!token) return;
+
+        const headers = {
+            'Accept': 'text/event-stream',
+            'Authorization': `Bearer ${token}`
+        };
+        if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+        try {
+            const response = await fetch(EVENTS_URL, { headers, cache: 'no-store' });
+            if (response.status === 401) return; // the page's own auth handling takes over
+            if (!response.ok || !response.body) {
+                throw new Error(`Event stream failed with status ${response.status}`);
+            }
+            failures = 0;
+            connected = true;
+
+            const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += value.replace(/\r\n?/g, '\n');
+                let end;
+                while ((end = buffer.indexOf('\n\n')) >= 0) {
+                    handleMessage(buffer.slice(0, end));
+                    buffer = buffer.slice(end + 2);
+                }
+            }
+        } catch (error) {
+            failures += 1;
+            connected = false;
+            subscribers.forEach(subscriber => subscriber.onError(error));
+        }
+        // The server ends each response after a while; resume from the last event ID
+        const delay = failures ? Math.min(reconnectDelay * 2 ** failures, MAX_RECONNECT_DELAY) : reconnectDelay;
+        setTimeout(connect, delay);
+    }
+
+    /**
+     * Subscribe to server events
+     * @param {Object} options
+     * @param {string[]} options.types - Event types to refresh on: entry, exit, payment, hardware
+     * @param {Function} options.onChange - Called once per batch of matching events
+     * @param {Function} [options.onReset] - Called when missed events cannot be replayed; defaults to onChange
+     * @param {Function} [options.onError] - Called when the connection fails
+     */
+    function subscribe({ types = [], onChange = () => {}, onReset = null, onError = () => {} }) {
+        const refresh = serialize(onChange);
+        subscribers.push({
+            types,
+            onChange: refresh,
+            onReset: onReset ? serialize(onReset) : refresh,
+            onError
+        });
+        if (subscribers.length === 1) {
+            connect();
+            setInterval(() => {
+                if (!document.hidden) dispatch('revalidate', {});
+            }, REVALIDATE_INTERVAL);
+        }
+    }
+
+    window.parkingEvents = {
+        subscribe,
+        isConnected: () => connected
+    };
+})();
@@ -12,8 +12,11 @@ document.addEventListener('DOMContentLoaded', async function() {
     // Set up create session button
     document.getElementById('createSessionBtn')?.addEventListener('click', createNewSession);
     
-    // Auto refresh every 30 seconds
-    setInterval(loadParkingSessions, 30000);
+    // Refresh when vehicles enter or exit
+    window.parkingEvents.subscribe({
+        types: ['entry', 'exit'],
+        onChange: loadParkingSessions
+    });
 });
 
 async function loadParkingSessions() {
@@ -21,7 +24,7 @@ async function loadParkingSessions() {
         // Load active sessions
         const activeSessions = await window.auth.makeApiRequest('/api/parking-sessions/active');
         if (activeSessions) {
-            updateActiveSessionsTable(activeSessions.data);
+            updateActiveSessionsTable(sessionRows(activeSessions.data));
         }
         
         // Load recent sessions
@@ -41,6 +44,18 @@ async function loadParkingSessions() {
     }
 }
 
+// Turn the columnar active sessions payload into one object per session
+function sessionRows(data) {
+    const columns = data.columns;
+    const asOf = new Date(data.as_of);
+    return columns.ticket_number.map((ticketNumber, i) => ({
+        ticket_number: ticketNumber,
+        vehicle_plate: columns.vehicle_plate[i] || 'Unknown',
+        entry_time: columns.entry_time[i],
+        duration: columns.entry_time[i] ? (asOf - new Date(columns.entry_time[i])) / 1000 : null
+    }));
+}
+
 function updateActiveSessionsTable(sessions) {
     const tbody = document.querySelector('#activeSessionsTable tbody');
     tbody.innerHTML = '';
@@ -153,10 +168,12 @@ async function endSession(ticketNumber) {
 
 // Helper functions
 function formatDateTime(dateTimeString) {
+    if (!dateTimeString) return '-';
     return new Date(dateTimeString).toLocaleString();
 }
 
 function formatDuration(duration) {
+    if (duration === null) return '-';
     const hours = Math.floor(duration / 3600);
     const minutes = Math.floor((duration % 3600) / 60);
     return `${hours}h ${minutes}m`;
@@ -8,6 +8,7 @@ function formatCurrency(amount) {
 }
 
 function formatDateTime(dateStr) {
+    if (!dateStr) return '-';
     return new Date(dateStr).toLocaleString('id-ID');
 }
 
@@ -69,11 +70,12 @@ async function loadActiveVehicles() {
         const data = await response.json();
         if (data.status === 'success') {
             const tbody = table.querySelector('tbody');
-            tbody.innerHTML = data.data.map(vehicle => `
+            const columns = data.data.columns;
+            tbody.innerHTML = columns.ticket_number.map((ticketNumber, i) => `
                 <tr>
-                    <td>${vehicle.plateNumber}</td>
-                    <td>${formatDateTime(vehicle.entryTime)}</td>
-                    <td>${vehicle.parkingSpaceId}</td>
+                    <td>${columns.vehicle_plate[i] || '-'}</td>
+                    <td>${formatDateTime(columns.entry_time[i])}</td>
+                    <td>${columns.space[i] || '-'}</td>
                 </tr>
             `).join('');
         }
@@ -249,6 +251,9 @@ function displayReportResults(data) {
 // Initialize dashboard if on dashboard page
 if (document.getElementById('activeVehiclesTable')) {
     loadActiveVehicles();
-    // Refresh active vehicles list every 30 seconds
-    setInterval(loadActiveVehicles, 30000);
+    // Refresh active vehicles list when vehicles enter or exit
+    window.parkingEvents.subscribe({
+        types: ['entry', 'exit'],
+        onChange: loadActiveVehicles
+    });
 }
@@ -0,0 +1,387 @@
+from datetime import datetime
+import math
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple, Any
+
+import numpy as np
+from flask import current_app
+
+from .models import ParkingRate, MemberRates
+
+DEFAULT_DURATION_TYPE = 'hourly'
+HOURS_PER_DAY = 24
+
+
+class CompiledRate(NamedTuple):
+    vehicle_type: str
+    duration_type: str
+    base_duration: int
+    base_rate: float
+    additional_rate: float
+    max_daily_rate: Optional[float]
+    # day_table[h] is the fee for h started hours within one 24 hour period,
+    # already capped at max_daily_rate. day_table[0] is always 0.
+    day_table: Tuple[float, ...]
+
+    @property
+    def day_fee(self) -> float:
+        return self.day_table[HOURS_PER_DAY]
+
+
+def compile_rate(vehicle_type: str, duration_type: str, base_duration: int, base_rate: float,
+                 additional_rate: float, max_daily_rate: Optional[float]) -> CompiledRate:
+    """
+    Precompute the per-day fee table for a rate
+
+    Args:
+        vehicle_type: The type of vehicle
+        duration_type: The duration type of the rate
+        base_duration: Hours covered by the base rate
+        base_rate: Fee for the first base_duration hours
+        additional_rate: Fee for every started hour after base_duration
+        max_daily_rate: Cap for one 24 hour period, or None for no cap
+
+    Returns:
+        CompiledRate: The compiled rate
+    """
+    base_duration = max(1, int(base_duration))
+    cap = max_daily_rate if max_daily_rate is not None else math.inf
+    day_table = [0.0]
+    for hours in range(1, HOURS_PER_DAY + 1):
+        fee = base_rate + max(0, hours - base_duration) * additional_rate
+        day_table.append(min(fee, cap))
+    return CompiledRate(
+        vehicle_type=vehicle_type,
+        duration_type=duration_type,
+        base_duration=base_duration,
+        base_rate=base_rate,
+        additional_rate=additional_rate,
+        max_daily_rate=max_daily_rate,
+        day_table=tuple(day_table)
+    )
+
+
+def billable_hours(entry_time: datetime, exit_time: datetime) -> int:
+    """
+    Number of started hours between entry and exit, at least one
+
+    Args:
+        entry_time: When the vehicle entered
+        exit_time: When the vehicle is exiting
+
+    Returns:
+        int: Billable hours
+    """
+    seconds = (exit_time - entry_time).total_seconds()
+    return max(1, math.ceil(seconds / 3600))
+
+
+def _rate_key(vehicle_type: str, duration_type: str) -> Tuple[str, str]:
+    return (vehicle_type or '').strip().upper(), (duration_type or '').strip().lower()
+
+
+def _member_rate(regular: CompiledRate, vehicle_type: str, duration_type: str, member_rate: float) -> CompiledRate:
+    if duration_type == 'monthly':
+        # Covered by the subscription, nothing to pay per visit
+        return compile_rate(vehicle_type, duration_type, HOURS_PER_DAY, 0.0, 0.0, 0.0)
+    if duration_type == 'daily':
+        return compile_rate(vehicle_type, duration_type, HOURS_PER_DAY, member_rate, 0.0, member_rate)
+    return compile_rate(vehicle_type, duration_type, 1, member_rate, member_rate, regular.max_daily_rate)
+
+
+class TariffTable:
+    """
+    Immutable snapshot of the active parking and member rates
+
+    Fee rules, applied the same way for every exit path:
+
+    - The stay is billed in started hours, with a minimum of one hour.
+    - The stay is split into 24 hour periods, each rated independently:
+      BaseRate covers the first BaseDuration hours, every further started
+      hour costs AdditionalRate, and the period total is capped at
+      MaxDailyRate.
+    - A member override replaces the regular rate for that vehicle type:
+      hourly member rates are charged per started hour (still capped at the
+      regular MaxDailyRate), daily member rates per started 24 hour period,
+      and monthly memberships are not charged per visit.
+    - Vehicle types without a configured rate use PARKING_RATES (or
+      DEFAULT_HOURLY_RATE) per started hour without a cap.
+
+    A table is never modified after it has been built. Rate changes build a
+    new table and swap the module-level reference, so readers never see a
+    half-updated set of rates and never need a lock.
+    """
+
+    def __init__(self, rates: Dict[Tuple[str, str], CompiledRate],
+                 member_rates: Optional[Dict[Tuple[str, str, str], CompiledRate]] = None,
+                 default_rates: Optional[Dict[str, float]] = None,
+                 default_hourly_rate: float = 5000.0):
+        self.rates = rates
+        self.built_at = time.monotonic()
+
+        # Fallback per vehicle type when the requested duration type is missing
+        self._by_vehicle: Dict[str, CompiledRate] = {}
+        for (vehicle_type, duration_type), rate in sorted(rates.items()):
+            if vehicle_type not in self._by_vehicle or duration_type == DEFAULT_DURATION_TYPE:
+                self._by_vehicle[vehicle_type] = rate
+        self.set_member_rates(member_rates or {})
+
+        self._defaults: Dict[str, CompiledRate] = {
+            vehicle_type.upper(): compile_rate(vehicle_type.upper(), DEFAULT_DURATION_TYPE, 1, hourly, hourly, None)
+            for vehicle_type, hourly in (default_rates or {}).items()
+        }
+        self._default = compile_rate('', DEFAULT_DURATION_TYPE, 1, default_hourly_rate, default_hourly_rate, None)
+
+    def set_member_rates(self, member_rates: Dict[Tuple[str, str, str], CompiledRate]) -> None:
+        """
+        Set the member overrides, keyed by (membership type, vehicle type,
+        duration type) like the regular rates
+
+        Args:
+            member_rates: The compiled member rates
+        """
+        self.member_rates = member_rates
+        # Fallback per membership and vehicle type, chosen the same way as _by_vehicle
+        self._member_by_vehicle: Dict[Tuple[str, str], CompiledRate] = {}
+        for (membership_type, vehicle_type, duration_type), rate in sorted(member_rates.items()):
+            key = (membership_type, vehicle_type)
+            if key not in self._member_by_vehicle or duration_type == DEFAULT_DURATION_TYPE:
+                self._member_by_vehicle[key] = rate
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Any], member_rows: Iterable[Any] = (),
+                  default_rates: Optional[Dict[str, float]] = None,
+                  default_hourly_rate: float = 5000.0) -> 'TariffTable':
+        """
+        Compile ParkingRate and MemberRates rows (or objects with the same attributes)
+
+        Args:
+            rows: ParkingRate rows to compile
+            member_rows: MemberRates rows to compile
+            default_rates: Hourly rate per vehicle type used when no row exists
+            default_hourly_rate: Hourly rate used for any other vehicle type
+
+        Returns:
+            TariffTable: The compiled table
+        """
+        rates = {}
+        for row in rows:
+            key = _rate_key(row.VehicleType, row.DurationType)
+            rates[key] = compile_rate(
+                vehicle_type=key[0],
+                duration_type=key[1],
+                base_duration=int(row.BaseDuration or 1),
+                base_rate=float(row.BaseRate),
+                additional_rate=float(row.AdditionalRate) if row.AdditionalRate is not None else 0.0,
+                max_daily_rate=float(row.MaxDailyRate) if row.MaxDailyRate is not None else None
+            )
+
+        table = cls(rates, default_rates=default_rates, default_hourly_rate=default_hourly_rate)
+
+        member_rates = {}
+        for row in member_rows:
+            membership_type = (row.MembershipType or '').strip().lower()
+            vehicle_type, duration_type = _rate_key(row.VehicleType, row.DurationType)
+            regular = table.lookup(vehicle_type)
+            member_rates[(membership_type, vehicle_type, duration_type)] = _member_rate(
+                regular, vehicle_type, duration_type, float(row.Rate or 0)
+            )
+        table.set_member_rates(member_rates)
+        return table
+
+    def lookup(self, vehicle_type: str, duration_type: str = DEFAULT_DURATION_TYPE,
+               membership_type: Optional[str] = None) -> CompiledRate:
+        """
+        Find the rate that applies to a vehicle
+
+        Args:
+            vehicle_type: The type of vehicle
+            duration_type: The preferred duration type
+            membership_type: Membership type of the driver, if any
+
+        Returns:
+            CompiledRate: The member override or the configured rate (either
+            falling back to any duration type for the vehicle type), or the
+            default rate
+        """
+        key = _rate_key(vehicle_type, duration_type)
+        if membership_type:
+            membership_type = membership_type.strip().lower()
+            rate = (self.member_rates.get((membership_type, *key))
+                    or self._member_by_vehicle.get((membership_type, key[0])))
+            if rate is not None:
+                return rate
+        rate = self.rates.get(key) or self._by_vehicle.get(key[0]) or self._defaults.get(key[0])
+        return rate or self._default
+
+    def quote(self, entry_time: datetime, exit_time: datetime, vehicle_type: str,
+              duration_type: str = DEFAULT_DURATION_TYPE, membership_type: Optional[str] = None) -> float:
+        """
+        Calculate the parking fee for a stay
+
+        Args:
+            entry_time: When the vehicle entered
+            exit_time: When the vehicle is exiting
+            vehicle_type: The type of vehicle
+            duration_type: The preferred duration type
+            membership_type: Membership type of the driver, if any
+
+        Returns:
+            float: The calculated parking fee
+        """
+        rate = self.lookup(vehicle_type, duration_type, membership_type)
+        days, hours = divmod(billable_hours(entry_time, exit_time), HOURS_PER_DAY)
+        return round(days * rate.day_fee + rate.day_table[hours], 2)
+
+    def quote_batch(self, entry_times: Any, exit_times: Any, vehicle_types: Any,
+                    duration_type: str = DEFAULT_DURATION_TYPE,
+                    membership_types: Any = None) -> np.ndarray:
+        """
+        Calculate parking fees for many stays in one vectorized pass
+
+        Applies exactly the same rules as quote(), member overrides included.
+        exit_times may be a single datetime to rate every stay up to the same
+        moment. Stays with a missing entry or exit time are rated NaN rather
+        than failing the batch.
+
+        Args:
+            entry_times: Entry times (array-like of datetime or datetime64)
+            exit_times: Exit times, same length as entry_times, or a scalar
+            vehicle_types: Vehicle type of every stay
+            duration_type: The preferred duration type
+            membership_types: Membership type of every stay (None or '' for
+                non-members), a single value for all stays, or None
+
+        Returns:
+            np.ndarray: Fee for every stay, as float64
+        """
+        entry = np.asarray(entry_times, dtype='datetime64[s]')
+        exit_ = np.asarray(exit_times, dtype='datetime64[s]')
+        if entry.size == 0:
+            return np.zeros(0, dtype=np.float64)
+
+        elapsed = exit_ - entry
+        missing = np.isnat(elapsed)
+        seconds = np.where(missing, np.timedelta64(0, 's'), elapsed).astype(np.int64)
+        hours = np.maximum(1, -(-seconds // 3600))
+        days, hours = np.divmod(hours, HOURS_PER_DAY)
+
+        # One rate per distinct (vehicle type, membership) pair
+        vehicle_types = np.asarray(vehicle_types, dtype=str).reshape(-1)
+        members = np.asarray('' if membership_types is None else membership_types, dtype=object)
+        members = np.broadcast_to(members, vehicle_types.shape)
+        members = np.where(np.equal(members, None), '', members).astype(str)
+        pairs, codes = np.unique(np.char.add(np.char.add(vehicle_types, '\x1f'), members), return_inverse=True)
+        day_tables = np.array([
+            self.lookup(vehicle_type, duration_type, membership_type or None).day_table
+            for vehicle_type, membership_type in (pair.split('\x1f') for pair in pairs)
+        ], dtype=np.float64)
+        codes = codes.reshape(-1)
+        fees = days * day_tables[codes, HOURS_PER_DAY] + day_tables[codes, hours]
+        return np.where(missing, np.nan, np.round(fees, 2))
+
+
+_table: Optional[TariffTable] = None
+_build_lock = threading.Lock()
+
+
+def reload_tariff_table() -> TariffTable:
+    """
+    Rebuild the tariff table from the database and swap it in
+
+    Called after every write to ParkingRate so the change takes effect
+    immediately in this process.
+
+    Returns:
+        TariffTable: The newly built table
+    """
+    global _table
+    with _build_lock:
+        table = TariffTable.from_rows(
+            ParkingRate.query.filter_by(IsActive=True).all(),
+            MemberRates.query.filter_by(IsActive=True).all(),
+            default_rates=current_app.config.get('PARKING_RATES'),
+            default_hourly_rate=current_app.config.get('DEFAULT_HOURLY_RATE', 5000.0)
+        )
+        _table = table
+    return table
+
+
+def build_candidate_table(proposed_rows: Iterable[Any]) -> TariffTable:
+    """
+    Build a table from the active rates with some rates replaced
+
+    Nothing is written to the database; this is used to evaluate proposed
+    rate changes before they are applied.
+
+    Args:
+        proposed_rows: Rates (ParkingRate-like objects) replacing the active
+            rate with the same VehicleType and DurationType, or adding a new one
+
+    Returns:
+        TariffTable: The candidate table
+    """
+    rows = {_rate_key(r.VehicleType, r.DurationType): r for r in ParkingRate.query.filter_by(IsActive=True).all()}
+    for row in proposed_rows:
+        rows[_rate_key(row.VehicleType, row.DurationType)] = row
+    return TariffTable.from_rows(
+        rows.values(),
+        MemberRates.query.filter_by(IsActive=True).all(),
+        default_rates=current_app.config.get('PARKING_RATES'),
+        default_hourly_rate=current_app.config.get('DEFAULT_HOURLY_RATE', 5000.0)
+    )
+
+
+def get_tariff_table() -> TariffTable:
+    """
+    Get the current tariff table, building it on first use
+
+    Tables older than TARIFF_REFRESH_SECONDS are rebuilt so that rate
+    changes made through another worker process are eventually picked up.
+
+    Returns:
+        TariffTable: The current table
+    """
+    table = _table
+    max_age = current_app.config.get('TARIFF_REFRESH_SECONDS', 300)
+    if table is None or time.monotonic() - table.built_at > max_age:
+        table = reload_tariff_table()
+    return table
+
+
+def quote_fees(entry_times: Any, exit_times: Any, vehicle_types: Any,
+               duration_type: str = DEFAULT_DURATION_TYPE, membership_types: Any = None) -> np.ndarray:
+    """
+    Calculate parking fees for many stays from the in-memory tariff table
+
+    Args:
+        entry_times: Entry times (array-like of datetime or datetime64)
+        exit_times: Exit times, same length as entry_times, or a scalar
+        vehicle_types: Vehicle type of every stay
+        duration_type: The preferred duration type
+        membership_types: Membership type of every stay, a single value for
+            all stays, or None for non-members
+
+    Returns:
+        np.ndarray: Fee for every stay
+    """
+    return get_tariff_table().quote_batch(entry_times, exit_times, vehicle_types, duration_type, membership_types)
+
+
+def quote_fee(entry_time: datetime, exit_time: datetime, vehicle_type: str,
+              duration_type: str = DEFAULT_DURATION_TYPE, membership_type: Optional[str] = None) -> float:
+    """
+    Calculate a parking fee from the in-memory tariff table
+
+    Args:
+        entry_time: When the vehicle entered
+        exit_time: When the vehicle is exiting
+        vehicle_type: The type of vehicle
+        duration_type: The preferred duration type
+        membership_type: Membership type of the driver, if any
+
+    Returns:
+        float: The calculated parking fee
+    """
+    return get_tariff_table().quote(entry_time, exit_time, vehicle_type, duration_type, membership_type)
@@ -0,0 +1,148 @@
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+
+from parking_gateout_app.archive import MANIFEST, ArchiveReader, archive_cli, export_closed_months
+from parking_gateout_app.bench_exit import create_bench_app
+from parking_gateout_app.models import db, ParkingTickets, ParkingTransactions, Vehicles
+from parking_gateout_app.rollup import month_start, next_month
+
+# The two closed months before the current one
+FIRST = month_start(month_start(datetime.now()) - timedelta(days=40))
+SECOND = next_month(FIRST)
+TICKETS = 300
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_bench_app(os.path.join(tmp_path, 'archive.db'))
+    app.config['ARCHIVE_DIR'] = os.path.join(tmp_path, 'archive')
+    app.cli.add_command(archive_cli)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def seed(rng):
+    """Closed tickets with one transaction each across both months; returns what was written"""
+    db.session.add(Vehicles(Id='2', plate_number='D99AB', vehicle_type='MOTOR'))
+    span = int((next_month(SECOND) - FIRST).total_seconds() // 60)
+    written = []
+    for number in range(TICKETS):
+        exit_time = FIRST + timedelta(minutes=rng.randrange(span), seconds=rng.randrange(60))
+        duration = rng.randint(1, 600)
+        amount = round(rng.uniform(0, 50000), 2)
+        ticket = ParkingTickets(TicketNumber=f'A{number:06d}', VehicleId=rng.choice(['1', '2']),
+                                EntryTime=exit_time - timedelta(minutes=duration), ExitTime=exit_time,
+                                Duration=duration, Amount=amount, Status='completed')
+        db.session.add(ticket)
+        db.session.flush()
+        method = rng.choice(['cash', 'card'])
+        db.session.add(ParkingTransactions(Id=f'T{number}', ticket_id=str(ticket.Id),
+                                           transaction_number=f'TRX{number}', amount=amount,
+                                           payment_method=method, status='completed', created_at=exit_time))
+        written.append({'exit': exit_time, 'duration': duration, 'cents': round(amount * 100),
+                        'vehicle_type': 'MOBIL' if ticket.VehicleId == '1' else 'MOTOR', 'method': method})
+    # Still parked: not archived
+    db.session.add(ParkingTickets(TicketNumber='OPEN01', VehicleId='1', EntryTime=FIRST, Status='active'))
+    db.session.commit()
+    return written
+
+
+def expected(written, start, end, key):
+    totals = defaultdict(lambda: {'count': 0, 'cents': 0, 'dwell': 0})
+    for row in written:
+        if start <= row['exit'] < end:
+            group = totals[key(row)]
+            group['count'] += 1
+            group['cents'] += row['cents']
+            group['dwell'] += row['duration']
+    return totals
+
+
+def assert_tickets_match(results, totals):
+    assert set(results) == set(totals)
+    for label, group in totals.items():
+        assert results[label]['count'] == group['count']
+        assert results[label]['revenue'] == pytest.approx(group['cents'] / 100)
+        assert results[label]['dwell_minutes'] == group['dwell']
+
+
+def test_export_writes_closed_months_only(app, tmp_path):
+    with app.app_context():
+        written = seed(random.Random(17))
+        months = export_closed_months()
+
+    assert months == [FIRST.strftime('%Y-%m'), SECOND.strftime('%Y-%m')]
+    reader = ArchiveReader(app.config['ARCHIVE_DIR'])
+    assert reader.months() == months
+    first_count = sum(row['exit'] < SECOND for row in written)
+    assert reader._month(months[0]).manifest['rows'] == {'tickets': first_count, 'transactions': first_count}
+    # Nothing is left behind from staging
+    assert sorted(os.listdir(app.config['ARCHIVE_DIR'])) == months
+
+
+@pytest.mark.parametrize('by, key', [
+    (None, lambda row: 'all'),
+    ('vehicle_type', lambda row: row['vehicle_type']),
+    ('hour', lambda row: row['exit'].hour),
+    ('weekday', lambda row: row['exit'].weekday()),
+    ('day', lambda row: row['exit'].strftime('%Y-%m-%d')),
+    ('month', lambda row: row['exit'].strftime('%Y-%m')),
+])
+def test_read_back_matches_the_tickets(app, by, key):
+    with app.app_context():
+        written = seed(random.Random(23))
+        export_closed_months()
+
+    reader = ArchiveReader(app.config['ARCHIVE_DIR'])
+    # A range that starts and ends mid-month, across the month boundary
+    start, end = FIRST + timedelta(days=10, hours=5), SECOND + timedelta(days=12, minutes=30)
+    assert_tickets_match(reader.aggregate('tickets', start, end, by), expected(written, start, end, key))
+
+
+def test_transactions_read_back_by_payment_method(app):
+    with app.app_context():
+        written = seed(random.Random(29))
+        export_closed_months()
+
+    results = ArchiveReader(app.config['ARCHIVE_DIR']).aggregate(
+        'transactions', FIRST, next_month(SECOND), 'payment_method'
+    )
+    totals = expected(written, FIRST, next_month(SECOND), lambda row: row['method'])
+    assert {label: (result['count'], result['revenue']) for label, result in results.items()} == pytest.approx(
+        {label: (group['count'], group['cents'] / 100) for label, group in totals.items()}
+    )
+
+
+def test_cli_skips_archived_months_unless_forced(app):
+    with app.app_context():
+        seed(random.Random(31))
+        export_closed_months()
+        # A late correction to an archived month
+        ticket = ParkingTickets.query.filter(ParkingTickets.ExitTime < SECOND).first()
+        ticket.Amount = float(ticket.Amount) + 1000
+        db.session.commit()
+        before = ArchiveReader(app.config['ARCHIVE_DIR']).aggregate('tickets', FIRST, SECOND)['all']['revenue']
+
+    runner = app.test_cli_runner()
+    assert 'Archived 0 month(s)' in runner.invoke(args=['archive', 'export']).output
+    assert ArchiveReader(app.config['ARCHIVE_DIR']).aggregate('tickets', FIRST, SECOND)['all']['revenue'] == before
+
+    assert 'Archived 2 month(s)' in runner.invoke(args=['archive', 'export', '--force']).output
+    after = ArchiveReader(app.config['ARCHIVE_DIR']).aggregate('tickets', FIRST, SECOND)['all']['revenue']
+    assert after == pytest.approx(before + 1000)
+    assert os.path.exists(os.path.join(app.config['ARCHIVE_DIR'], FIRST.strftime('%Y-%m'), MANIFEST))
+
+
+def test_unsupported_queries_are_rejected(app):
+    reader = ArchiveReader(app.config['ARCHIVE_DIR'])
+    with pytest.raises(ValueError):
+        reader.aggregate('spaces', FIRST, SECOND)
+    with pytest.raises(ValueError):
+        reader.aggregate('tickets', FIRST, SECOND, by='plate')
+    assert reader.aggregate('tickets', FIRST, SECOND) == {}
@@ -0,0 +1,111 @@
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func
+
+from parking_gateout_app.bench_exit import create_bench_app
+from parking_gateout_app.bucketing import (
+    BUCKET_SIZES, as_datetime, bucket_range, bucket_start, bucketed_series, hour_of_day, next_bucket, truncate
+)
+from parking_gateout_app.models import db, ParkingTransactions
+
+# Month and year ends, a leap day, and both sides of a Monday
+EDGES = [
+    datetime(2023, 12, 31, 23, 59, 59),
+    datetime(2024, 1, 1, 0, 0, 0),
+    datetime(2024, 2, 29, 12, 30),
+    datetime(2024, 3, 3, 23, 59, 59, 999999),  # Sunday
+    datetime(2024, 3, 4, 0, 0, 0),  # Monday
+    datetime(2024, 3, 4, 0, 0, 1),
+    datetime(2024, 12, 30, 8, 15),  # Monday of a week spanning two years
+]
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_bench_app(os.path.join(tmp_path, 'bucketing.db'))
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def seed_transactions(moments):
+    db.session.add_all([ParkingTransactions(
+        Id=f'T{i}', ticket_id='1', transaction_number=f'TRX{i}', amount=(i % 7) * 1000 + 500,
+        payment_method='cash', status='completed', created_at=moment
+    ) for i, moment in enumerate(moments)])
+    db.session.commit()
+
+
+def random_moments(rng, count, start=datetime(2023, 11, 20), days=120):
+    return [start + timedelta(seconds=rng.randrange(days * 86400)) for _ in range(count)] + EDGES
+
+
+@pytest.mark.parametrize('size', BUCKET_SIZES)
+def test_sql_truncation_matches_bucket_start(app, size):
+    moments = random_moments(random.Random(size), 300)
+    with app.app_context():
+        seed_transactions(moments)
+        rows = db.session.execute(db.select(
+            ParkingTransactions.created_at,
+            truncate(ParkingTransactions.created_at, size),
+            hour_of_day(ParkingTransactions.created_at)
+        )).all()
+
+    assert len(rows) == len(moments)
+    for moment, bucket, hour in rows:
+        assert as_datetime(bucket) == bucket_start(moment, size), moment
+        assert hour == moment.hour
+
+
+@pytest.mark.parametrize('size', BUCKET_SIZES)
+def test_series_is_dense_and_matches_the_rows(app, size):
+    moments = random_moments(random.Random(7), 400)
+    # Mid-bucket bounds: rows before start are left out, the first bucket is partial
+    start, end = datetime(2023, 12, 13, 10, 45), datetime(2024, 3, 4, 0, 0, 1)
+    with app.app_context():
+        seed_transactions(moments)
+        series = bucketed_series(ParkingTransactions.created_at, start, end, size, {
+            'count': func.count(ParkingTransactions.Id),
+            'revenue': func.sum(ParkingTransactions.amount)
+        })
+
+    expected = defaultdict(lambda: [0, 0])
+    for i, moment in enumerate(moments):
+        if start <= moment < end:
+            expected[bucket_start(moment, size)][0] += 1
+            expected[bucket_start(moment, size)][1] += (i % 7) * 1000 + 500
+
+    assert [point['bucket'] for point in series] == bucket_range(start, end, size)
+    assert series[0]['bucket'] == bucket_start(start, size)
+    for point in series:
+        count, revenue = expected.get(point['bucket'], (0, 0))
+        assert (point['count'], float(point['revenue'])) == (count, revenue), point['bucket']
+    # Empty buckets are filled in, not dropped
+    if size == 'hour':
+        assert any(point['count'] == 0 for point in series)
+
+
+def test_bucket_boundaries():
+    assert bucket_start(datetime(2024, 3, 3, 23, 59), 'week') == datetime(2024, 2, 26)
+    assert bucket_start(datetime(2024, 3, 4, 0, 0), 'week') == datetime(2024, 3, 4)
+    assert next_bucket(datetime(2024, 1, 31, 18), 'month') == datetime(2024, 2, 1)
+    assert next_bucket(datetime(2024, 12, 15), 'month') == datetime(2025, 1, 1)
+    assert next_bucket(datetime(2024, 12, 31, 23, 30), 'hour') == datetime(2025, 1, 1)
+    assert bucket_range(datetime(2024, 1, 1), datetime(2024, 1, 1), 'day') == []
+    assert bucket_range(datetime(2024, 1, 1, 6), datetime(2024, 1, 3), 'day') == [
+        datetime(2024, 1, 1), datetime(2024, 1, 2)
+    ]
+
+
+def test_unsupported_size_is_rejected(app):
+    with pytest.raises(ValueError):
+        bucket_start(datetime(2024, 1, 1), 'quarter')
+    with app.app_context():
+        with pytest.raises(ValueError):
+            bucketed_series(ParkingTransactions.created_at, datetime(2024, 1, 1), datetime(2024, 2, 1),
+                            'minute', {'count': func.count(ParkingTransactions.Id)})
@@ -0,0 +1,117 @@
+import math
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from parking_gateout_app.bench_exit import create_bench_app
+from parking_gateout_app.dwell import RELATIVE_ACCURACY, DwellSketch, sketches_from_rows
+from parking_gateout_app.models import db, ParkingTickets, Vehicles
+from parking_gateout_app.rollup import backfill, dwell_quantiles, month_start, next_month
+
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0)
+
+
+def random_stays(rng, count):
+    """Stay lengths in whole minutes, mostly a few hours with a long tail"""
+    return [max(1, min(60 * 24 * 30, round(rng.lognormvariate(4.5, 1.2)))) for _ in range(count)]
+
+
+def exact_quantile(values, q):
+    """The value the sketch estimates: the element of rank q * (n - 1), rounded down"""
+    ordered = sorted(values)
+    return ordered[int(math.floor(q * (len(ordered) - 1)))]
+
+
+def assert_accurate(estimates, values):
+    for q, estimate in zip(QUANTILES, estimates):
+        exact = exact_quantile(values, q)
+        # Estimates are rounded to a tenth of a minute
+        assert abs(estimate - exact) <= RELATIVE_ACCURACY * exact + 0.05, (q, estimate, exact)
+
+
+def sketch_of(values):
+    sketch = DwellSketch()
+    for minutes in values:
+        sketch.add(minutes)
+    return sketch
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_merged_sketches_equal_one_sketch_of_every_stay(seed):
+    rng = random.Random(seed)
+    values = random_stays(rng, 5000)
+    # Split as hourly sketches would be, in uneven parts
+    cuts = sorted(rng.sample(range(1, len(values)), 40))
+    parts = [sketch_of(values[low:high]) for low, high in zip([0] + cuts, cuts + [len(values)])]
+    rng.shuffle(parts)
+
+    merged = DwellSketch()
+    for part in parts:
+        merged.merge(part)
+
+    whole = sketch_of(values)
+    assert merged.counts == whole.counts
+    assert merged.count == len(values)
+    assert merged.quantiles(QUANTILES) == whole.quantiles(QUANTILES)
+    assert_accurate(merged.quantiles(QUANTILES), values)
+
+
+def test_short_stays_and_empty_sketches():
+    sketch = sketch_of([0, None, 0.5, 1, 1])
+    assert sketch.quantiles((0, 0.5, 1)) == [0, 0, 1.0]
+    assert DwellSketch().quantiles((0.5, 0.9)) == [None, None]
+    assert DwellSketch().merge(sketch).counts == sketch.counts
+
+
+def test_sketches_from_rows_sums_repeated_buckets():
+    rows = [('MOBIL', 5, 2), ('MOBIL', 5, 3), ('MOTOR', 5, 1), ('MOBIL', 7, 1)]
+    sketches = sketches_from_rows(rows)
+    assert sketches[('MOBIL',)].counts == {5: 5, 7: 1}
+    assert sketches[('MOTOR',)].count == 1
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_bench_app(os.path.join(tmp_path, 'dwell.db'))
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_range_quantiles_merge_monthly_and_hourly_sketches(app):
+    rng = random.Random(42)
+    # Three closed months, so the middle one is read from the monthly sketches
+    first = month_start(month_start(datetime.now()) - timedelta(days=80))
+    end_of_data = next_month(next_month(next_month(first)))
+    span = int((end_of_data - first).total_seconds() // 60)
+    stays = []
+    with app.app_context():
+        db.session.add(Vehicles(Id='2', plate_number='D99AB', vehicle_type='MOTOR'))
+        for number, minutes in enumerate(random_stays(rng, 3000)):
+            exit_time = first + timedelta(minutes=rng.randrange(span))
+            vehicle_type = rng.choice(['MOBIL', 'MOTOR'])
+            db.session.add(ParkingTickets(
+                TicketNumber=f'W{number:06d}', VehicleId='1' if vehicle_type == 'MOBIL' else '2',
+                EntryTime=exit_time - timedelta(minutes=minutes), ExitTime=exit_time,
+                Duration=minutes, Status='completed'
+            ))
+            stays.append((exit_time, vehicle_type, minutes))
+        db.session.commit()
+        backfill(first, end_of_data)
+
+        # Partial months at both ends, mid-hour bounds rounded to the hour
+        start = first + timedelta(days=12, hours=7)
+        end = next_month(next_month(first)) + timedelta(days=9, hours=15)
+        results = dwell_quantiles(start, end, by=('vehicle_type',), qs=QUANTILES)
+
+    assert [result['vehicle_type'] for result in results] == ['MOBIL', 'MOTOR']
+    for result in results:
+        values = [minutes for exit_time, vehicle_type, minutes in stays
+                  if vehicle_type == result['vehicle_type'] and start <= exit_time < end]
+        assert result['count'] == len(values)
+        estimates = [result[f'p{q * 100:g}'] for q in QUANTILES]
+        assert estimates == sketch_of(values).quantiles(QUANTILES)
+        assert_accurate(estimates, values)
@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+from parking_gateout_app.app import limiter
+from parking_gateout_app.bench_exit import create_bench_app, seed_tickets
+from parking_gateout_app.events import SETTLE_SECONDS, Cursor, event_stream, get_event_log, queue_event
+from parking_gateout_app.models import db, AspNetUsers, DashboardEvents
+from parking_gateout_app.services import ParkingService
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret')
+    app = create_bench_app(os.path.join(tmp_path, 'events.db'))
+    app.config['RATELIMIT_ENABLED'] = False
+    # One-shot responses, as on sync workers
+    app.config['EVENTS_STREAM_SECONDS'] = 0
+    limiter.init_app(app)
+    with app.app_context():
+        # routes registers some blueprints on the current app when first imported
+        from parking_gateout_app.dashboard_routes import api_dashboard_bp
+        app.register_blueprint(api_dashboard_bp, name='api_dashboard')
+        db.session.add(AspNetUsers(Id='operator', UserName='operator'))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def auth_header(last_event_id=None):
+    headers = {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'operator'}, 'test-secret', algorithm='HS256')}
+    if last_event_id:
+        headers['Last-Event-ID'] = last_event_id
+    return headers
+
+
+def parse(message):
+    """The id, event type and data of an SSE message"""
+    fields = {}
+    for line in message.strip().split('\n'):
+        if line and not line.startswith(':'):
+            field, _, value = line.partition(': ')
+            fields[field] = value
+    return fields.get('id'), fields.get('event'), json.loads(fields['data']) if 'data' in fields else None
+
+
+def fetch(client, last_event_id=None):
+    """The messages of one response, without the retry field"""
+    response = client.get('/api/dashboard/events', headers=auth_header(last_event_id))
+    assert response.status_code == 200
+    return [parse(message) for message in response.get_data(as_text=True).split('\n\n')
+            if message and not message.startswith('retry:')]
+
+
+def insert_event(event_id, event_type='entry', age=0):
+    """Commit an event with a chosen ID, as a transaction that took it earlier or later would"""
+    db.session.add(DashboardEvents(Id=event_id, Type=event_type, Data={'id': event_id},
+                                   CreatedAt=datetime.utcnow() - timedelta(seconds=age)))
+    db.session.commit()
+
+
+def test_client_resumes_from_last_event_id(app):
+    client = app.test_client()
+    (cursor, event_type, _), = fetch(client)
+    assert event_type == 'ready'
+
+    with app.app_context():
+        ticket_number, = seed_tickets('R', 1)
+        assert ParkingService.process_vehicle_exit(ticket_number, fast=True)['success']
+
+    (cursor, event_type, data), = fetch(client, cursor)
+    assert event_type == 'change'
+    assert data['counts']['exit'] == 1
+    assert [item['type'] for item in data['events'] if item['type'] == 'exit'] == ['exit']
+
+    # Nothing new: only the cursor moves on
+    (quiet_cursor, event_type, data), = fetch(client, cursor)
+    assert (event_type, data) == (None, None)
+    assert Cursor.parse(quiet_cursor).settled == Cursor.parse(cursor).settled
+
+
+def test_unknown_or_expired_cursor_is_reset(app):
+    client = app.test_client()
+    assert fetch(client, 'garbage')[0][1] == 'reset'
+    assert fetch(client, Cursor(0, (), time.time() - 2 * 3600).format())[0][1] == 'reset'
+    # A cursor from another database, further on than this log
+    assert fetch(client, Cursor(50, (), time.time()).format())[0][1] == 'reset'
+
+
+def test_out_of_order_commits_are_not_skipped(app):
+    log = get_event_log()
+    with app.app_context():
+        cursor = log.start()
+        assert cursor.settled == 0
+
+        # ID 2 commits before ID 1
+        insert_event(2)
+        events, cursor = log.read(cursor)
+        assert [event.id for event in events] == [2]
+        assert (cursor.settled, cursor.sent) == (0, (2,))
+
+        insert_event(1)
+        events, cursor = log.read(cursor)
+        assert [event.id for event in events] == [1]
+        assert (cursor.settled, cursor.sent) == (2, ())
+
+        events, cursor = log.read(cursor)
+        assert events == []
+
+
+def test_gap_settles_once_later_events_are_old(app):
+    log = get_event_log()
+    with app.app_context():
+        cursor = Cursor(0, (), time.time())
+        # ID 1 was taken by a transaction that rolled back
+        insert_event(2, age=SETTLE_SECONDS + 5)
+        insert_event(3)
+
+        events, cursor = log.read(cursor)
+        assert [event.id for event in events] == [2, 3]
+        assert (cursor.settled, cursor.sent) == (3, ())
+
+
+def test_stream_coalesces_a_burst_into_one_change(app):
+    stream = event_stream(app, get_event_log(), None, coalesce=0.5, heartbeat=15, lifetime=10, poll=0.05)
+    assert next(stream).startswith('retry:')
+    assert parse(next(stream))[1] == 'ready'
+
+    def burst():
+        time.sleep(0.1)
+        with app.app_context():
+            for number in range(3):
+                queue_event(db.session, 'entry', {'number': number})
+                db.session.commit()
+            db.session.remove()
+
+    writer = threading.Thread(target=burst)
+    writer.start()
+    try:
+        _, event_type, data = parse(next(stream))
+    finally:
+        writer.join()
+        stream.close()
+
+    assert event_type == 'change'
+    assert data['counts'] == {'entry': 3}
+    assert [item['number'] for item in data['events']] == [0, 1, 2]
@@ -0,0 +1,73 @@
+import os
+import random
+import threading
+from collections import Counter
+
+import pytest
+
+from parking_gateout_app.active_index import reload_active_index
+from parking_gateout_app.bench_exit import create_bench_app, seed_tickets
+from parking_gateout_app.models import db, ParkingTickets, ParkingTransactions
+from parking_gateout_app.services import ParkingService
+
+LANES = 8
+TICKETS = 40
+LOSER_MESSAGES = {"Ticket has already been used for exit", "Invalid ticket status: completed"}
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_bench_app(os.path.join(tmp_path, 'lanes.db'))
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.mark.parametrize('fast', [True, False], ids=['fast', 'legacy'])
+def test_each_ticket_exits_exactly_once(app, fast):
+    with app.app_context():
+        tickets = seed_tickets('L', TICKETS)
+        reload_active_index()
+
+    wins = Counter()
+    losses = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(LANES)
+
+    def lane(seed):
+        order = list(tickets)
+        random.Random(seed).shuffle(order)
+        with app.app_context():
+            start.wait()
+            for ticket_number in order:
+                try:
+                    result = ParkingService.process_vehicle_exit(ticket_number, fast=fast)
+                except Exception as e:  # surfaced below, a lane must never crash
+                    with lock:
+                        errors.append(repr(e))
+                    db.session.rollback()
+                    continue
+                with lock:
+                    if result['success']:
+                        wins[ticket_number] += 1
+                    else:
+                        losses.append(result['message'])
+            db.session.remove()
+
+    threads = [threading.Thread(target=lane, args=(seed,)) for seed in range(LANES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(wins) == sorted(tickets)
+    assert set(wins.values()) == {1}
+    assert len(losses) == TICKETS * (LANES - 1)
+    assert set(losses) <= LOSER_MESSAGES
+
+    with app.app_context():
+        assert ParkingTickets.query.filter_by(Status='active').count() == 0
+        assert ParkingTransactions.query.count() == TICKETS
@@ -0,0 +1,73 @@
+import os
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+from parking_gateout_app.active_index import reload_active_index
+from parking_gateout_app.app import limiter
+from parking_gateout_app.bench_exit import create_bench_app, seed_tickets
+from parking_gateout_app.models import db, AspNetUsers, MemberRates, ParkingTickets
+from parking_gateout_app.tariff import quote_fee, reload_tariff_table
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret')
+    app = create_bench_app(os.path.join(tmp_path, 'fees.db'))
+    app.config['RATELIMIT_ENABLED'] = False
+    limiter.init_app(app)
+    with app.app_context():
+        # routes registers some blueprints on the current app when first imported
+        from parking_gateout_app.routes import main_bp, parking_bp
+        app.register_blueprint(parking_bp, name='parking_api')
+        app.register_blueprint(main_bp, name='main_api')
+        db.session.add(AspNetUsers(Id='operator', UserName='operator'))
+        # A free member rate that a client must not be able to claim
+        db.session.add(MemberRates(MembershipType='vip', VehicleType='MOBIL', DurationType='monthly', Rate=0))
+        db.session.commit()
+        reload_tariff_table()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def auth_header():
+    return {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'operator'}, 'test-secret', algorithm='HS256')}
+
+
+def expected_fee(ticket):
+    return quote_fee(ticket.EntryTime, ticket.ExitTime, 'MOBIL')
+
+
+def test_client_membership_is_ignored_by_parking_exit(app):
+    with app.app_context():
+        ticket_number, = seed_tickets('P', 1)
+        reload_active_index()
+
+    response = app.test_client().put(
+        '/api/parking-sessions/exit',
+        json={'ticketNumber': ticket_number, 'membershipType': 'VIP'},
+        headers=auth_header()
+    )
+
+    assert response.status_code == 200, response.get_json()
+    with app.app_context():
+        ticket = ParkingTickets.query.filter_by(TicketNumber=ticket_number).one()
+        assert float(ticket.Amount) == expected_fee(ticket) > 0
+
+
+def test_client_membership_is_ignored_by_main_exit(app):
+    with app.app_context():
+        ticket_number, = seed_tickets('M', 1)
+        ticket_id = ParkingTickets.query.filter_by(TicketNumber=ticket_number).one().Id
+
+    response = app.test_client().get(
+        f'/api/main/exit?ticket_id={ticket_id}&membership_type=vip', headers=auth_header()
+    )
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    with app.app_context():
+        ticket = db.session.get(ParkingTickets, ticket_id)
+        assert float(ticket.Amount) == expected_fee(ticket) > 0
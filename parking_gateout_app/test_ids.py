@@ -0,0 +1,30 @@
+import pytest
+
+from parking_gateout_app.app import create_app
+from parking_gateout_app.utils import MAX_NODE_ID, SnowflakeGenerator, get_gate_id
+
+
+@pytest.mark.parametrize('gate_id', ['0', '31'])
+def test_gate_ids_in_range_are_accepted(monkeypatch, gate_id):
+    monkeypatch.setenv('GATE_ID', gate_id)
+    assert get_gate_id() == int(gate_id)
+
+
+@pytest.mark.parametrize('gate_id', ['-1', '32', '33'])
+def test_gate_ids_out_of_range_are_rejected(monkeypatch, gate_id):
+    monkeypatch.setenv('GATE_ID', gate_id)
+    with pytest.raises(ValueError, match='GATE_ID'):
+        get_gate_id()
+
+
+def test_app_does_not_start_with_an_invalid_gate_id(monkeypatch):
+    monkeypatch.delenv('NODE_ID', raising=False)
+    # 33 would have been masked to 1, sharing IDs with gate 1
+    monkeypatch.setenv('GATE_ID', '33')
+    with pytest.raises(ValueError, match='GATE_ID'):
+        create_app()
+
+
+def test_node_id_out_of_range_is_rejected():
+    with pytest.raises(ValueError):
+        SnowflakeGenerator(MAX_NODE_ID + 1)
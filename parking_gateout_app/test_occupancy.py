@@ -0,0 +1,160 @@
+import os
+import random
+from datetime import date, datetime, timedelta
+
+import jwt
+import pytest
+
+from parking_gateout_app.app import limiter
+from parking_gateout_app.bench_exit import create_bench_app
+from parking_gateout_app.models import db, AspNetUsers, ParkingSpaces, ParkingTickets, ReportInvalidations
+from parking_gateout_app.occupancy import occupancy_series
+from parking_gateout_app.space_counters import COUNTERS
+
+# Closed days only, so the day curves are cached
+DAY = datetime.combine(date.today() - timedelta(days=4), datetime.min.time())
+LEVELS = ('1', '2')
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret')
+    app = create_bench_app(os.path.join(tmp_path, 'occupancy.db'))
+    app.config['RATELIMIT_ENABLED'] = False
+    limiter.init_app(app)
+    monkeypatch.setattr('parking_gateout_app.report_cache._synced_id', None)
+    with app.app_context():
+        # routes registers some blueprints on the current app when first imported
+        from parking_gateout_app.dashboard_routes import api_dashboard_bp
+        from parking_gateout_app.occupancy import _curves
+        app.register_blueprint(api_dashboard_bp, name='api_dashboard')
+        db.session.add(AspNetUsers(Id='operator', UserName='operator'))
+        db.session.commit()
+    _curves.clear()
+    yield app
+    _curves.clear()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def auth_header():
+    return {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'operator'}, 'test-secret', algorithm='HS256')}
+
+
+def seed_stays(rng, count=150):
+    """Completed and cancelled stays over three closed days; returns (entry, exit, level, counted)"""
+    spaces = [ParkingSpaces(SpaceNumber=f'{level}-{i}', Level=level, Section='A', VehicleType='MOBIL',
+                            Status='available') for level in LEVELS for i in range(3)]
+    db.session.add_all(spaces)
+    db.session.flush()
+    stays = []
+    for number in range(count):
+        space = rng.choice(spaces)
+        entry = DAY + timedelta(seconds=rng.randrange(3 * 86400))
+        exit_time = entry + timedelta(seconds=rng.randint(1, 20 * 3600))
+        status = rng.choice(['completed'] * 9 + ['cancelled'])
+        db.session.add(ParkingTickets(TicketNumber=f'O{number:06d}', VehicleId='1', SpaceId=space.Id,
+                                      EntryTime=entry, ExitTime=exit_time, Status=status))
+        stays.append((entry, exit_time, space.Level, status != 'cancelled'))
+    db.session.commit()
+    return stays
+
+
+def inside(stays, moment, level=None):
+    return sum(1 for entry, exit_time, stay_level, counted in stays
+               if counted and entry <= moment < exit_time and level in (None, stay_level))
+
+
+@pytest.mark.parametrize('start_minute, minutes, resolution', [
+    (0, 3 * 1440, 60),  # every seeded day
+    (17 * 60 + 13, 1440 + 7, 15),  # starts and ends mid-day, across midnight
+    (1439, 2, 1),  # one minute either side of midnight
+    (600, 100, 7),  # last point shorter than the resolution
+])
+def test_series_matches_a_minute_by_minute_count(app, start_minute, minutes, resolution):
+    with app.app_context():
+        stays = seed_stays(random.Random(start_minute))
+        start = DAY + timedelta(minutes=start_minute)
+        end = start + timedelta(minutes=minutes)
+        # Second run is served from the cached days
+        for _ in range(2):
+            result = occupancy_series(start, end, resolution, group_by='level')
+
+    assert result['timestamps'] == [(start + timedelta(minutes=m)).isoformat() for m in range(0, minutes, resolution)]
+    for level in LEVELS:
+        series = result['series'][level]
+        for point, moment in enumerate(range(0, minutes, resolution)):
+            at = start + timedelta(minutes=moment)
+            assert series['occupancy'][point] == inside(stays, at, level), at
+            within = range(moment, min(moment + resolution, minutes))
+            assert series['peak'][point] == max(inside(stays, start + timedelta(minutes=m), level) for m in within)
+
+
+def test_late_write_from_another_process_refreshes_later_days(app):
+    with app.app_context():
+        seed_stays(random.Random(1), count=20)
+        end = DAY + timedelta(days=3)
+        before = occupancy_series(DAY, end, 60)['series']['all']['occupancy']
+
+        # A stay spanning the range, written with an invalidation for its first day only
+        db.session.add(ParkingTickets(TicketNumber='LATE01', VehicleId='1', EntryTime=DAY,
+                                      ExitTime=end, Status='completed'))
+        db.session.add(ReportInvalidations(Day=DAY.date()))
+        db.session.commit()
+        after = occupancy_series(DAY, end, 60)['series']['all']['occupancy']
+
+    assert after == [count + 1 for count in before]
+
+
+def test_unsupported_series_requests_are_rejected(app):
+    with app.app_context():
+        with pytest.raises(ValueError):
+            occupancy_series(DAY, DAY + timedelta(hours=1), group_by='plate')
+        with pytest.raises(ValueError):
+            occupancy_series(DAY, DAY)
+        with pytest.raises(ValueError):
+            occupancy_series(DAY, DAY + timedelta(days=400))
+
+    response = app.test_client().get('/api/dashboard/occupancy', query_string={'by': 'plate'},
+                                     headers=auth_header())
+    assert response.status_code == 400
+
+
+def test_current_counts_match_the_spaces(app):
+    rng = random.Random(5)
+    with app.app_context():
+        db.session.add_all([ParkingSpaces(
+            SpaceNumber=f'C{i}', Level=rng.choice(LEVELS), Section=rng.choice('AB'),
+            VehicleType=rng.choice(['MOBIL', 'MOTOR']), IsOccupied=rng.random() < 0.4,
+            Status=rng.choice(['available', 'available', 'reserved', 'maintenance'])
+        ) for i in range(60)])
+        db.session.commit()
+        spaces = ParkingSpaces.query.all()
+
+    def expected(**filters):
+        chosen = [space for space in spaces
+                  if all(getattr(space, key) == value for key, value in filters.items())]
+        return {
+            'total': len(chosen),
+            'occupied': sum(bool(space.IsOccupied) for space in chosen),
+            'reserved': sum(space.Status == 'reserved' for space in chosen),
+            'maintenance': sum(space.Status == 'maintenance' for space in chosen),
+            'available': sum(not space.IsOccupied and space.Status == 'available' for space in chosen)
+        }
+
+    client = app.test_client()
+    for query, filters in [
+        ({}, {}),
+        ({'level': '2'}, {'Level': '2'}),
+        ({'section': 'B', 'vehicle_type': 'MOTOR'}, {'Section': 'B', 'VehicleType': 'MOTOR'}),
+    ]:
+        data = client.get('/api/dashboard/occupancy/current', query_string=query, headers=auth_header()).get_json()['data']
+        assert {name.lower(): data[name.lower()] for name in COUNTERS} == expected(**filters)
+
+    groups = client.get('/api/dashboard/occupancy/current', query_string={'groups': 'true'},
+                        headers=auth_header()).get_json()['data']['groups']
+    assert sum(group['total'] for group in groups) == 60
+    for group in groups:
+        counts = expected(Level=group['level'], Section=group['section'], VehicleType=group['vehicle_type'])
+        assert {name: group[name] for name in counts} == counts
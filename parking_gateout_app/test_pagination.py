@@ -0,0 +1,104 @@
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+from parking_gateout_app.app import limiter
+from parking_gateout_app.bench_exit import create_bench_app
+from parking_gateout_app.models import db, ActivityLog, AspNetUsers
+from parking_gateout_app.pagination import decode_cursor, encode_cursor, keyset_page
+
+START = datetime(2025, 4, 1, 8, 0)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret')
+    app = create_bench_app(os.path.join(tmp_path, 'pagination.db'))
+    app.config['RATELIMIT_ENABLED'] = False
+    limiter.init_app(app)
+    with app.app_context():
+        # routes registers some blueprints on the current app when first imported
+        from parking_gateout_app.dashboard_routes import api_activities_bp
+        app.register_blueprint(api_activities_bp, name='api_activities')
+        db.session.add(AspNetUsers(Id='operator', UserName='operator'))
+        # Runs of equal timestamps, so page boundaries fall inside ties, then rows without one
+        db.session.add_all([ActivityLog(Action='seeded', CreatedAt=START + timedelta(minutes=i // 3))
+                            for i in range(20)])
+        db.session.flush()
+        db.session.add_all([ActivityLog(Action='seeded') for _ in range(4)])
+        db.session.flush()
+        ActivityLog.query.filter(ActivityLog.Id > 20).update({'CreatedAt': None})
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def auth_header():
+    return {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'operator'}, 'test-secret', algorithm='HS256')}
+
+
+def token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+def walk(limit):
+    """Ids of every page in order, following next_cursor"""
+    ids, cursor = [], None
+    while True:
+        page = keyset_page(ActivityLog.query, ActivityLog.CreatedAt, ActivityLog.Id, cursor=cursor, limit=limit)
+        ids.extend(row.Id for row in page['items'])
+        assert page['has_more'] == (page['next_cursor'] is not None)
+        if not page['has_more']:
+            return ids
+        cursor = page['next_cursor']
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 4, 6, 20, 23, 24, 25, 100])
+def test_pages_cover_every_row_once_in_order(app, limit):
+    with app.app_context():
+        expected = [row.Id for row in ActivityLog.query.filter(ActivityLog.CreatedAt.isnot(None))
+                    .order_by(ActivityLog.CreatedAt.desc(), ActivityLog.Id.desc())]
+        expected += [24, 23, 22, 21]
+        assert walk(limit) == expected
+
+
+def test_exact_and_capped_totals(app, monkeypatch):
+    with app.app_context():
+        page = keyset_page(ActivityLog.query, ActivityLog.CreatedAt, ActivityLog.Id, limit=5, total='exact')
+        assert (page['total'], page['total_capped']) == (24, False)
+
+        monkeypatch.setattr('parking_gateout_app.pagination.TOTAL_COUNT_CAP', 10)
+        page = keyset_page(ActivityLog.query, ActivityLog.CreatedAt, ActivityLog.Id, limit=5, total='approx')
+        assert (page['total'], page['total_capped']) == (10, True)
+
+
+def test_cursor_round_trips():
+    assert decode_cursor(encode_cursor(START, 7)) == (START, 7)
+    assert decode_cursor(encode_cursor(None, 'abc')) == (None, 'abc')
+
+
+@pytest.mark.parametrize('cursor', [
+    '!!!',
+    token({'a': 1}),
+    token(['not a date', 1]),
+    token([5, 1]),
+    token([None, [1]]),
+    token([START.isoformat(), {'a': 1}]),
+    token([START.isoformat(), None]),
+    token([None, True]),
+    encode_cursor(START, 7)[:-3],
+])
+def test_tampered_cursor_is_rejected(app, cursor):
+    with app.app_context():
+        with pytest.raises(ValueError, match='Invalid cursor'):
+            keyset_page(ActivityLog.query, ActivityLog.CreatedAt, ActivityLog.Id, cursor=cursor)
+
+    response = app.test_client().get('/api/activities', query_string={'cursor': cursor}, headers=auth_header())
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'INVALID_CURSOR'
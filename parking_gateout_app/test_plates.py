@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import create_engine, literal, select
+
+from parking_gateout_app.models import normalized_plate
+from parking_gateout_app.utils import normalize_plate
+
+PLATES = [
+    'b 1234-xyz',
+    'B1234XYZ',
+    '  d 99 - ab  ',
+    '--',
+    'ab\t12\ncd',  # only spaces are removed, not other whitespace
+    'straße 1',  # non-ASCII letters keep their case
+    'é-1 ç',
+    'ǆ 7',
+    'İı 12',
+    'ｂ１２',  # full-width characters are left alone
+]
+
+
+@pytest.fixture(scope='module')
+def connection():
+    engine = create_engine('sqlite://')
+    with engine.connect() as connection:
+        yield connection
+    engine.dispose()
+
+
+@pytest.mark.parametrize('plate', PLATES)
+def test_python_and_sql_normalize_plates_alike(connection, plate):
+    in_sql = connection.execute(select(normalized_plate(literal(plate)))).scalar()
+    assert normalize_plate(plate) == in_sql
+
+
+def test_normalize_plate_removes_spaces_and_dashes():
+    assert normalize_plate('b 1234-xyz') == 'B1234XYZ'
+    assert normalize_plate(None) == ''
@@ -0,0 +1,113 @@
+import os
+from datetime import date, datetime, timedelta
+
+import jwt
+import pytest
+
+from parking_gateout_app.app import limiter
+from parking_gateout_app.bench_exit import create_bench_app
+from parking_gateout_app.models import db, AspNetUsers, ParkingHourlyStats, ReportInvalidations
+from parking_gateout_app.report_cache import (
+    RECHECK_SECONDS, CachedReport, ReportCache, get_report_cache, sync_invalidations
+)
+
+YESTERDAY = date.today() - timedelta(days=1)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret')
+    app = create_bench_app(os.path.join(tmp_path, 'reports.db'))
+    app.config['RATELIMIT_ENABLED'] = False
+    limiter.init_app(app)
+    # Every test starts on a new database, as a freshly started worker would
+    monkeypatch.setattr('parking_gateout_app.report_cache._synced_id', None)
+    with app.app_context():
+        # routes registers some blueprints on the current app when first imported
+        from parking_gateout_app.routes import report_bp
+        app.register_blueprint(report_bp, name='report_api')
+        db.session.add(AspNetUsers(Id='operator', UserName='operator'))
+        db.session.commit()
+    get_report_cache().clear()
+    yield app
+    get_report_cache().clear()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def auth_header(etag=None):
+    headers = {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'operator'}, 'test-secret', algorithm='HS256')}
+    if etag:
+        headers['If-None-Match'] = etag
+    return headers
+
+
+def late_write_elsewhere(exits, invalidate=True, age=0, row_id=None):
+    """Change yesterday's rollup as another process would, without this process's session hooks"""
+    hour = datetime.combine(YESTERDAY, datetime.min.time()) + timedelta(hours=9)
+    row = ParkingHourlyStats.query.filter_by(Hour=hour, VehicleType='MOBIL').first()
+    if row is None:
+        row = ParkingHourlyStats(Hour=hour, VehicleType='MOBIL', Entries=0, Exits=0, DwellMinutes=0,
+                                 Transactions=0, Revenue=0)
+        db.session.add(row)
+    row.Exits = exits
+    if invalidate:
+        db.session.add(ReportInvalidations(Id=row_id, Day=YESTERDAY,
+                                           CreatedAt=datetime.utcnow() - timedelta(seconds=age)))
+    db.session.commit()
+
+
+def entry(start=YESTERDAY, days=1):
+    return CachedReport(body=b'{}', etag='x', start=start, end=start + timedelta(days=days), expires_at=None)
+
+
+def test_late_write_by_another_process_invalidates_the_report(app):
+    client = app.test_client()
+    url = f'/api/reports/daily?date={YESTERDAY.isoformat()}'
+    first = client.get(url, headers=auth_header())
+    etag = first.headers['ETag']
+    assert first.get_json()['data']['exits'] == 0
+
+    with app.app_context():
+        late_write_elsewhere(3, invalidate=False)
+    # Without an invalidation row the cached report is still served
+    assert client.get(url, headers=auth_header(etag)).status_code == 304
+
+    with app.app_context():
+        late_write_elsewhere(4)
+    changed = client.get(url, headers=auth_header(etag))
+    assert changed.status_code == 200
+    assert changed.get_json()['data']['exits'] == 4
+
+
+def test_invalidation_committed_out_of_id_order_is_applied(app):
+    with app.app_context():
+        cache = get_report_cache()
+        sync_invalidations()
+        # Id 2 commits first and is applied...
+        late_write_elsewhere(1, row_id=2, age=RECHECK_SECONDS + 60)
+        sync_invalidations()
+
+        cache.put(('daily', ()), entry(), cache.begin())
+        # ...then Id 1 commits, behind the Id already applied
+        late_write_elsewhere(2, row_id=1)
+        sync_invalidations()
+        assert cache.get(('daily', ())) is None
+
+        # Once outside the recheck window, old rows are not applied again
+        ReportInvalidations.query.update({'CreatedAt': datetime.utcnow() - timedelta(seconds=RECHECK_SECONDS + 60)})
+        db.session.commit()
+        cache.put(('daily', ()), entry(), cache.begin())
+        sync_invalidations()
+        assert cache.get(('daily', ())) is not None
+
+
+def test_report_built_across_an_invalidation_is_not_stored():
+    cache = ReportCache()
+    started = cache.begin()
+    cache.invalidate_days([YESTERDAY])
+    assert not cache.put(('weekly', ()), entry(YESTERDAY - timedelta(days=3), days=7), started)
+    # Reports not covering the day are unaffected
+    assert cache.put(('daily', ()), entry(YESTERDAY - timedelta(days=3)), started)
+    assert len(cache) == 1
@@ -0,0 +1,58 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from parking_gateout_app.bench_exit import create_bench_app, seed_tickets
+from parking_gateout_app.models import db, ParkingHourlyStats
+from parking_gateout_app.rollup import backfill, hour_start, rollup_cli, rollup_series, rollup_totals, verify
+from parking_gateout_app.services import ParkingService
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_bench_app(os.path.join(tmp_path, 'rollup.db'))
+    app.cli.add_command(rollup_cli)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def exit_all(tickets):
+    for ticket_number in tickets:
+        result = ParkingService.process_vehicle_exit(ticket_number, fast=True)
+        assert result['success'], result['message']
+
+
+def test_gate_in_entries_are_counted_and_verify_cleanly(app):
+    with app.app_context():
+        # Tickets written straight to the table, as the gate-in backend does
+        tickets = seed_tickets('G', 5)
+        exit_all(tickets[:3])
+        entered = datetime.now() - timedelta(hours=3)
+
+        day = entered.replace(hour=0, minute=0, second=0, microsecond=0)
+        totals = rollup_totals(day, day + timedelta(days=2))
+        assert (totals['Entries'], totals['Exits'], totals['Transactions']) == (5, 3, 3)
+        assert sum(point['Entries'] for point in rollup_series(day, day + timedelta(days=2), 'hour')) == 5
+        assert verify() == []
+
+    result = app.test_cli_runner().invoke(args=['rollup', 'verify'])
+    assert result.exit_code == 0, result.output
+
+
+def test_verify_reports_drift_and_backfill_repairs_it(app):
+    with app.app_context():
+        exit_all(seed_tickets('D', 2))
+        row = ParkingHourlyStats.query.filter(ParkingHourlyStats.Exits > 0).first()
+        row.Exits += 4
+        db.session.commit()
+
+        mismatches = verify()
+        assert [(item['metric'], item['rollup'], item['raw']) for item in mismatches] == [('Exits', 6.0, 2.0)]
+        assert mismatches[0]['hour'] == hour_start(row.Hour).isoformat()
+
+        backfill()
+        assert verify() == []
+        assert ParkingHourlyStats.query.with_entities(db.func.sum(ParkingHourlyStats.Entries)).scalar() == 0
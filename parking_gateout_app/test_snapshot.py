@@ -0,0 +1,92 @@
+import os
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+from parking_gateout_app.app import limiter
+from parking_gateout_app.bench_exit import create_bench_app, seed_tickets
+from parking_gateout_app.models import db, AspNetUsers, DashboardEvents, ParkingSpaces, ParkingTickets
+from parking_gateout_app.snapshot import get_snapshot_cache
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret')
+    app = create_bench_app(os.path.join(tmp_path, 'snapshot.db'))
+    app.config['RATELIMIT_ENABLED'] = False
+    # Long enough that only a logged event can refresh the snapshot
+    app.config['DASHBOARD_SNAPSHOT_SECONDS'] = 600
+    limiter.init_app(app)
+    with app.app_context():
+        # routes registers some blueprints on the current app when first imported
+        from parking_gateout_app.dashboard_routes import api_dashboard_bp
+        app.register_blueprint(api_dashboard_bp, name='api_dashboard')
+        db.session.add(AspNetUsers(Id='operator', UserName='operator'))
+        db.session.add_all([ParkingSpaces(SpaceNumber=f'A{i}', IsOccupied=i == 0, Status='available')
+                            for i in range(4)])
+        db.session.commit()
+    get_snapshot_cache().clear()
+    yield app
+    get_snapshot_cache().clear()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def auth_header():
+    return {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'operator'}, 'test-secret', algorithm='HS256')}
+
+
+def log_event_elsewhere():
+    """Log a dashboard event the way another worker's commit would"""
+    db.session.add(DashboardEvents(Type='entry', Data={}, CreatedAt=datetime.utcnow()))
+    db.session.commit()
+
+
+def test_sessions_count_tickets_and_spaces_come_from_counters(app):
+    with app.app_context():
+        # Gate-in tickets without a space still count as sessions
+        seed_tickets('G', 3)
+
+    response = app.test_client().get('/api/dashboard/snapshot', headers=auth_header())
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['overview']['active_sessions'] == 3 == len(data['active_sessions'])
+    assert (data['overview']['occupied_spaces'], data['overview']['available_spaces']) == (1, 3)
+    assert (data['spaces']['occupied'], data['spaces']['available']) == (1, 3)
+
+
+def test_snapshot_revalidates_until_an_event_is_logged(app):
+    client = app.test_client()
+    first = client.get('/api/dashboard/snapshot', headers=auth_header())
+    etag = first.headers['ETag']
+
+    again = client.get('/api/dashboard/snapshot', headers={**auth_header(), 'If-None-Match': etag})
+    assert again.status_code == 304
+
+    with app.app_context():
+        seed_tickets('E', 1)
+    # Without an event the cached snapshot is still served
+    assert client.get('/api/dashboard/snapshot', headers={**auth_header(), 'If-None-Match': etag}).status_code == 304
+
+    with app.app_context():
+        log_event_elsewhere()
+    changed = client.get('/api/dashboard/snapshot', headers={**auth_header(), 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['data']['overview']['active_sessions'] == 1
+
+
+def test_session_durations_are_measured_in_utc(app):
+    with app.app_context():
+        # EntryTime is stored in UTC, as the model's default does
+        db.session.add(ParkingTickets(TicketNumber='U000001', VehicleId='1', Status='active',
+                                      EntryTime=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+
+    response = app.test_client().get('/api/dashboard/snapshot', headers=auth_header())
+
+    session, = response.get_json()['data']['active_sessions']
+    assert abs(session['duration'] - 3600) < 60
@@ -0,0 +1,101 @@
+import os
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+from parking_gateout_app.active_index import reload_active_index
+from parking_gateout_app.app import limiter
+from parking_gateout_app.bench_exit import create_bench_app
+from parking_gateout_app.models import db, AspNetUsers, ParkingOccupancy, ParkingSpaces, ParkingTickets
+from parking_gateout_app.services import ParkingService
+from parking_gateout_app.space_counters import occupancy_counts, seed_occupancy
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret')
+    app = create_bench_app(os.path.join(tmp_path, 'counters.db'))
+    app.config['RATELIMIT_ENABLED'] = False
+    limiter.init_app(app)
+    with app.app_context():
+        # routes registers some blueprints on the current app when first imported
+        from parking_gateout_app.routes import parking_bp
+        app.register_blueprint(parking_bp, name='parking_api')
+        db.session.add(AspNetUsers(Id='operator', UserName='operator'))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def auth_header():
+    return {'Authorization': 'Bearer ' + jwt.encode({'user_id': 'operator'}, 'test-secret', algorithm='HS256')}
+
+
+def park(count):
+    """Occupy `count` spaces with active tickets; returns the ticket numbers"""
+    spaces = [ParkingSpaces(SpaceNumber=f'A{i}', Level='1', Section='A', VehicleType='MOBIL',
+                            IsOccupied=True, Status='available') for i in range(count)]
+    db.session.add_all(spaces)
+    db.session.flush()
+    entry_time = datetime.now() - timedelta(hours=2)
+    tickets = [ParkingTickets(TicketNumber=f'S{i:06d}', VehicleId='1', SpaceId=space.Id,
+                              EntryTime=entry_time, Status='active') for i, space in enumerate(spaces)]
+    db.session.add_all(tickets)
+    db.session.commit()
+    reload_active_index()
+    return [ticket.TicketNumber for ticket in tickets]
+
+
+@pytest.mark.parametrize('fast', [True, False], ids=['fast', 'legacy'])
+def test_service_exit_frees_the_space(app, fast):
+    with app.app_context():
+        tickets = park(3)
+        assert occupancy_counts()['Occupied'] == 3
+
+        result = ParkingService.process_vehicle_exit(tickets[0], fast=fast)
+
+        assert result['success'], result['message']
+        counts = occupancy_counts()
+        assert (counts['Occupied'], counts['Available']) == (2, 1)
+        assert ParkingSpaces.query.filter_by(IsOccupied=True).count() == 2
+
+
+def test_parking_session_exit_frees_the_space(app):
+    with app.app_context():
+        tickets = park(2)
+
+    response = app.test_client().put(
+        '/api/parking-sessions/exit', json={'ticketNumber': tickets[1]}, headers=auth_header()
+    )
+
+    assert response.status_code == 200, response.get_json()
+    with app.app_context():
+        assert occupancy_counts()['Occupied'] == 1
+
+
+def test_losing_lane_does_not_free_the_space_twice(app):
+    with app.app_context():
+        ticket_number, = park(1)
+        assert ParkingService.process_vehicle_exit(ticket_number, fast=True)['success']
+        assert not ParkingService.process_vehicle_exit(ticket_number, fast=True)['success']
+        counts = occupancy_counts()
+        assert (counts['Occupied'], counts['Available']) == (0, 1)
+
+
+def test_empty_counters_are_seeded_from_the_spaces(app):
+    with app.app_context():
+        park(2)
+        db.session.add(ParkingSpaces(SpaceNumber='B1', Status='maintenance'))
+        db.session.commit()
+        # As on a database that had spaces before the counter table existed
+        ParkingOccupancy.query.delete()
+        db.session.commit()
+        assert occupancy_counts()['Total'] == 0
+
+        assert seed_occupancy()
+        assert not seed_occupancy()
+        counts = occupancy_counts()
+        assert (counts['Total'], counts['Occupied'], counts['Maintenance']) == (3, 2, 1)
@@ -0,0 +1,192 @@
+import math
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from parking_gateout_app.tariff import TariffTable, HOURS_PER_DAY
+
+ENTRY = datetime(2025, 4, 1, 7, 30)
+CASES = 2000
+
+
+def make_rate(vehicle_type, base_duration, base_rate, additional_rate, max_daily_rate, duration_type='hourly'):
+    return SimpleNamespace(
+        VehicleType=vehicle_type,
+        DurationType=duration_type,
+        BaseDuration=base_duration,
+        BaseRate=base_rate,
+        AdditionalRate=additional_rate,
+        MaxDailyRate=max_daily_rate
+    )
+
+
+def random_rate(rng, vehicle_type='MOBIL'):
+    base_rate = rng.choice([0, 1000, 2000, 3000, 5000])
+    cap = rng.choice([None, base_rate, base_rate + 5000, 25000, 100000])
+    return make_rate(vehicle_type, rng.randint(1, 6), base_rate, rng.choice([None, 0, 500, 1000, 2000]), cap)
+
+
+def reference_fee(rate, seconds):
+    """Straightforward hour-by-hour reading of the tariff rules"""
+    hours = max(1, math.ceil(seconds / 3600))
+    additional = float(rate.AdditionalRate or 0)
+    cap = math.inf if rate.MaxDailyRate is None else float(rate.MaxDailyRate)
+    total = 0.0
+    while hours > 0:
+        period = min(hours, HOURS_PER_DAY)
+        fee = float(rate.BaseRate)
+        for hour in range(1, period + 1):
+            if hour > rate.BaseDuration:
+                fee += additional
+        total += min(fee, cap)
+        hours -= period
+    return round(total, 2)
+
+
+def random_seconds(rng):
+    return rng.choice([
+        0,
+        rng.randint(1, 3600),
+        rng.randint(0, 24 * 3600),
+        rng.randint(0, 10 * 24 * 3600),
+        rng.randint(1, 5) * 24 * 3600,
+    ])
+
+
+def test_matches_reference_rules():
+    rng = random.Random(20250401)
+    for _ in range(CASES):
+        rate = random_rate(rng)
+        table = TariffTable.from_rows([rate])
+        seconds = random_seconds(rng)
+        fee = table.quote(ENTRY, ENTRY + timedelta(seconds=seconds), 'mobil')
+        assert fee == reference_fee(rate, seconds), (vars(rate), seconds)
+
+
+def test_fee_never_decreases_with_longer_stay():
+    rng = random.Random(7)
+    for _ in range(CASES // 10):
+        table = TariffTable.from_rows([random_rate(rng)])
+        previous = 0.0
+        for minutes in range(0, 3 * 24 * 60, 17):
+            fee = table.quote(ENTRY, ENTRY + timedelta(minutes=minutes), 'MOBIL')
+            assert fee >= previous
+            previous = fee
+
+
+def test_every_day_is_capped():
+    rng = random.Random(11)
+    for _ in range(CASES):
+        rate = random_rate(rng)
+        if rate.MaxDailyRate is None:
+            continue
+        table = TariffTable.from_rows([rate])
+        seconds = random_seconds(rng)
+        days = max(1, math.ceil(seconds / (24 * 3600)))
+        fee = table.quote(ENTRY, ENTRY + timedelta(seconds=seconds), 'MOBIL')
+        assert fee <= days * float(rate.MaxDailyRate)
+
+
+def test_short_stay_pays_base_rate():
+    table = TariffTable.from_rows([make_rate('MOTOR', 2, 2000, 1000, 10000)])
+    assert table.quote(ENTRY, ENTRY, 'MOTOR') == 2000
+    assert table.quote(ENTRY, ENTRY + timedelta(hours=2), 'MOTOR') == 2000
+    assert table.quote(ENTRY, ENTRY + timedelta(hours=2, seconds=1), 'MOTOR') == 3000
+
+
+def test_multi_day_stay_restarts_tariff_each_day():
+    table = TariffTable.from_rows([make_rate('MOBIL', 1, 5000, 3000, 20000)])
+    # Two full capped days plus one started hour on the third
+    exit_time = ENTRY + timedelta(days=2, minutes=10)
+    assert table.quote(ENTRY, exit_time, 'MOBIL') == 2 * 20000 + 5000
+
+
+def test_member_overrides():
+    rates = [make_rate('MOBIL', 1, 5000, 3000, 20000)]
+    members = [
+        SimpleNamespace(MembershipType='vip', VehicleType='MOBIL', DurationType='monthly', Rate=750000),
+        SimpleNamespace(MembershipType='regular', VehicleType='MOBIL', DurationType='daily', Rate=8000),
+        SimpleNamespace(MembershipType='premium', VehicleType='MOBIL', DurationType='hourly', Rate=2500),
+    ]
+    table = TariffTable.from_rows(rates, members)
+    exit_time = ENTRY + timedelta(days=1, hours=3)
+
+    assert table.quote(ENTRY, exit_time, 'MOBIL', membership_type='VIP') == 0
+    assert table.quote(ENTRY, exit_time, 'MOBIL', membership_type='regular') == 2 * 8000
+    assert table.quote(ENTRY, exit_time, 'MOBIL', membership_type='premium') == 20000 + 3 * 2500
+    assert table.quote(ENTRY, exit_time, 'MOBIL', membership_type='unknown') == 20000 + 5000 + 2 * 3000
+
+
+def test_unconfigured_vehicle_type_uses_default_rates():
+    table = TariffTable.from_rows([], default_rates={'TRUK': 10000}, default_hourly_rate=5000)
+    exit_time = ENTRY + timedelta(hours=2, minutes=1)
+    assert table.quote(ENTRY, exit_time, 'truk') == 30000
+    assert table.quote(ENTRY, exit_time, 'SEPEDA') == 15000
+
+
+def test_batch_matches_single_quotes():
+    rng = random.Random(3)
+    rates = [random_rate(rng, 'MOBIL'), random_rate(rng, 'MOTOR')]
+    table = TariffTable.from_rows(rates, default_rates={'TRUK': 10000})
+    entries, exits, types = [], [], []
+    for _ in range(CASES):
+        entries.append(ENTRY + timedelta(seconds=rng.randint(0, 86400)))
+        exits.append(entries[-1] + timedelta(seconds=random_seconds(rng)))
+        types.append(rng.choice(['MOBIL', 'motor', 'TRUK', 'BUS']))
+
+    fees = table.quote_batch(entries, exits, types)
+    assert list(fees) == [table.quote(e, x, t) for e, x, t in zip(entries, exits, types)]
+
+
+def test_batch_applies_member_overrides_like_single_quotes():
+    rng = random.Random(5)
+    rates = [random_rate(rng, 'MOBIL'), random_rate(rng, 'MOTOR')]
+    members = [
+        SimpleNamespace(MembershipType='vip', VehicleType='MOBIL', DurationType='monthly', Rate=750000),
+        SimpleNamespace(MembershipType='regular', VehicleType='MOBIL', DurationType='daily', Rate=8000),
+        SimpleNamespace(MembershipType='premium', VehicleType='MOTOR', DurationType='hourly', Rate=1500),
+    ]
+    table = TariffTable.from_rows(rates, members)
+    entries, exits, types, memberships = [], [], [], []
+    for _ in range(CASES):
+        entries.append(ENTRY + timedelta(seconds=rng.randint(0, 86400)))
+        exits.append(entries[-1] + timedelta(seconds=random_seconds(rng)))
+        types.append(rng.choice(['MOBIL', 'MOTOR', 'TRUK']))
+        memberships.append(rng.choice([None, '', 'VIP', 'regular', 'premium', 'unknown']))
+
+    fees = table.quote_batch(entries, exits, types, membership_types=memberships)
+    assert list(fees) == [
+        table.quote(e, x, t, membership_type=m) for e, x, t, m in zip(entries, exits, types, memberships)
+    ]
+
+    # A single membership applies to every stay
+    fees = table.quote_batch(entries, exits, types, membership_types='vip')
+    assert list(fees) == [table.quote(e, x, t, membership_type='vip') for e, x, t in zip(entries, exits, types)]
+
+
+def test_member_rates_are_kept_per_duration_type():
+    rates = [make_rate('MOBIL', 1, 5000, 3000, 20000)]
+    members = [
+        SimpleNamespace(MembershipType='vip', VehicleType='MOBIL', DurationType='hourly', Rate=2500),
+        SimpleNamespace(MembershipType='vip', VehicleType='MOBIL', DurationType='monthly', Rate=750000),
+    ]
+    exit_time = ENTRY + timedelta(hours=3)
+    # Row order no longer decides which rate applies
+    for rows in (members, members[::-1]):
+        table = TariffTable.from_rows(rates, rows)
+        assert table.quote(ENTRY, exit_time, 'MOBIL', membership_type='vip') == 3 * 2500
+        assert table.quote(ENTRY, exit_time, 'MOBIL', 'monthly', membership_type='vip') == 0
+        assert list(table.quote_batch([ENTRY] * 2, exit_time, ['MOBIL'] * 2, membership_types='vip')) == [7500] * 2
+
+
+def test_batch_rates_stays_without_entry_time_as_nan():
+    table = TariffTable.from_rows([make_rate('MOBIL', 1, 5000, 3000, 20000)])
+    entries = np.array([ENTRY, None, ENTRY], dtype='datetime64[s]')
+    exits = np.array([ENTRY + timedelta(hours=2), ENTRY, None], dtype='datetime64[s]')
+
+    fees = table.quote_batch(entries, exits, ['MOBIL'] * 3)
+
+    assert fees[0] == 8000
+    assert np.isnan(fees[1:]).all()
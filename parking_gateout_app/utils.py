@@ -1,22 +1,203 @@
-import random
-import string
+import os
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
 import qrcode
 from io import BytesIO
 import base64
 from typing import Optional, Dict, Any, Tuple
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None
+
+# Layout of generated IDs: 41 bits of milliseconds since ID_EPOCH_MS,
+# 10 bits of node ID (5 bits gate, 5 bits worker) and a 12 bit sequence
+ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_ID_BITS = 10
+WORKER_ID_BITS = 5
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Crockford base32, whose ASCII order matches the digit order, so encoded
+# IDs of equal width sort the same way as the numbers
+_BASE32_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ENCODED_ID_LENGTH = 13
+
+
+class SnowflakeGenerator:
+    """
+    Generator for unique, time-ordered 63-bit IDs
+
+    IDs are built from the current time, the node ID and a per-millisecond
+    sequence, so no database round trip is needed and IDs from different
+    nodes never collide. The timestamp never moves backwards: if the system
+    clock does, or the sequence for a millisecond is exhausted, the generator
+    keeps counting on its own clock instead of waiting.
+    """
+
+    def __init__(self, node_id: int):
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"Node ID must be between 0 and {MAX_NODE_ID}")
+        self.node_id = node_id
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        """
+        Generate the next ID
+        
+        Returns:
+            int: A unique ID, larger than every ID this generator returned before
+        """
+        with self._lock:
+            now_ms = int(time.time() * 1000) - ID_EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                self._last_ms += 1
+                self._sequence = 0
+            return (self._last_ms << (NODE_ID_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+
+_generator: Optional[SnowflakeGenerator] = None
+_generator_pid: Optional[int] = None
+_generator_lock = threading.Lock()
+_worker_slot_file = None
+
+
+def _try_lock(handle: Any) -> bool:
+    """Take an exclusive, non-blocking lock on an open file; False if another process holds it"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _claim_worker_slot() -> int:
+    """
+    Claim a worker number that no other process on this host is using
+
+    Each process holds an exclusive lock on one slot file for as long as it
+    runs, so gunicorn workers on the same gate get distinct node IDs. The
+    lock is released by the operating system when the process exits.
+
+    Raises:
+        RuntimeError: If every slot is taken, or the platform has no file
+            locking and NODE_ID is not set
+    """
+    global _worker_slot_file
+    slots = 1 << WORKER_ID_BITS
+    if fcntl is None and msvcrt is None:
+        raise RuntimeError("No file locking available to claim a worker ID; set NODE_ID for every process")
+
+    lock_dir = os.getenv('ID_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'parking_gateout_ids'))
+    os.makedirs(lock_dir, exist_ok=True)
+    for slot in range(slots):
+        handle = open(os.path.join(lock_dir, f'worker-{slot}.lock'), 'a+')
+        if not _try_lock(handle):
+            handle.close()
+            continue
+        _worker_slot_file = handle
+        return slot
+    raise RuntimeError(f"All {slots} worker ID slots are in use")
+
+
+def get_gate_id() -> int:
+    """
+    Gate ID of this server, from GATE_ID
+
+    Returns:
+        int: The gate ID, 0 if GATE_ID is not set
+
+    Raises:
+        ValueError: If GATE_ID does not fit in its 5 bits of the node ID,
+            as two gates would then generate the same IDs
+    """
+    gate_id = int(os.getenv('GATE_ID', '0'))
+    max_gate_id = (1 << (NODE_ID_BITS - WORKER_ID_BITS)) - 1
+    if not 0 <= gate_id <= max_gate_id:
+        raise ValueError(f"GATE_ID must be between 0 and {max_gate_id}, got {gate_id}")
+    return gate_id
+
+
+def get_node_id() -> int:
+    """
+    Node ID of this process
+
+    NODE_ID sets it explicitly. Otherwise it is built from GATE_ID (one per
+    gate-out server, 0-31) and a worker slot claimed on this host.
+
+    Returns:
+        int: The node ID
+    """
+    node_id = os.getenv('NODE_ID')
+    if node_id is not None:
+        return int(node_id)
+    return (get_gate_id() << WORKER_ID_BITS) | _claim_worker_slot()
+
+
+def generate_id() -> int:
+    """
+    Generate a unique, time-ordered ID for this process
+
+    The generator is created on first use in every process, so workers
+    forked from the same parent do not share a node ID.
+
+    Returns:
+        int: A unique ID
+    """
+    global _generator, _generator_pid
+    if _generator is None or _generator_pid != os.getpid():
+        with _generator_lock:
+            if _generator is None or _generator_pid != os.getpid():
+                _generator = SnowflakeGenerator(get_node_id())
+                _generator_pid = os.getpid()
+    return _generator.next_id()
+
+
+def encode_id(value: int) -> str:
+    """
+    Encode an ID as fixed-width Crockford base32
+
+    Args:
+        value: The ID to encode
+
+    Returns:
+        str: 13 character string that sorts in ID order
+    """
+    chars = []
+    for _ in range(ENCODED_ID_LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(_BASE32_ALPHABET[index])
+    return ''.join(reversed(chars))
+
 
 def generate_ticket_number() -> str:
     """
     Generate a unique ticket number for new parking tickets
     
     Returns:
-        str: A unique ticket number (e.g., 'TKT-20230415-ABCD')
+        str: A unique, time-ordered ticket number (e.g., 'TKT-01HVB0Z8K2A40')
     """
-    date_part = datetime.now().strftime('%Y%m%d')
-    random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-    return f"TKT-{date_part}-{random_part}"
+    return f"TKT-{encode_id(generate_id())}"
 
 
 def generate_qr_code(data: str) -> str:
@@ -97,6 +278,29 @@ def validate_license_plate(plate_number: str) -> bool:
     return has_letter and has_digit
 
 
+# ASCII letters only, like SQL upper() in SQLite
+_ASCII_UPPER = str.maketrans("abcdefghijklmnopqrstuvwxyz", "ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+
+def normalize_plate(plate_number: Optional[str]) -> str:
+    """
+    Normalize a license plate for lookups ("b 1234-xyz" -> "B1234XYZ")
+
+    Must give the same result as models.normalized_plate, the indexed SQL
+    form, so only spaces and dashes are removed and only ASCII letters are
+    upper-cased.
+
+    Args:
+        plate_number: The license plate as entered or recognized
+
+    Returns:
+        str: The plate in upper case without spaces or dashes
+    """
+    if not plate_number:
+        return ""
+    return plate_number.replace(" ", "").replace("-", "").translate(_ASCII_UPPER)
+
+
 def parse_datetime(date_str: Optional[str], format_str: str = "%Y-%m-%d %H:%M:%S") -> Optional[datetime]:
     """
     Parse a string into a datetime object
@@ -184,14 +388,12 @@ def sanitize_input(text: str) -> str:
 
 def generate_transaction_id() -> str:
     """
-    Generate a unique transaction ID
+    Generate a unique transaction number
     
     Returns:
-        str: A unique transaction ID
+        str: A unique, time-ordered transaction number (e.g., 'TRX-01HVB0Z8K2A41')
     """
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"TRX-{timestamp}-{random_part}"
+    return f"TRX-{encode_id(generate_id())}"
 
 
 def calculate_overstay_fee(exit_time: datetime, expected_exit_time: datetime, hourly_rate: float) -> float:
@@ -13,6 +13,7 @@ setup(
         "psycopg2-binary==2.9.9",
         "python-dotenv==1.0.0",
         "pyjwt==2.8.0",
-        "werkzeug==2.3.7"
+        "werkzeug==2.3.7",
+        "numpy==1.26.4"
     ],
 ) 
\ No newline at end of file